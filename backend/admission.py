@@ -0,0 +1,300 @@
+"""
+IBM Job Admission Control
+
+Limits how many IBM Runtime jobs this worker has in flight, so a burst of
+backend=ibm requests queues here instead of tripping the provider's rate
+limits.
+
+Algorithm:
+1. Every job (QRNG draws, protocol circuits) asks for a slot under its
+   token's key (a hash, tokens are never stored). A slot is free while the
+   worker runs fewer than max_jobs jobs and the token fewer than
+   max_jobs_per_token
+2. Free slots go round-robin across tokens with waiting jobs, oldest job
+   first within a token, so one user's burst cannot starve the others
+3. A job waiting longer than queue_timeout raises AdmissionTimeout (503)
+4. Transient failures (HTTP 429/502/503/504 from the runtime API,
+   connection errors and timeouts) release the slot, back off for a random
+   time in [0, min(backoff_max, backoff_base * 2^attempt)] (full jitter)
+   and queue again, up to max_retries times
+5. stats() reports queue depth, running jobs, wait times and retry counts
+   (also /api/ibm/admission, and qkd_stage_duration_seconds{stage=
+   "admission_wait"} when metrics are enabled)
+
+Limits apply per gunicorn worker process: with W workers the host submits
+at most W x QKD_IBM_MAX_JOBS jobs at once.
+"""
+
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from metrics import observe, inc
+from job_multiplexer import wait
+
+try:
+    from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+    TRANSIENT_ERRORS = (ConnectionError, TimeoutError, RequestsConnectionError, RequestsTimeout)
+except ImportError:
+    TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+
+# HTTP statuses of rate limiting and temporary provider outages
+RETRYABLE_STATUS = frozenset({429, 502, 503, 504})
+
+
+class AdmissionTimeout(RuntimeError):
+    """A job waited longer than the queue timeout for a slot."""
+
+
+def _env_number(name, default, cast=int):
+    try:
+        return cast(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def token_key(api_token):
+    """Stable, non-reversible key for a token ("anonymous" for None)."""
+    if not api_token:
+        return "anonymous"
+    return hashlib.sha256(api_token.encode("utf-8")).hexdigest()[:12]
+
+
+def _status_code(exc):
+    # RequestsApiError carries status_code; requests.HTTPError its response
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code
+
+
+def is_retryable(exc):
+    """
+    True for rate limiting and transient transport errors.
+
+    The runtime client wraps API errors (RequestsApiError with status_code)
+    in its own exceptions, so the whole cause/context chain is checked.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, TRANSIENT_ERRORS) or _status_code(exc) in RETRYABLE_STATUS:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class _Ticket:
+    __slots__ = ("key", "granted")
+
+    def __init__(self, key):
+        self.key = key
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Per-token and global concurrency caps with a fair queue and retries.
+
+    Args:
+        max_jobs (int): Jobs in flight across all tokens
+        max_jobs_per_token (int): Jobs in flight per token
+        max_retries (int): Retries of a transient failure
+        backoff_base (float): First backoff cap (s), doubled per retry
+        backoff_max (float): Largest backoff cap (s)
+        queue_timeout (float): Longest wait for a slot (s)
+        rng (random.Random, optional): Jitter source
+        sleep (callable, optional): Backoff sleep (time.sleep)
+    """
+
+    def __init__(self, max_jobs=8, max_jobs_per_token=2, max_retries=3, backoff_base=1.0,
+                 backoff_max=30.0, queue_timeout=300.0, rng=None, sleep=time.sleep):
+        self.max_jobs = max(1, max_jobs)
+        self.max_jobs_per_token = max(1, max_jobs_per_token)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self._rng = rng or random.Random()
+        self._sleep = sleep
+        self._cond = threading.Condition()
+        # key -> waiting tickets; key order is the round-robin order
+        self._waiting = OrderedDict()
+        self._running = {}
+        self._total_running = 0
+        self._stats = {"admitted": 0, "retries": 0, "failed": 0, "timeouts": 0,
+                       "wait_s_total": 0.0, "wait_s_max": 0.0}
+
+    # ---------------- slots ----------------
+    def _dispatch(self):
+        # Caller holds the lock. Grants free slots round-robin across keys.
+        granted = False
+        while self._total_running < self.max_jobs:
+            for key in self._waiting:
+                if self._running.get(key, 0) < self.max_jobs_per_token:
+                    break
+            else:
+                break
+            queue = self._waiting[key]
+            ticket = queue.popleft()
+            if queue:
+                self._waiting.move_to_end(key)
+            else:
+                del self._waiting[key]
+            ticket.granted = True
+            self._running[key] = self._running.get(key, 0) + 1
+            self._total_running += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, key):
+        """
+        Wait for a slot for `key`.
+
+        Returns:
+            float: Seconds waited
+
+        Raises:
+            AdmissionTimeout: If no slot was free within queue_timeout
+        """
+        ticket = _Ticket(key)
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        with self._cond:
+            self._waiting.setdefault(key, deque()).append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue = self._waiting[key]
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._waiting[key]
+                    self._stats["timeouts"] += 1
+                    raise AdmissionTimeout(
+                        f"IBM job queue is full: no slot within {self.queue_timeout:.0f} s, retry later")
+                self._cond.wait(remaining)
+            waited = time.monotonic() - start
+            self._stats["admitted"] += 1
+            self._stats["wait_s_total"] += waited
+            self._stats["wait_s_max"] = max(self._stats["wait_s_max"], waited)
+        observe("qkd_stage_duration_seconds", waited, stage="admission_wait")
+        return waited
+
+    def release(self, key):
+        """Free the slot taken by acquire(key)."""
+        with self._cond:
+            self._running[key] -= 1
+            if not self._running[key]:
+                del self._running[key]
+            self._total_running -= 1
+            self._dispatch()
+
+    # ---------------- jobs ----------------
+    def backoff(self, attempt):
+        """Full-jitter delay before retry `attempt` (0-based)."""
+        return self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def submit(self, key, call):
+        """
+        Run `call()` (submit a job and wait for its result) in a slot.
+
+        Returns:
+            Whatever call() returns
+
+        Raises:
+            AdmissionTimeout, or call()'s exception if it is not transient or
+            retries are exhausted
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(key)
+            try:
+                return call()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    with self._cond:
+                        self._stats["failed"] += 1
+                    raise
+                with self._cond:
+                    self._stats["retries"] += 1
+                inc("qkd_events_total", event="admission_retry")
+                delay = self.backoff(attempt)
+            finally:
+                self.release(key)
+            self._sleep(delay)
+
+    def stats(self):
+        """
+        Returns:
+            dict: running, queued (queue depth), tokens with jobs queued or
+                  running, admitted/retries/failed/timeouts totals, wait times
+                  (s) and the configured limits
+        """
+        with self._cond:
+            s = dict(self._stats)
+            queued = sum(len(q) for q in self._waiting.values())
+            tokens = len(set(self._waiting) | set(self._running))
+            running = self._total_running
+        admitted = s["admitted"]
+        return {
+            "running": running,
+            "queued": queued,
+            "tokens": tokens,
+            "admitted": admitted,
+            "retries": s["retries"],
+            "failed": s["failed"],
+            "timeouts": s["timeouts"],
+            "wait_s_mean": s["wait_s_total"] / admitted if admitted else 0.0,
+            "wait_s_max": s["wait_s_max"],
+            "limits": {"max_jobs": self.max_jobs, "max_jobs_per_token": self.max_jobs_per_token,
+                       "max_retries": self.max_retries, "queue_timeout_s": self.queue_timeout},
+        }
+
+
+class AdmittedSampler:
+    """
+    Sampler wrapper: each run() waits for a slot, then submits the job and
+    waits for its result (polled by job_multiplexer) under the controller's
+    retry policy. Everything else (options, ...) is the wrapped sampler's.
+    """
+
+    def __init__(self, sampler, api_token, admission=None):
+        self._sampler = sampler
+        self._key = token_key(api_token)
+        self._admission = admission or controller
+
+    def __getattr__(self, name):
+        return getattr(self._sampler, name)
+
+    def run(self, pubs, shots=None):
+        pubs = list(pubs)
+        result = self._admission.submit(self._key, lambda: wait(self._sampler.run(pubs, shots=shots)))
+        return _CompletedJob(result)
+
+
+class _CompletedJob:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+# Worker-wide controller (QKD_IBM_* environment variables)
+controller = AdmissionController(
+    max_jobs=_env_number("QKD_IBM_MAX_JOBS", 8),
+    max_jobs_per_token=_env_number("QKD_IBM_MAX_JOBS_PER_TOKEN", 2),
+    max_retries=_env_number("QKD_IBM_MAX_RETRIES", 3),
+    backoff_base=_env_number("QKD_IBM_BACKOFF_BASE", 1.0, float),
+    backoff_max=_env_number("QKD_IBM_BACKOFF_MAX", 30.0, float),
+    queue_timeout=_env_number("QKD_IBM_QUEUE_TIMEOUT", 300.0, float),
+)
+
+
+def stats():
+    """Statistics of the worker-wide controller."""
+    return controller.stats()
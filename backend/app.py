@@ -11,8 +11,10 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
+import base64
+import json
 import time
-from flask import Flask, jsonify, request, session, render_template, send_from_directory
+from flask import Flask, Response, g, jsonify, request, session, render_template, send_from_directory, stream_with_context
 from dotenv import load_dotenv
 
 # Robust imports that work in both deployment scenarios
@@ -20,13 +22,39 @@ from dotenv import load_dotenv
 # Scenario 2: Running from backend directory or when backend/ is at root (experiments/)
 try:
     from experiments import exp1, exp2, exp3, exp4
-    from backend_config import get_backend_service, validate_ibm_token
+    from backend_config import get_backend_service, validate_ibm_token, normalize_noise_profile
     from qkd_cli_core import QKDCLI
+    from keyrate_model import normalize_query, keyrate_payload
+    import multiuser_engine
+    from network_routing import TrustedNodeNetwork
+    import metrics
+    import profiling
+    import batch_runner
+    import response_encoding
+    import admission
+    import job_multiplexer
+    import experiment_tasks
+    import key_pool
+    import otp_stream
+    import distillation
 except ImportError:
     # Fallback: direct imports when backend/ is at root or we're in backend directory
     from experiments import exp1, exp2, exp3, exp4
-    from backend_config import get_backend_service, validate_ibm_token
+    from backend_config import get_backend_service, validate_ibm_token, normalize_noise_profile
     from qkd_cli_core import QKDCLI
+    from keyrate_model import normalize_query, keyrate_payload
+    import multiuser_engine
+    from network_routing import TrustedNodeNetwork
+    import metrics
+    import profiling
+    import batch_runner
+    import response_encoding
+    import admission
+    import job_multiplexer
+    import experiment_tasks
+    import key_pool
+    import otp_stream
+    import distillation
 
 # Load environment variables from .env file
 load_dotenv()
@@ -49,6 +77,112 @@ last_exp4_result = {}
 experiment_states = {}
 last_circuit = {}
 cli_instance = QKDCLI()
+# Shared by request threads (internally locked); one copy per worker process
+trusted_network = TrustedNodeNetwork()
+
+# ---- Request timing (only when metrics are enabled) ----
+if metrics.ENABLED:
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            metrics.observe("qkd_http_request_duration_seconds", time.perf_counter() - start,
+                            endpoint=request.endpoint or "unknown", status=response.status_code)
+        return response
+
+# ---- Response compression (gzip, or brotli when installed) ----
+@app.after_request
+def _compress(response):
+    return response_encoding.compress_response(response, request.accept_encodings)
+
+def shaped_json(result):
+    """jsonify an experiment result, honoring fields=, bits=, counts_top= and steps="""
+    try:
+        options = response_encoding.options_from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(response_encoding.shape_result(result, **options))
+
+def run_experiment(name, run, backend_type, api_token, on_result=None):
+    """Run an experiment now, or for IBM hardware in the background (202 + task id)
+
+    A hardware run waits in the provider's queue for minutes or hours; it must
+    not hold a request thread that long. Poll GET /api/tasks/<task_id>.
+    """
+    def call():
+        result = run()
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    if backend_type == 'ibm' and api_token:
+        task_id = experiment_tasks.submit(admission.token_key(api_token), name, call)
+        return jsonify({"task_id": task_id, "status": "queued",
+                        "status_url": f"/api/tasks/{task_id}"}), 202
+    return shaped_json(call())
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of stage and request timings"""
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled (set QKD_METRICS=1)"}), 404
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# ---- Opt-in request profiling (hooks exist only when configured) ----
+if profiling.ENABLED:
+    @app.before_request
+    def _start_profile():
+        if profiling.should_profile(request):
+            g.profile = profiling.start()
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        if response.is_streamed and not response.direct_passthrough:
+            # The work of a streamed view happens while its body is iterated
+            report_id = profiling.wrap_stream(profile, response, request.endpoint, request.method)
+        else:
+            report_id = profiling.finish(profile, request.endpoint, request.method, response.status_code)
+        response.headers["X-Profile-Id"] = report_id
+        return response
+
+    @app.teardown_request
+    def _abort_profile(exc):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profiling.finish(profile, request.endpoint, request.method, 500)
+
+def profiling_forbidden():
+    if not profiling.PROFILE_TOKEN:
+        return jsonify({"error": "Set QKD_PROFILE_TOKEN to list or download profiles"}), 403
+    return jsonify({"error": "Forbidden"}), 403
+
+@app.route("/debug/profiles")
+def list_profiles():
+    """List stored request profiles (requires the profiling token)"""
+    if not profiling.ENABLED:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    if not profiling.is_authorized(request):
+        return profiling_forbidden()
+    return jsonify({"profiles": profiling.list_reports()})
+
+@app.route("/debug/profiles/<report_id>/<kind>")
+def download_profile(report_id, kind):
+    """Download a stored profile as pstats or collapsed stacks"""
+    if not profiling.ENABLED:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    if not profiling.is_authorized(request):
+        return profiling_forbidden()
+    filename = profiling.report_filename(report_id, kind)
+    if filename is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_from_directory(profiling.PROFILE_DIR, filename, as_attachment=True)
 
 # ---- Serve index.html at root ----
 @app.route("/")
@@ -83,19 +217,28 @@ def exp1_route():
     if message is None:
         # Run experiment, store result (no message yet)
         backend_type = data.get('backend', 'local')
+        try:
+            noise_profile = normalize_noise_profile(data.get('noise'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         # Get API token from session if using IBM backend
         api_token = session.get('ibm_api_token') if backend_type == 'ibm' else None
+        def store(result):
+            global last_exp1_result
+            last_exp1_result = result
+            key_pool.deposit_result(result)
         # Use the actual exp1 experiment
-        result = exp1.run_exp1(backend_type=backend_type, api_token=api_token)
-        last_exp1_result = result
-        return jsonify(result)
+        return run_experiment(
+            "exp1",
+            lambda: exp1.run_exp1(backend_type=backend_type, api_token=api_token, noise_profile=noise_profile),
+            backend_type, api_token, store)
     else:
         # Use previous key to encrypt/decrypt
         if not last_exp1_result:
             return jsonify({"error": "Run the experiment first!"}), 400
         # If you have a separate encryption function in exp1, use it here
         # Otherwise, just return the last result
-        return jsonify(last_exp1_result)
+        return shaped_json(last_exp1_result)
 
 @app.route("/run/exp2", methods=["GET", "POST"])
 def exp2_route():
@@ -109,34 +252,108 @@ def exp2_route():
         
     if message is None:
         backend_type = data.get('backend', 'local')
+        try:
+            noise_profile = normalize_noise_profile(data.get('noise'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         # Get API token from session if using IBM backend
         api_token = session.get('ibm_api_token') if backend_type == 'ibm' else None
-        result = exp2.run_exp2(backend_type=backend_type, api_token=api_token)
-        last_exp2_result = result
-        return jsonify(result)
+        def store(result):
+            global last_exp2_result
+            last_exp2_result = result
+            key_pool.deposit_result(result)
+        return run_experiment(
+            "exp2",
+            lambda: exp2.run_exp2(backend_type=backend_type, api_token=api_token, noise_profile=noise_profile),
+            backend_type, api_token, store)
     else:
         if not last_exp2_result:
             return jsonify({"error": "Run the experiment first!"}), 400
-        result = exp2.encrypt_with_existing_key(last_exp2_result, message)
-        return jsonify(result)
+        if last_exp2_result.get("final_secret_key"):
+            return jsonify(exp2.encrypt_with_existing_key(last_exp2_result, message))
+        # The distilled key went into the key pool (or none was distilled):
+        # one-time pad with a pool key
+        data = message.encode('utf-8')
+        try:
+            key = key_pool.get_pool(key_pool.MASTER_SAE_ID, key_pool.SLAVE_SAE_ID).take(len(data))
+        except (KeyError, ValueError, key_pool.KeyPoolEmpty) as e:
+            return jsonify({"error": str(e).strip("'")}), 400
+        encrypted = bytes(b ^ k for b, k in zip(data, key["key"]))
+        return jsonify({
+            "original_message": message,
+            "encrypted_message_hex": encrypted.hex(),
+            "decrypted_message": bytes(b ^ k for b, k in zip(encrypted, key["key"])).decode('utf-8'),
+            "key_ID": key["key_ID"]
+        })
 
 @app.route("/run/exp3", methods=["POST"])
 def exp3_route():
     data = request.get_json()
     backend_type = data.get('backend', 'local') if data else 'local'
+    try:
+        noise_profile = normalize_noise_profile(data.get('noise') if data else None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     # Get API token from session if using IBM backend
     api_token = session.get('ibm_api_token') if backend_type == 'ibm' else None
-    result = exp3.run_exp3(backend_type=backend_type, api_token=api_token)
-    return jsonify(result)
+    return run_experiment(
+        "exp3",
+        lambda: exp3.run_exp3(backend_type=backend_type, api_token=api_token, noise_profile=noise_profile),
+        backend_type, api_token)
 
 @app.route("/run/exp4", methods=["POST"])
 def exp4_route():
     data = request.get_json()
     backend_type = data.get('backend', 'local') if data else 'local'
+    try:
+        noise_profile = normalize_noise_profile(data.get('noise') if data else None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     # Get API token from session if using IBM backend
     api_token = session.get('ibm_api_token') if backend_type == 'ibm' else None
-    result = exp4.run_exp4(backend_type=backend_type, api_token=api_token)
-    return jsonify(result)
+    return run_experiment(
+        "exp4",
+        lambda: exp4.run_exp4(backend_type=backend_type, api_token=api_token, noise_profile=noise_profile),
+        backend_type, api_token)
+
+@app.route("/api/tasks/<task_id>", methods=["GET"])
+def task_status(task_id):
+    """Status of a background IBM experiment, with its result once done"""
+    task = experiment_tasks.get(task_id, admission.token_key(session.get('ibm_api_token')))
+    if task is None:
+        return jsonify({"error": "Unknown task"}), 404
+    if task["status"] == "done":
+        try:
+            options = response_encoding.options_from_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        task["result"] = response_encoding.shape_result(task["result"], **options)
+    return jsonify(task)
+
+@app.route("/run/batch", methods=["POST"])
+def batch_route():
+    """Run many experiment specs in one request, streamed back as NDJSON"""
+    data = request.get_json(silent=True) or {}
+    try:
+        specs = batch_runner.normalize_specs(data.get("runs"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Read the session now; the stream body runs after the request context is gone
+    api_token = session.get('ibm_api_token') if any(s["backend"] == "ibm" for s in specs) else None
+    include_counts = bool(data.get("include_counts", True))
+    try:
+        options = response_encoding.options_from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        for result in batch_runner.run_batch(specs, api_token=api_token, include_counts=include_counts):
+            if "done" not in result:
+                key_pool.deposit_result(result)
+                result = response_encoding.shape_result(result, **options)
+            yield json.dumps(result) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
 # Removed placeholder route - use specific exp1/exp2/exp3/exp4 routes instead
 
 @app.route("/circuit")
@@ -230,6 +447,139 @@ def token_status():
             })
     return jsonify({"has_token": False, "valid": False})
 
+@app.route("/api/ibm/admission", methods=["GET"])
+def admission_status():
+    """IBM job admission (queue depth, running jobs, wait times, retries), job polling and background experiments"""
+    return jsonify({**admission.stats(), "jobs": job_multiplexer.stats(), "tasks": experiment_tasks.stats()})
+
+@app.errorhandler(admission.AdmissionTimeout)
+@app.errorhandler(experiment_tasks.QueueFull)
+def admission_timeout(e):
+    response = jsonify({"error": str(e)})
+    response.headers["Retry-After"] = "30"
+    return response, 503
+
+# ---- Key delivery (ETSI GS QKD 014 style) ----
+# The calling SAE is named by the X-SAE-ID header (ETSI uses the TLS client
+# certificate); errors use the ETSI {"message": ...} body
+def _etsi_error(message, status):
+    return jsonify({"message": message}), status
+
+def _encode_keys(keys):
+    return jsonify({"keys": [{"key_ID": k["key_ID"], "key": base64.b64encode(k["key"]).decode("ascii")}
+                             for k in keys]})
+
+@app.route("/api/v1/keys/<slave_sae_id>/status", methods=["GET"])
+def key_status(slave_sae_id):
+    """Stored keys, limits and throughput of the pool shared with slave_sae_id"""
+    master = request.headers.get("X-SAE-ID", key_pool.MASTER_SAE_ID)
+    try:
+        return jsonify(key_pool.get_pool(master, slave_sae_id).status())
+    except KeyError as e:
+        return _etsi_error(e.args[0], 404)
+
+@app.route("/api/v1/keys/<slave_sae_id>/enc_keys", methods=["GET", "POST"])
+def enc_keys(slave_sae_id):
+    """New keys for the master SAE: number= and size= (bits), or the same as a JSON body"""
+    master = request.headers.get("X-SAE-ID", key_pool.MASTER_SAE_ID)
+    params = (request.get_json(silent=True) or {}) if request.method == "POST" else request.args
+    try:
+        number = int(params.get("number", 1))
+        size = int(params.get("size", key_pool.KEY_SIZE))
+        keys = key_pool.get_pool(master, slave_sae_id).enc_keys(number, size)
+    except (TypeError, ValueError) as e:
+        return _etsi_error(str(e), 400)
+    except KeyError as e:
+        return _etsi_error(e.args[0], 404)
+    except key_pool.KeyPoolEmpty as e:
+        return _etsi_error(str(e), 503)
+    return _encode_keys(keys)
+
+@app.route("/api/v1/keys/<master_sae_id>/dec_keys", methods=["GET", "POST"])
+def dec_keys(master_sae_id):
+    """Keys issued to the master SAE, by key_ID= or {"key_IDs": [{"key_ID": ...}]}"""
+    slave = request.headers.get("X-SAE-ID", key_pool.SLAVE_SAE_ID)
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        try:
+            key_ids = [k["key_ID"] for k in data.get("key_IDs", [])]
+        except (TypeError, KeyError):
+            return _etsi_error("key_IDs must be a list of {\"key_ID\": ...} objects", 400)
+    else:
+        key_ids = request.args.getlist("key_ID")
+    if not key_ids:
+        return _etsi_error("no key_ID given", 400)
+    try:
+        keys = key_pool.get_pool(master_sae_id, slave).dec_keys(key_ids)
+    except KeyError as e:
+        return _etsi_error(e.args[0], 404)
+    return _encode_keys(keys)
+
+def _otp_response(key, key_id):
+    """Stream the request body XORed with `key` (constant memory)"""
+    chunks = otp_stream.read_chunks(request.stream)
+    body = stream_with_context(otp_stream.xor_stream(chunks, key))
+    response = Response(body, mimetype="application/octet-stream")
+    response.headers["X-Key-ID"] = key_id
+    return response
+
+@app.route("/api/v1/otp/<slave_sae_id>/encrypt", methods=["POST"])
+def otp_encrypt(slave_sae_id):
+    """One-time-pad encrypt the raw body with a fresh key; its ID is in X-Key-ID"""
+    master = request.headers.get("X-SAE-ID", key_pool.MASTER_SAE_ID)
+    length = request.content_length
+    if not length:
+        return _etsi_error("Content-Length is required (the key must cover the whole body)", 411)
+    try:
+        key = key_pool.get_pool(master, slave_sae_id).take(length)
+    except KeyError as e:
+        return _etsi_error(e.args[0], 404)
+    except key_pool.KeyPoolEmpty as e:
+        return _etsi_error(str(e), 503)
+    return _otp_response(key["key"], key["key_ID"])
+
+@app.route("/api/v1/otp/<master_sae_id>/decrypt", methods=["POST"])
+def otp_decrypt(master_sae_id):
+    """Decrypt the raw body with the key issued to the master SAE under key_ID="""
+    slave = request.headers.get("X-SAE-ID", key_pool.SLAVE_SAE_ID)
+    key_id = request.args.get("key_ID") or request.headers.get("X-Key-ID")
+    if not key_id:
+        return _etsi_error("no key_ID given", 400)
+    try:
+        key = key_pool.get_pool(master_sae_id, slave).dec_keys([key_id])[0]["key"]
+    except KeyError as e:
+        return _etsi_error(e.args[0], 404)
+    if request.content_length != len(key):
+        return _etsi_error(f"body must be the {len(key)}-byte ciphertext of this key", 400)
+    return _otp_response(key, key_id)
+
+# ---- Continuous key distillation ----
+@app.route("/api/distillation", methods=["GET"])
+def distillation_status():
+    """Per-stage throughput and secure key rate of this worker's pipeline"""
+    return jsonify(distillation.stats() or {"running": False})
+
+@app.route("/api/distillation/start", methods=["POST"])
+def distillation_start():
+    """Start distilling into the default key pool: {"source", "source_params", "block_bits", "max_blocks", ...}"""
+    data = request.get_json(silent=True) or {}
+    pool = key_pool.get_pool(key_pool.MASTER_SAE_ID, key_pool.SLAVE_SAE_ID, create=True)
+    try:
+        source, source_params, options = distillation.request_options(
+            data, operator=distillation.is_operator(request))
+        distillation.start(source, source_params, sink=pool.deposit, **options)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(distillation.stats()), 202
+
+@app.route("/api/distillation/stop", methods=["POST"])
+def distillation_stop():
+    """Stop producing raw blocks; queued blocks are still distilled"""
+    distillation.stop()
+    return jsonify(distillation.stats() or {"running": False})
+
 @app.route("/run/<exp_name>", methods=["POST"])
 def dynamic_exp_route(exp_name):
     if exp_name == "exp1": return exp1_route()
@@ -248,6 +598,97 @@ def cli_command():
         "output": output
     })
 
+@app.route("/api/keyrate", methods=["GET"])
+def keyrate_api():
+    """Key rate vs distance curves for one or more parameter sets"""
+    try:
+        body, etag = keyrate_payload(normalize_query(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    matched = response_encoding.etag_matches(etag, request.if_none_match)
+    if matched:
+        response = Response(status=304)
+        response.set_etag(matched)
+    else:
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+@app.route("/api/multiuser", methods=["POST"])
+def multiuser_api():
+    """Per-receiver metrics for a multi-user trusted-node network"""
+    data = request.get_json() or {}
+    try:
+        distances = data.get("user_distances")
+        if distances is None:
+            distances = multiuser_engine.default_user_distances(
+                data.get("n_users", 3), data.get("total_distance", 500))
+        results = multiuser_engine.simulate_network(
+            distances,
+            link_length=float(data.get("link_length", 100)),
+            session_key_length=int(data.get("session_key_length", 256)),
+            detector_efficiency=float(data.get("detector_efficiency", 90)),
+            dark_count_prob=float(data.get("dark_count_prob", 0.001)),
+            channel_attenuation=float(data.get("channel_attenuation", 0.2)),
+            misalignment_error=float(data.get("misalignment_error", 2)),
+            key_relay_latency=float(data.get("key_relay_latency", 5)),
+        )
+        schedule = None
+        if data.get("distribution_mode"):
+            schedule = multiuser_engine.simulate_schedule(
+                results,
+                distribution_mode=data["distribution_mode"],
+                key_relay_latency=float(data.get("key_relay_latency", 5)),
+                shared_trunk=bool(data.get("shared_trunk", False)),
+            )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "users": multiuser_engine.to_json(results),
+        "summary": multiuser_engine.summarize(results),
+        "schedule": schedule
+    })
+
+@app.route("/api/network", methods=["GET"])
+def network_snapshot():
+    """Current trusted-node topology with cached layout positions"""
+    snapshot = trusted_network.to_dict()
+    snapshot["layout"] = trusted_network.layout()
+    return jsonify(snapshot)
+
+@app.route("/api/network/links", methods=["POST"])
+def network_links():
+    """Create, update or remove links: {"links": [{"a", "b", "key_rate", "qber", "remove"}]}
+
+    The topology is held in memory per server process and is not persisted.
+    """
+    data = request.get_json() or {}
+    try:
+        with trusted_network.lock:
+            for link in data.get("links", []):
+                if link.get("remove"):
+                    trusted_network.remove_link(link["a"], link["b"])
+                else:
+                    trusted_network.set_link(link["a"], link["b"],
+                                             float(link["key_rate"]), float(link.get("qber", 0.0)))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True, "version": trusted_network.version})
+
+@app.route("/api/network/route", methods=["GET"])
+def network_route():
+    """Widest (max bottleneck key rate) route between two nodes"""
+    src, dst = request.args.get("src"), request.args.get("dst")
+    try:
+        route = trusted_network.route(src, dst)
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Invalid route request: {e}"}), 400
+    if route is None:
+        return jsonify({"error": f"{dst} is unreachable from {src}"}), 404
+    return jsonify(route)
+
 @app.route("/web-cli")
 def web_cli():
     return render_template("web_cli.html")
@@ -1,17 +1,38 @@
 # Backend Configuration for QKD Experiments
 import os
 import json
+import threading
+from metrics import instrumented, inc
 from qiskit_ibm_runtime import QiskitRuntimeService
 try:
+    from qiskit_ibm_runtime import fake_provider
     from qiskit_ibm_runtime.fake_provider import FakeBrisbane
 except Exception:
+    fake_provider = None
     FakeBrisbane = None
 try:
     from qiskit_aer import AerSimulator
+    from qiskit_aer.noise import NoiseModel, ReadoutError
     HAS_AER = True
 except ImportError:
     HAS_AER = False
 
+# Noise profiles for local runs: "ideal" or the calibration data of a fake backend
+FAKE_BACKENDS = {
+    "brisbane": "FakeBrisbane",
+    "sherbrooke": "FakeSherbrooke",
+    "kyiv": "FakeKyiv",
+    "torino": "FakeTorino",
+}
+NOISE_PROFILES = ("ideal",) + tuple(FAKE_BACKENDS)
+DEFAULT_NOISE_PROFILE = os.getenv("QKD_NOISE_PROFILE", "ideal")
+
+# Per-process caches: fake backends load their property JSON once, simulators
+# (and their noise models) are built once per profile and then reused
+_cache_lock = threading.Lock()
+_fake_backends = {}
+_local_simulators = {}
+
 # Provide a minimal fallback fake backend class when neither FakeBrisbane nor AerSimulator
 # are available. This avoids import-time failures; runtime behaviour will be limited.
 if FakeBrisbane is None:
@@ -58,6 +79,7 @@ def _get_ibm_token():
     
     return None
 
+@instrumented("validate_token")
 def validate_ibm_token(token):
     """
     Validate an IBM API token by attempting to connect.
@@ -88,6 +110,7 @@ def validate_ibm_token(token):
             error_msg = str(e1) if "ibm_quantum_platform" in str(e1) else str(e2)
             return False, error_msg, None
 
+@instrumented("backend_service")
 def get_backend_service(backend_type="local", api_token=None):
     """
     Get the appropriate backend service based on the backend type.
@@ -133,19 +156,117 @@ def get_backend_service(backend_type="local", api_token=None):
         except Exception as e:
             print(f"IBM backend initialization failed: {e}")
             print("Falling back to local backend")
+            inc("qkd_events_total", event="ibm_fallback")
             return get_local_backend()
     else:
         # Use local simulation
         return get_local_backend()
 
+def normalize_noise_profile(profile=None):
+    """
+    Validate a noise profile name.
+
+    Returns:
+        str: The profile, DEFAULT_NOISE_PROFILE if None
+
+    Raises:
+        ValueError: If the profile is unknown
+    """
+    profile = DEFAULT_NOISE_PROFILE if profile is None else str(profile).strip().lower()
+    if profile not in NOISE_PROFILES:
+        raise ValueError(f"noise must be one of {', '.join(NOISE_PROFILES)}")
+    return profile
+
+
+def get_fake_backend(name="brisbane"):
+    """Get a cached fake backend by name (see FAKE_BACKENDS)."""
+    backend = _fake_backends.get(name)
+    if backend is not None:
+        return backend
+    if fake_provider is None:
+        raise RuntimeError("qiskit-ibm-runtime fake provider is not available")
+    with _cache_lock:
+        if name not in _fake_backends:
+            _fake_backends[name] = getattr(fake_provider, FAKE_BACKENDS[name])()
+        return _fake_backends[name]
+
+
+def build_noise_model(backend):
+    """
+    Readout noise model from a backend's calibration data.
+
+    Model:
+    - Each qubit's measured bit flips with its calibrated readout error
+    - Gate errors are folded into that flip probability: BB84 circuits only
+      have single-qubit gates, and a depolarizing error with the gate's
+      randomized-benchmarking error r (which already includes T1/T2 decay
+      during the gate) commutes with them and flips the measured bit with
+      probability r. Each qubit gets the flips of one x and two h (one sx
+      pulse each on IBM hardware) gates, the most a BB84 qubit sees
+    - Independent flips combine as e + f - 2ef
+
+    Keeping the noise at readout lets Aer sample all shots from one
+    simulation, so noisy runs cost about as much as ideal ones; per-gate
+    errors would force one trajectory per shot (10-30x slower).
+
+    Args:
+        backend: BackendV2 with a calibrated target
+
+    Returns:
+        NoiseModel
+    """
+    target = backend.target
+    # Keep h/x in the simulator's basis so transpiling for it leaves BB84 circuits as they are
+    noise_model = NoiseModel(basis_gates=["id", "x", "h", "sx", "rz", "cx"])
+    for q in range(target.num_qubits):
+        flips = []
+        for gate, count in (("measure", 1), ("x", 1), ("sx", 2)):
+            props = target[gate].get((q,)) if gate in target else None
+            if props is not None and props.error:
+                flips += [props.error] * count
+        e = 0.0
+        for f in flips:
+            e = e + f - 2 * e * f
+        if e > 0:
+            noise_model.add_readout_error(ReadoutError([[1 - e, e], [e, 1 - e]]), [q])
+    return noise_model
+
+
+@instrumented("local_simulator")
+def get_local_simulator(noise_profile=None):
+    """
+    Get a cached AerSimulator for local runs.
+
+    Args:
+        noise_profile (str, optional): "ideal" or a FAKE_BACKENDS name
+
+    Returns:
+        AerSimulator: Ideal, or with the profile's noise model
+    """
+    if not HAS_AER:
+        raise RuntimeError("AerSimulator not available.")
+    profile = normalize_noise_profile(noise_profile)
+    simulator = _local_simulators.get(profile)
+    if simulator is not None:
+        return simulator
+    # Built outside the lock: a noise model takes a moment and profiles are independent
+    if profile == "ideal":
+        simulator = AerSimulator()
+    else:
+        simulator = AerSimulator(noise_model=build_noise_model(get_fake_backend(profile)))
+    with _cache_lock:
+        return _local_simulators.setdefault(profile, simulator)
+
+
+@instrumented("local_backend")
 def get_local_backend():
     """Get local simulation backend"""
     if FakeBrisbane is not None:
-        backend = FakeBrisbane()
+        backend = get_fake_backend("brisbane")
         print(f"Using local backend: {backend.name}")
         return backend
     if HAS_AER:
-        backend = AerSimulator()
+        backend = get_local_simulator("ideal")
         print("Using AerSimulator as local backend")
         return backend
     if _SIMPLE_FAKE_AVAILABLE:
@@ -158,11 +279,11 @@ def get_local_backend():
 def get_aer_simulator():
     """Get Aer simulator backend"""
     if HAS_AER:
-        backend = AerSimulator()
+        backend = get_local_simulator("ideal")
         print("Using Aer simulator backend")
         return backend
     if FakeBrisbane is not None:
-        backend = FakeBrisbane()
+        backend = get_fake_backend("brisbane")
         print("AerSimulator not available, using FakeBrisbane backend")
         return backend
     if _SIMPLE_FAKE_AVAILABLE:
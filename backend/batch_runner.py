@@ -0,0 +1,365 @@
+"""
+Batched Experiment Runner
+
+Runs many exp1-exp4 style BB84 runs in one request, sharing simulator
+construction, transpilation and sampler calls across the whole batch.
+
+Algorithm:
+1. Validate every spec up front (experiment, bit_num, shots, seed, backend,
+   noise)
+2. Draw each run's bits and bases from its own seeded generator and build
+   the same prepare-and-measure circuits as the single-run experiments
+3. Group runs by backend and noise profile; each group is one multi-PUB
+   sampler call (exp3 needs a second call for Eve -> Bob, built from the
+   first results; on ibm both calls share one runtime Session/Batch)
+4. Sift and compute QBER for the whole group at once on padded
+   (runs x max_bits) arrays with a validity mask (sifting.sift)
+5. Cascade and privacy amplification (exp1/exp2) run per key; results are
+   yielded one by one so the route can stream them as NDJSON
+
+Response fields mirror the single-run endpoints (same names and units), so
+the UI can render batch lines with its existing code. Circuit diagrams are
+not drawn for batch runs.
+"""
+
+import time
+from contextlib import nullcontext
+
+import numpy as np
+from qiskit import QuantumCircuit, transpile
+
+from backend_config import get_backend_service, get_local_simulator, normalize_noise_profile
+from cascade_error_correction import cascade_reconcile
+from privacy_amplification import privacy_amplify, secret_key_length
+from sifting import sift
+from sampler_results import measured_bits
+from execution_policy import local_sampler
+from runtime_modes import open_mode, runtime_sampler, mode_name
+from metrics import timed, inc
+
+try:
+    from qiskit_aer import AerSimulator
+    HAS_AER = True
+except ImportError:
+    HAS_AER = False
+try:
+    from qiskit.primitives import BackendSamplerV2
+except ImportError:
+    BackendSamplerV2 = None
+
+EXPERIMENTS = ("exp1", "exp2", "exp3", "exp4")
+BACKENDS = ("local", "ibm")
+DEFAULT_BITS = {"exp1": 20, "exp2": 20, "exp3": 20, "exp4": 30}
+MAX_RUNS = 100
+MAX_BITS = 64
+MAX_SHOTS = 8192
+
+QBER_THRESHOLD = 0.11
+EXP4_CHANNEL_LOSS = 0.15
+EXP4_SIDE_CHANNEL_ERROR = 0.03
+
+
+def normalize_specs(runs):
+    """
+    Validate a list of run specs and fill in defaults.
+
+    Args:
+        runs (list[dict]): Each with experiment and optional bit_num, shots,
+                           seed, backend ("local" | "ibm") and noise (local
+                           noise profile, see backend_config.NOISE_PROFILES)
+
+    Returns:
+        list[dict]: Normalized specs (index, experiment, bit_num, shots, seed, backend, noise)
+
+    Raises:
+        ValueError: On the first invalid spec
+    """
+    if not isinstance(runs, list) or not runs:
+        raise ValueError("runs must be a non-empty list of experiment specs")
+    if len(runs) > MAX_RUNS:
+        raise ValueError(f"At most {MAX_RUNS} runs per batch")
+
+    specs = []
+    for i, raw in enumerate(runs):
+        if not isinstance(raw, dict):
+            raise ValueError(f"run {i}: spec must be an object")
+        experiment = raw.get("experiment")
+        if experiment not in EXPERIMENTS:
+            raise ValueError(f"run {i}: experiment must be one of {', '.join(EXPERIMENTS)}")
+        backend = raw.get("backend", "local")
+        if backend not in BACKENDS:
+            raise ValueError(f"run {i}: backend must be 'local' or 'ibm'")
+        try:
+            bit_num = int(raw.get("bit_num", DEFAULT_BITS[experiment]))
+            shots = int(raw.get("shots", 1024))
+            seed = raw.get("seed")
+            seed = None if seed is None else int(seed)
+        except (TypeError, ValueError):
+            raise ValueError(f"run {i}: bit_num, shots and seed must be integers")
+        if not 1 <= bit_num <= MAX_BITS:
+            raise ValueError(f"run {i}: bit_num must be between 1 and {MAX_BITS}")
+        if not 1 <= shots <= MAX_SHOTS:
+            raise ValueError(f"run {i}: shots must be between 1 and {MAX_SHOTS}")
+        if seed is not None and seed < 0:
+            raise ValueError(f"run {i}: seed must be non-negative")
+        try:
+            noise = None if backend == "ibm" else normalize_noise_profile(raw.get("noise"))
+        except ValueError as e:
+            raise ValueError(f"run {i}: {e}")
+        specs.append({"index": i, "experiment": experiment, "bit_num": bit_num,
+                      "shots": shots, "seed": seed, "backend": backend, "noise": noise})
+    return specs
+
+
+# ---------------- CIRCUITS & SAMPLING ----------------
+def _bb84_circuit(bits, prep_bases, meas_bases):
+    n = len(bits)
+    qc = QuantumCircuit(n, n)
+    for i in range(n):
+        if bits[i] == 1:
+            qc.x(i)
+        if prep_bases[i] == 1:
+            qc.h(i)
+    qc.barrier()
+    for i in range(n):
+        if meas_bases[i] == 1:
+            qc.h(i)
+        qc.measure(i, i)
+    return qc
+
+
+def _open_backend(backend_type, api_token, noise=None):
+    # Samplers are built per call: with that call's execution policy (local)
+    # or in the group's runtime mode (ibm)
+    if backend_type == "local":
+        if not HAS_AER or BackendSamplerV2 is None:
+            raise RuntimeError("AerSimulator not available.")
+        return get_local_simulator(noise)
+    return get_backend_service("ibm", api_token=api_token)
+
+
+def _sample(backend_type, backend, mode, circuits, shots, api_token=None):
+    """
+    One multi-PUB sampler call.
+
+    Returns:
+        tuple: (list[MeasuredBits], one per circuit; simulator metadata, None on ibm)
+    """
+    simulator = None
+    if backend_type == "local":
+        sampler, simulator = local_sampler(BackendSamplerV2, backend, circuits)
+    else:
+        sampler = runtime_sampler(mode, api_token)
+        # Only x/h/measure/barrier, which Aer runs natively; hardware needs ISA circuits
+        with timed("transpile", experiment="batch"):
+            circuits = transpile(circuits, backend)
+    with timed("sampler_run", experiment="batch"):
+        result = sampler.run([(qc, None, s) for qc, s in zip(circuits, shots)]).result()
+    with timed("counts_extraction", experiment="batch"):
+        return [measured_bits(result, i) for i in range(len(circuits))], simulator
+
+
+def _bitstring(bits):
+    return "".join(str(int(b)) for b in bits[::-1])
+
+
+# ---------------- VECTORIZED SIFTING ----------------
+def _sift(runs):
+    """
+    Sift every run of a group at once.
+
+    Each run provides abits, abase, bbase, bbits (int arrays) and optionally
+    a received mask. Arrays are padded to the longest run; padding is
+    excluded through the kernel's received mask.
+
+    Returns:
+        dict: sifting.sift output for the (runs, max_bits) arrays
+    """
+    m = len(runs)
+    width = max(len(r["abits"]) for r in runs)
+    A, AB, BB, B = (np.zeros((m, width), dtype=np.int8) for _ in range(4))
+    valid = np.zeros((m, width), dtype=bool)
+    for row, r in enumerate(runs):
+        n = len(r["abits"])
+        A[row, :n] = r["abits"]
+        AB[row, :n] = r["abase"]
+        BB[row, :n] = r["bbase"]
+        B[row, :n] = r["bbits"]
+        valid[row, :n] = r.get("received", True)
+    return sift(A, AB, B, BB, received=valid)
+
+
+# ---------------- BATCH ----------------
+def _prepare(spec):
+    rng = np.random.default_rng(spec["seed"])
+    n = spec["bit_num"]
+    abits, abase, bbase = (rng.integers(0, 2, n) for _ in range(3))
+    run = {"spec": spec, "rng": rng, "abits": abits, "abase": abase, "bbase": bbase}
+    if spec["experiment"] == "exp3":
+        # Alice -> Eve stage first; Eve -> Bob is built from its outcome
+        run["ebase"] = rng.integers(0, 2, n)
+        run["circuit"] = _bb84_circuit(abits, abase, run["ebase"])
+    else:
+        run["circuit"] = _bb84_circuit(abits, abase, bbase)
+    return run
+
+
+def _measure(measured, include_counts):
+    # measured: (run, MeasuredBits) pairs
+    for r, outcome in measured:
+        exp = r["spec"]["experiment"]
+        if exp == "exp2":
+            # Sample one real outcome, weighted by its frequency
+            r["bbits"] = outcome.sample(r["rng"]).astype(np.int8)
+        else:
+            r["bbits"] = outcome.most_likely().astype(np.int8)
+        if include_counts:
+            r["counts"] = outcome.get_counts()
+        if exp == "exp4":
+            n = r["spec"]["bit_num"]
+            r["received"] = r["rng"].random(n) >= EXP4_CHANNEL_LOSS
+            flips = r["rng"].random(n) < EXP4_SIDE_CHANNEL_ERROR
+            r["bbits"] = r["bbits"] ^ flips.astype(np.int8)
+
+
+def _result(r, sifted_keys, row):
+    spec = r["spec"]
+    exp = spec["experiment"]
+    sift_row = sifted_keys["mask"][row, :spec["bit_num"]]
+    agood = r["abits"][sift_row].tolist()
+    bgood = r["bbits"][sift_row].astype(int).tolist()
+    sifted = len(agood)
+    qber = float(sifted_keys["qber"][row])
+    qber_ci = [float(sifted_keys["qber_low"][row]), float(sifted_keys["qber_high"][row])]
+    fidelity = 1 - qber if sifted else 0.0
+    out = {
+        "index": spec["index"],
+        "experiment": exp,
+        "seed": spec["seed"],
+        "backend_type": spec["backend"],
+        "noise_profile": spec["noise"],
+        "simulator": r["simulator"],
+        "runtime_mode": r["runtime_mode"],
+        "bit_num": spec["bit_num"],
+        "shots": spec["shots"],
+        "Sender_bits": r["abits"].tolist(),
+        "Sender_bases": r["abase"].tolist(),
+        "Receiver_bases": r["bbase"].tolist(),
+        "Receiver_bits": r["bbits"].astype(int).tolist(),
+        "agoodbits": agood,
+        "bgoodbits": bgood,
+        "circuit_diagram_url": None,
+    }
+    if "counts" in r:
+        out["counts"] = r["counts"]
+
+    if exp in ("exp1", "exp2"):
+        with timed("cascade", experiment="batch"):
+            verification = cascade_reconcile(agood, bgood, qber)
+        leaked_bits = verification["leaked_bits"]
+        error_corrected_key = "".join(map(str, verification["bob"] or []))
+        with timed("privacy_amplification", experiment="batch"):
+            out["final_secret_key"] = privacy_amplify(error_corrected_key, qber=qber, leaked_bits=leaked_bits)
+        out["final_secret_key_bits"] = secret_key_length(len(error_corrected_key), qber, leaked_bits)
+        out["key_verified"] = verification["verified"]
+        out["verification_leaked_bits"] = leaked_bits
+        if exp == "exp1":
+            out["error_corrected_key"] = error_corrected_key
+        out.update(fidelity=fidelity * 100, loss=(1 - fidelity) * 100, qber=qber * 100,
+                   qber_ci=[q * 100 for q in qber_ci])
+    elif exp == "exp3":
+        out.update(
+            sifted_key_len=sifted,
+            eve_bases=r["ebase"].tolist(),
+            eve_key=_bitstring(r["ebits"]),
+            bob_key=_bitstring(r["bbits"]),
+            fidelity=fidelity,
+            loss=1 - fidelity,
+            qber=qber,
+            qber_ci=qber_ci,
+            abort_reason=("QBER exceeds 11% — BB84 security bound violated. "
+                          "Secret key cannot be distilled.") if qber > QBER_THRESHOLD else None,
+        )
+        if "counts" in r:
+            out["counts"], out["counts2"] = r["eve_counts"], r["counts"]
+    else:
+        received = r["received"]
+        out["Receiver_bases"] = [b if ok else None for b, ok in zip(out["Receiver_bases"], received)]
+        out["Receiver_bits"] = [b if ok else None for b, ok in zip(out["Receiver_bits"], received)]
+        out.update(
+            fidelity=1 - qber,
+            loss=float(1 - received.mean()),
+            qber=qber * 100,
+            qber_ci=[q * 100 for q in qber_ci],
+            encryption_allowed=qber < QBER_THRESHOLD,
+        )
+        if "counts" in r:
+            out["raw_counts"] = r["counts"]
+    return out
+
+
+def _run_group(backend_type, noise, specs, api_token, include_counts):
+    runs = [_prepare(spec) for spec in specs]
+    backend = _open_backend(backend_type, api_token, noise)
+    # ibm: both stages in one runtime Session/Batch, so Eve -> Bob does not queue again
+    runtime = open_mode(backend) if backend_type == "ibm" else nullcontext()
+    with runtime as mode:
+        measured, simulator = _sample(backend_type, backend, mode, [r["circuit"] for r in runs],
+                                      [r["spec"]["shots"] for r in runs], api_token)
+        for r in runs:
+            r["simulator"] = simulator
+            r["runtime_mode"] = mode_name(mode) if backend_type == "ibm" else None
+
+        stage1 = list(zip(runs, measured))
+        _measure([m for m in stage1 if m[0]["spec"]["experiment"] != "exp3"], include_counts)
+
+        eve = [m for m in stage1 if m[0]["spec"]["experiment"] == "exp3"]
+        if eve:
+            for r, outcome in eve:
+                r["ebits"] = outcome.most_likely().astype(np.int8)
+                if include_counts:
+                    r["eve_counts"] = outcome.get_counts()
+            eve_runs = [r for r, _ in eve]
+            circuits = [_bb84_circuit(r["ebits"], r["ebase"], r["bbase"]) for r in eve_runs]
+            measured2, _ = _sample(backend_type, backend, mode, circuits,
+                                   [r["spec"]["shots"] for r in eve_runs], api_token)
+            _measure(zip(eve_runs, measured2), include_counts)
+
+    with timed("sifting", experiment="batch"):
+        sifted_keys = _sift(runs)
+    for row, r in enumerate(runs):
+        yield _result(r, sifted_keys, row)
+
+
+def run_batch(specs, api_token=None, include_counts=True):
+    """
+    Execute normalized specs, grouped per backend and noise profile.
+
+    Args:
+        specs (list[dict]): Output of normalize_specs
+        api_token (str, optional): IBM token for "ibm" runs
+        include_counts (bool): Include measurement counts in each result
+
+    Yields:
+        dict: One result per run (with "index"), or {"index", "error"} if
+              its group failed; finally {"done": True, ...}
+    """
+    start = time.perf_counter()
+    failed = 0
+    groups = {}
+    for spec in specs:
+        groups.setdefault((spec["backend"], spec["noise"]), []).append(spec)
+    for (backend_type, noise), group in groups.items():
+        inc("qkd_events_total", len(group), event="run", experiment="batch", backend=backend_type)
+        emitted = set()
+        try:
+            for result in _run_group(backend_type, noise, group, api_token, include_counts):
+                emitted.add(result["index"])
+                yield result
+        except Exception as e:
+            for spec in group:
+                if spec["index"] not in emitted:
+                    failed += 1
+                    yield {"index": spec["index"], "experiment": spec["experiment"], "error": str(e)}
+    yield {"done": True, "runs": len(specs), "errors": failed,
+           "elapsed_s": time.perf_counter() - start}
@@ -16,8 +16,65 @@ Algorithm:
 
 import random
 
+from key_verification import verify_reconciliation
 
-def cascade_error_correction(alice_bits, bob_bits, num_rounds=4, initial_block_size=8):
+
+def initial_block_size(qber, smallest=8, largest=64):
+    """
+    First-round block size for an estimated QBER: about one error per block.
+
+    A fixed block of 8 discloses a parity for every 8 bits in the first
+    round alone; at low QBER larger blocks disclose far fewer.
+
+    Args:
+        qber (float): Estimated Quantum Bit Error Rate (0-1)
+        smallest, largest (int): Bounds of the block size (powers of two)
+
+    Returns:
+        int: Block size in bits
+    """
+    size = smallest
+    while size < largest and size * 2 * qber <= 1:
+        size *= 2
+    return size
+
+
+def cascade_reconcile(alice_bits, bob_bits, qber, num_rounds=4):
+    """
+    Cascade followed by hash verification, with every disclosed bit counted.
+
+    On a tag mismatch Cascade runs again with a fresh shuffle, as in
+    key_verification.verify_reconciliation; its parities are counted too.
+
+    Args:
+        alice_bits (list): Alice's sifted key bits
+        bob_bits (list): Bob's sifted key bits
+        qber (float): Estimated QBER (0-1), sets the first block size
+        num_rounds (int): Cascade rounds per run
+
+    Returns:
+        dict:
+            bob          Bob's verified key (list), None if discarded
+            verified     True if the tags matched
+            leaked_bits  parities of every Cascade run plus tag bits
+    """
+    block_size = initial_block_size(qber)
+    parities = 0
+
+    def reconcile(bits):
+        nonlocal parities
+        stats = {}
+        corrected = cascade_error_correction(alice_bits, bits, num_rounds=num_rounds,
+                                             initial_block_size=block_size, stats=stats)
+        parities += stats.get("leaked_bits", 0)
+        return corrected
+
+    check = verify_reconciliation(alice_bits, reconcile(bob_bits), reconcile)
+    return {"bob": check["bob"], "verified": check["verified"],
+            "leaked_bits": parities + check["leaked_bits"]}
+
+
+def cascade_error_correction(alice_bits, bob_bits, num_rounds=4, initial_block_size=8, stats=None):
     """
     Perform Cascade error correction protocol on Bob's bits.
     
@@ -26,6 +83,9 @@ def cascade_error_correction(alice_bits, bob_bits, num_rounds=4, initial_block_s
         bob_bits (list): Bob's sifted key bits (to be corrected)
         num_rounds (int): Number of Cascade rounds (default: 4)
         initial_block_size (int): Initial block size for first round (default: 8)
+        stats (dict, optional): Filled with "leaked_bits" (parities Alice
+            disclosed) and "round_trips" (public-channel exchanges: one per
+            round for the block parities, one per binary search step)
     
     Returns:
         list: Bob's corrected key bits
@@ -43,6 +103,7 @@ def cascade_error_correction(alice_bits, bob_bits, num_rounds=4, initial_block_s
     
     # Create index mapping for shuffling
     indices = list(range(n))
+    counts = {"leaked_bits": 0, "round_trips": 0}
     
     # Track which positions have been corrected (for efficiency)
     # In practice, we'll correct all errors we find
@@ -60,6 +121,7 @@ def cascade_error_correction(alice_bits, bob_bits, num_rounds=4, initial_block_s
             random.shuffle(indices)
         
         # Process blocks
+        counts["round_trips"] += 1
         i = 0
         while i < n:
             # Get current block
@@ -72,21 +134,24 @@ def cascade_error_correction(alice_bits, bob_bits, num_rounds=4, initial_block_s
             # Compute parity for Alice and Bob
             alice_parity = sum(alice[idx] for idx in block_indices) % 2
             bob_parity = sum(bob[idx] for idx in block_indices) % 2
+            counts["leaked_bits"] += 1
             
             # If parities differ, there's an error in this block
             if alice_parity != bob_parity:
                 # Use binary search to locate the error
-                error_idx = _binary_search_error(alice, bob, block_indices)
+                error_idx = _binary_search_error(alice, bob, block_indices, counts)
                 if error_idx is not None:
                     # Flip the erroneous bit
                     bob[error_idx] ^= 1
             
             i = block_end
     
+    if stats is not None:
+        stats.update(counts)
     return bob
 
 
-def _binary_search_error(alice, bob, block_indices):
+def _binary_search_error(alice, bob, block_indices, counts):
     """
     Use binary search to locate the error within a block.
     
@@ -94,6 +159,7 @@ def _binary_search_error(alice, bob, block_indices):
         alice (list): Alice's bits
         bob (list): Bob's bits
         block_indices (list): Indices in the current block
+        counts (dict): Disclosed parities and round trips so far
     
     Returns:
         int or None: Index of the error, or None if not found
@@ -113,10 +179,12 @@ def _binary_search_error(alice, bob, block_indices):
     # Check parity of left half
     left_alice_parity = sum(alice[idx] for idx in left_indices) % 2
     left_bob_parity = sum(bob[idx] for idx in left_indices) % 2
+    counts["leaked_bits"] += 1
+    counts["round_trips"] += 1
     
     # If left half has parity mismatch, error is in left half
     if left_alice_parity != left_bob_parity:
-        return _binary_search_error(alice, bob, left_indices)
+        return _binary_search_error(alice, bob, left_indices, counts)
     else:
         # Error is in right half
-        return _binary_search_error(alice, bob, right_indices)
+        return _binary_search_error(alice, bob, right_indices, counts)
@@ -1,7 +1,11 @@
 # backend/qkd_runner/circuit_simulator.py
 import random
+from itertools import islice
+
 import numpy as np
 from qiskit import QuantumCircuit
+
+from execution_policy import aer_run_options, simulator_metadata
 try:
     from qiskit_aer import AerSimulator
     HAS_AER = True
@@ -33,13 +37,79 @@ if not HAS_AER and FakeBrisbane is None:
 else:
     _SIMPLE_FAKE_SIM = None
 
+MAX_STEPS = 1000
+MISSING_BIT = 255
+
 def text_to_bits(text):
     return [int(b) for c in text for b in bin(ord(c))[2:].zfill(8)]
 
 def random_bases(n):
     return [random.choice(['+', 'x']) for _ in range(n)]
 
-def run_circuit_simulator(message, shots=1024):
+def counts_to_matrix(counts, n):
+    """
+    Turn a counts dict into an outcome matrix.
+
+    Args:
+        counts (dict): bitstring -> frequency (qubit 0 is the rightmost char)
+        n (int): Number of qubits
+
+    Returns:
+        tuple: (bitstrings, (outcomes, n) uint8 matrix with column i = qubit i
+               and MISSING_BIT where a bitstring is too short, int64 weights)
+    """
+    keys = list(counts)
+    outcomes = np.full((len(keys), n), MISSING_BIT, dtype=np.uint8)
+    weights = np.fromiter((counts[k] for k in keys), dtype=np.int64, count=len(keys))
+    if keys:
+        width = min(max(len(k) for k in keys), n)
+        if all(len(k) == len(keys[0]) for k in keys):
+            chars = np.frombuffer("".join(keys).encode("ascii"), dtype=np.uint8).reshape(len(keys), -1)
+            outcomes[:, :width] = (chars[:, ::-1] - ord("0"))[:, :width]
+        else:
+            for row, k in enumerate(keys):
+                m = min(len(k), n)
+                outcomes[row, :m] = [int(b) for b in k[::-1][:m]]
+    return keys, outcomes, weights
+
+
+def iter_steps(keys, outcomes, weights, bits, bases, matched_positions, start=0):
+    """
+    Lazily yield the per-(bitstring, matched qubit) step details, beginning
+    at step index `start` without building the skipped entries.
+
+    Yields:
+        dict: bitstring, freq, qubit, Sender_bit, Receiver_bit, basis, mismatch
+    """
+    m = len(matched_positions)
+    if m == 0:
+        return
+    first_row, first_col = divmod(start, m)
+    for row in range(first_row, len(keys)):
+        bitstring = keys[row]
+        freq = int(weights[row])
+        for i in matched_positions[first_col if row == first_row else 0:]:
+            value = outcomes[row, i]
+            Receiver_bit = None if value == MISSING_BIT else int(value)
+            yield {
+                "bitstring": bitstring,
+                "freq": freq,
+                "qubit": int(i),
+                "Sender_bit": int(bits[i]),
+                "Receiver_bit": Receiver_bit,
+                "basis": bases[i],
+                "mismatch": Receiver_bit is None or Receiver_bit != bits[i]
+            }
+
+def run_circuit_simulator(message, shots=1024, steps_offset=0, steps_limit=MAX_STEPS):
+    """
+    Run the BB84 circuit for a text message.
+
+    Per-qubit error rates and the QBER are computed from the counts with
+    NumPy; the step-by-step trace is paged (steps_offset, steps_limit) and
+    never longer than MAX_STEPS, so cost no longer grows with
+    outcomes x qubits.
+    """
     bits = text_to_bits(message)
     n = len(bits)
     Sender_bases = random_bases(n)
@@ -61,8 +131,10 @@ def run_circuit_simulator(message, shots=1024):
     except Exception:
         qasm_str = ""
 
+    run_options = {}
     if HAS_AER:
         sim = AerSimulator()
+        run_options = aer_run_options(qc)
     else:
         # Fallback to FakeBrisbane if AerSimulator is not available
         if FakeBrisbane is not None:
@@ -71,38 +143,46 @@ def run_circuit_simulator(message, shots=1024):
             sim = _SIMPLE_FAKE_SIM
         else:
             raise RuntimeError("No simulator available: install qiskit-aer or qiskit-ibm-runtime fake provider")
-    job = sim.run(qc, shots=shots)
+    job = sim.run(qc, shots=shots, **run_options)
     result = job.result()
     counts = result.get_counts()
     counts_int = {str(k): int(v) for k, v in counts.items()}
 
-    matched_positions = [i for i in range(n) if Sender_bases[i] == Receiver_bases[i]]
-    total = 0
-    errors = 0
-    step_details = []
-    for bitstring, freq in counts_int.items():
-        Receiver_bits = [int(b) for b in bitstring[::-1]]
-        for i in matched_positions:
-            Sender_bit = bits[i]
-            Receiver_bit = Receiver_bits[i] if i < len(Receiver_bits) else None
-            mismatch = (Receiver_bit is None) or (Receiver_bit != Sender_bit)
-            total += freq
-            if mismatch:
-                errors += freq
-            step_details.append({
-                "bitstring": bitstring,
-                "freq": int(freq),
-                "qubit": i,
-                "Sender_bit": int(Sender_bit),
-                "Receiver_bit": (int(Receiver_bit) if Receiver_bit is not None else None),
-                "basis": Sender_bases[i],
-                "mismatch": bool(mismatch)
-            })
+    matched_positions = np.array([i for i in range(n) if Sender_bases[i] == Receiver_bases[i]], dtype=np.int64)
+    keys, outcomes, weights = counts_to_matrix(counts_int, n)
+    sender = np.array(bits, dtype=np.uint8)
+
+    # (outcomes x matched) mismatch table; a missing bit (MISSING_BIT) always mismatches
+    mismatch = outcomes[:, matched_positions] != sender[matched_positions]
+    qubit_errors = weights @ mismatch
+    qubit_shots = int(weights.sum())
+    total = qubit_shots * len(matched_positions)
+    errors = int(qubit_errors.sum())
     qber = (errors / total * 100) if total > 0 else 0.0
 
+    qubit_stats = [{
+        "qubit": int(i),
+        "basis": Sender_bases[i],
+        "Sender_bit": int(bits[i]),
+        "shots": qubit_shots,
+        "mismatches": int(e),
+        "error_rate": (int(e) / qubit_shots) if qubit_shots else 0.0,
+    } for i, e in zip(matched_positions, qubit_errors)]
+
+    steps_total = len(keys) * len(matched_positions)
+    steps_offset = max(0, int(steps_offset))
+    steps = list(islice(iter_steps(keys, outcomes, weights, bits, Sender_bases, matched_positions,
+                                   start=steps_offset),
+                        max(0, min(int(steps_limit), MAX_STEPS))))
+
     return {
         "qasm": qasm_str,
         "counts": counts_int,
         "qber": round(qber, 2),
-        "steps": step_details
+        "qubit_stats": qubit_stats,
+        "steps": steps,
+        "steps_offset": steps_offset,
+        "steps_total": steps_total,
+        "steps_truncated": steps_offset + len(steps) < steps_total,
+        "simulator": simulator_metadata(run_options) if run_options else None
     }
@@ -0,0 +1,213 @@
+"""
+Decoy-State BB84 Engine (vacuum + weak decoy)
+
+Monte Carlo model of a weak coherent pulse (WCP) BB84 link with three
+intensities: signal (mu), decoy (nu) and vacuum (lambda). Photon numbers are
+drawn from a Poisson distribution per pulse, in fixed-size NumPy chunks, so the
+engine is cheap enough to run at every point of a CLI sweep.
+
+Algorithm:
+1. For each intensity, emit pulses in chunks with n ~ Poisson(intensity)
+2. Each photon survives channel + detector with probability eta; a pulse
+   clicks if at least one photon survives or a dark count fires
+3. Alice/Bob bases are drawn per pulse; only matching bases are kept (sifting)
+4. Clicks from photons err with the misalignment (+ Eve) probability,
+   dark-only clicks err with probability 1/2
+5. Measured gains Q and error rates E feed the two-decoy bounds
+   (Ma, Qi, Zhao, Lo 2005) for Y1 (lower) and e1 (upper); with a zero
+   "vacuum" intensity these reduce to the vacuum + weak decoy bounds
+6. Key rate follows GLLP: R = q * (-Q_mu * f * H(E_mu) + Q1 * (1 - H(e1)))
+"""
+
+import numpy as np
+
+CHUNK_SIZE = 1 << 16
+ERROR_CORRECTION_EFFICIENCY = 1.16
+DARK_ERROR_RATE = 0.5
+SIFT_FACTOR = 0.5
+
+
+def binary_entropy(p):
+    """
+    Binary Shannon entropy H(p), vectorized and safe at 0 and 1.
+
+    Args:
+        p (float or np.ndarray): Probability values
+
+    Returns:
+        np.ndarray: H(p) in bits
+    """
+    p = np.clip(np.asarray(p, dtype=float), 1e-12, 1 - 1e-12)
+    return -p * np.log2(p) - (1 - p) * np.log2(1 - p)
+
+
+def simulate_intensity(intensity, pulses, eta, dark, misalignment, eve_on=False, rng=None):
+    """
+    Simulate one intensity class pulse by pulse, in vectorized chunks.
+
+    Args:
+        intensity (float): Mean photon number per pulse
+        pulses (int): Number of pulses sent at this intensity
+        eta (float): Overall channel * detector transmittance per photon
+        dark (float): Dark count probability per pulse
+        misalignment (float): Optical error probability for photon clicks
+        eve_on (bool): Add intercept-resend disturbance (25% extra error)
+        rng (np.random.Generator, optional): Random generator
+
+    Returns:
+        dict: sifted pulse count, clicks, errors, gain Q and error rate E
+    """
+    rng = rng or np.random.default_rng()
+    photon_error = misalignment
+    if eve_on:
+        photon_error = misalignment * 0.75 + (1 - misalignment) * 0.25
+
+    sifted = 0
+    clicks = 0
+    errors = 0
+    remaining = int(pulses)
+    while remaining > 0:
+        size = min(CHUNK_SIZE, remaining)
+        remaining -= size
+
+        n = rng.poisson(intensity, size)
+        # P(at least one of n photons detected) = 1 - (1 - eta)^n
+        photon_click = rng.random(size) < -np.expm1(n * np.log1p(-eta))
+        dark_click = rng.random(size) < dark
+        basis_match = rng.integers(0, 2, size, dtype=np.uint8) == rng.integers(0, 2, size, dtype=np.uint8)
+
+        click = (photon_click | dark_click) & basis_match
+        error_prob = np.where(photon_click, photon_error, DARK_ERROR_RATE)
+        error = click & (rng.random(size) < error_prob)
+
+        sifted += int(np.count_nonzero(basis_match))
+        clicks += int(np.count_nonzero(click))
+        errors += int(np.count_nonzero(error))
+
+    gain = clicks / sifted if sifted else 0.0
+    qber = errors / clicks if clicks else 0.0
+    return {"sifted": sifted, "clicks": clicks, "errors": errors, "gain": gain, "qber": qber}
+
+
+def vacuum_yield_bound(nu, q_nu, q_vac, vac=0.0):
+    """
+    Lower bound on the vacuum yield Y0 from the two weakest intensities.
+
+    Args:
+        nu (float or np.ndarray): Decoy intensity
+        q_nu (float or np.ndarray): Measured decoy gain
+        q_vac (float or np.ndarray): Measured gain at the weakest intensity
+        vac (float or np.ndarray): Weakest intensity (0 for a true vacuum)
+
+    Returns:
+        np.ndarray: Y0 lower bound (equals q_vac when vac == 0)
+    """
+    nu = np.asarray(nu, dtype=float)
+    vac = np.asarray(vac, dtype=float)
+    return np.maximum((nu * q_vac * np.exp(vac) - vac * q_nu * np.exp(nu)) / (nu - vac), 0.0)
+
+
+def estimate_single_photon(mu, nu, q_mu, q_nu, e_nu, q_vac, e_vac=DARK_ERROR_RATE, vac=0.0):
+    """
+    Two-decoy bounds on single-photon yield and error rate.
+
+    Uses the general weak + weak decoy bound with the weaker decoy at
+    intensity vac; for vac = 0 this is exactly the vacuum + weak decoy
+    bound with Y0 = q_vac. Works elementwise on arrays so a whole sweep can
+    be bounded at once.
+
+    Args:
+        mu (float or np.ndarray): Signal intensity
+        nu (float or np.ndarray): Decoy intensity (nu < mu)
+        q_mu, q_nu (float or np.ndarray): Measured signal/decoy gains
+        e_nu (float or np.ndarray): Measured decoy QBER
+        q_vac (float or np.ndarray): Measured gain at the weakest intensity
+        e_vac (float or np.ndarray): Measured QBER at the weakest intensity
+        vac (float or np.ndarray): Weakest intensity (0 for a true vacuum)
+
+    Returns:
+        tuple: (Y1 lower bound, Q1 lower bound, e1 upper bound)
+    """
+    mu = np.asarray(mu, dtype=float)
+    nu = np.asarray(nu, dtype=float)
+    vac = np.asarray(vac, dtype=float)
+    y0 = vacuum_yield_bound(nu, q_nu, q_vac, vac)
+    y1 = mu / (mu * nu - mu * vac - nu ** 2 + vac ** 2) * (
+        q_nu * np.exp(nu)
+        - q_vac * np.exp(vac)
+        - (nu ** 2 - vac ** 2) / mu ** 2 * (q_mu * np.exp(mu) - y0)
+    )
+    y1 = np.clip(y1, 0.0, 1.0)
+    q1 = y1 * mu * np.exp(-mu)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        e1 = (e_nu * q_nu * np.exp(nu) - e_vac * q_vac * np.exp(vac)) / ((nu - vac) * y1)
+    e1 = np.where(y1 > 0, np.clip(e1, 0.0, 0.5), 0.5)
+    return y1, q1, e1
+
+
+def gllp_key_rate(q_mu, e_mu, q1, e1, f=ERROR_CORRECTION_EFFICIENCY, q=SIFT_FACTOR):
+    """
+    GLLP secure key rate per pulse, clipped at zero.
+
+    Args:
+        q_mu (float or np.ndarray): Signal gain
+        e_mu (float or np.ndarray): Signal QBER
+        q1 (float or np.ndarray): Single-photon gain lower bound
+        e1 (float or np.ndarray): Single-photon error upper bound
+        f (float): Error-correction inefficiency
+        q (float): Sifting factor
+
+    Returns:
+        np.ndarray: Secure key bits per pulse
+    """
+    rate = q * (-q_mu * f * binary_entropy(e_mu) + q1 * (1 - binary_entropy(e1)))
+    return np.maximum(rate, 0.0)
+
+
+def run_decoy_bb84(signal, decoy, vacuum, pulses, eta, dark, misalignment, eve_on=False, rng=None):
+    """
+    Run a complete decoy-state experiment for one parameter point.
+
+    Args:
+        signal (float): Signal intensity mu
+        decoy (float): Decoy intensity nu
+        vacuum (float): Vacuum (or weakest) intensity
+        pulses (int): Pulses sent per intensity
+        eta (float): Overall transmittance per photon
+        dark (float): Dark count probability
+        misalignment (float): Optical error probability
+        eve_on (bool): Enable intercept-resend attack
+        rng (np.random.Generator, optional): Random generator
+
+    Returns:
+        dict: measured gains/QBERs, decoy estimates and GLLP key rate
+    """
+    if not 0 <= vacuum < decoy < signal:
+        raise ValueError("Intensities must satisfy vacuum < decoy < signal")
+    rng = rng or np.random.default_rng()
+
+    sig = simulate_intensity(signal, pulses, eta, dark, misalignment, eve_on, rng)
+    dec = simulate_intensity(decoy, pulses, eta, dark, misalignment, eve_on, rng)
+    vac = simulate_intensity(vacuum, pulses, eta, dark, misalignment, eve_on, rng)
+
+    # A dark-only vacuum click errs with probability 1/2 by construction;
+    # a nonzero weakest intensity uses its measured QBER instead
+    e_vac = vac["qber"] if vacuum > 0 else DARK_ERROR_RATE
+    y1, q1, e1 = estimate_single_photon(
+        signal, decoy, sig["gain"], dec["gain"], dec["qber"], vac["gain"], e_vac, vacuum
+    )
+    rate = float(gllp_key_rate(sig["gain"], sig["qber"], q1, e1))
+
+    return {
+        "sifted": sig["clicks"],
+        "qber": sig["qber"],
+        "gain_signal": sig["gain"],
+        "gain_decoy": dec["gain"],
+        "y0": float(vacuum_yield_bound(decoy, dec["gain"], vac["gain"], vacuum)),
+        "y1": float(y1),
+        "q1": float(q1),
+        "e1": float(e1),
+        "key_rate": rate,
+        "final": int(rate * pulses),
+        "secure": rate > 0,
+    }
@@ -0,0 +1,508 @@
+"""
+Continuous Key Distillation Pipeline
+
+Runs sifting, parameter estimation, reconciliation, verification and privacy
+amplification on a stream of raw detection blocks, as long-running stages
+instead of once per request on a ~10-bit key.
+
+Design:
+- A source yields raw blocks: the sift() arguments of many pulses
+  (monte_carlo_source: the CLI's channel model; aer_source: BB84 circuits on
+  the local Aer simulator, many per sampler call)
+- Every stage is a thread; consecutive stages share a bounded queue
+  (queue_size blocks). A slow stage fills its input queue and the stages
+  before it block on put(), down to the source, so memory stays at about
+  queue_size blocks per stage whatever the speed difference
+- sift: sifted bits are regrouped into blocks of block_bits
+- estimate: a random sample_fraction of the block is disclosed and dropped;
+  blocks whose QBER upper bound (Wilson, 95%) exceeds 11% are aborted
+- reconcile: Cascade on the rest (first block size from the sample's QBER,
+  about 1/QBER, between 8 and 64 bits), or one-way LDPC (reconciliation="ldpc",
+  one code of the block's length per rate, undecoded blocks are dropped);
+  verify: Alice's and Bob's polynomial hash tags must match
+  (key_verification.py); a Cascade block that fails is reconciled once more,
+  then discarded, an LDPC block is discarded
+- amplify: privacy_amplify at the upper-bound QBER, minus every bit leaked
+  after estimation (Cascade parities, including those of a second Cascade
+  run, or LDPC syndromes, and verification tags); the key goes to `sink`
+  (by default the key pool of the default SAE pair, see key_pool.py)
+- stats() reports per stage blocks and bits in/out, busy time, time blocked
+  on a full queue, throughput (bits in per busy second) and queue depth,
+  plus the secure key rate in bits/s of wall time
+- If a stage fails, it sets the pipeline's abort flag and drains its input
+  queue; the other stages then drop their items unprocessed, the
+  source stops, and every thread ends. `running` stays True until they all
+  have
+
+One pipeline runs per worker (start/stop/stats and /api/distillation).
+/api/distillation/start is open to anyone, so request_options() clamps the
+source and block sizes to REQUEST_LIMITS and requires a finite max_blocks (at
+most QKD_DISTILLATION_MAX_BLOCKS); only callers sending the
+X-Distillation-Token header matching QKD_DISTILLATION_TOKEN may start an
+endless pipeline.
+"""
+
+import hmac
+import math
+import os
+import queue
+import threading
+import time
+from functools import partial
+
+import numpy as np
+
+from sifting import sift, wilson_interval
+from cascade_error_correction import cascade_error_correction, initial_block_size
+from privacy_amplification import privacy_amplify, secret_key_length
+from ldpc_reconciliation import ldpc_reconcile
+from key_verification import verify_reconciliation
+from qkd_cli_core import detection_events
+from metrics import observe, inc
+
+# The Aer source's imports stay at module level, not in the source thread:
+# qiskit first imported by a thread that then exits segfaults in later
+# circuit construction
+from backend_config import get_local_simulator, normalize_noise_profile
+from execution_policy import local_sampler
+from sampler_results import measured_bits
+from experiments.exp1 import bb84_circuit
+try:
+    from qiskit.primitives import BackendSamplerV2
+except ImportError:
+    BackendSamplerV2 = None
+
+QBER_THRESHOLD = 0.11
+SOURCES = ("monte_carlo", "aer")
+_DONE = object()
+
+OPERATOR_TOKEN = os.getenv("QKD_DISTILLATION_TOKEN")
+MAX_REQUEST_BLOCKS = int(os.getenv("QKD_DISTILLATION_MAX_BLOCKS", "1000"))
+# (type, low, high) of the numeric parameters a request may set
+REQUEST_LIMITS = {
+    "monte_carlo": {"photons": (int, 1000, 1_000_000), "distance": (float, 0, 500), "loss": (float, 0, 10),
+                    "noise": (float, 0, 0.5), "dark": (float, 0, 0.5), "detector_eff": (float, 0, 1)},
+    "aer": {"qubits": (int, 1, 128), "circuits": (int, 1, 64)},
+    "options": {"block_bits": (int, 16, 16384), "queue_size": (int, 1, 16),
+                "max_blocks": (int, 1, MAX_REQUEST_BLOCKS)},
+}
+
+
+# ---------------- sources ----------------
+def monte_carlo_source(photons=100000, distance=10, loss=0.2, noise=0.01, dark=0.0005,
+                       detector_eff=0.15, eve_on=False, seed=None):
+    """
+    Raw blocks from the CLI's Monte Carlo channel model (qkd_cli_core).
+
+    Yields:
+        dict: sift() arguments for `photons` pulses
+    """
+    rng = np.random.RandomState(seed)
+    transmission_prob = 10 ** (-(loss * distance) / 10)
+    while True:
+        yield detection_events(photons, transmission_prob, detector_eff, noise, dark, eve_on, rng=rng)
+
+
+def aer_source(qubits=64, circuits=16, noise_profile=None, seed=None):
+    """
+    Raw blocks from BB84 circuits (one shot each) on the local Aer simulator.
+
+    Yields:
+        dict: sift() arguments for circuits x qubits pulses, from one
+              multi-PUB sampler call
+    """
+    simulator = get_local_simulator(normalize_noise_profile(noise_profile))
+    rng = np.random.default_rng(seed)
+    while True:
+        abits, abase, bbase = (rng.integers(0, 2, (circuits, qubits)) for _ in range(3))
+        # Only x/h/measure/barrier, which Aer runs natively (as in batch_runner)
+        qcs = [bb84_circuit(*row) for row in zip(abits, abase, bbase)]
+        sampler, _ = local_sampler(BackendSamplerV2, simulator, qcs)
+        result = sampler.run(qcs, shots=1).result()
+        bbits = np.array([measured_bits(result, i).bits()[0] for i in range(circuits)])
+        yield {"alice_bits": abits.ravel(), "alice_bases": abase.ravel(),
+               "bob_bits": bbits.ravel(), "bob_bases": bbase.ravel()}
+
+
+# ---------------- stages ----------------
+class _Sifter:
+    """Sifts raw blocks and regroups the sifted bits into block_bits blocks."""
+
+    def __init__(self, block_bits):
+        self.block_bits = block_bits
+        self._alice = np.empty(0, dtype=np.uint8)
+        self._bob = np.empty(0, dtype=np.uint8)
+
+    def __call__(self, raw):
+        run = sift(**raw)
+        self._alice = np.concatenate([self._alice, np.asarray(run["alice"], dtype=np.uint8)])
+        self._bob = np.concatenate([self._bob, np.asarray(run["bob"], dtype=np.uint8)])
+        blocks = []
+        while len(self._alice) >= self.block_bits:
+            n = self.block_bits
+            blocks.append({"alice": self._alice[:n], "bob": self._bob[:n]})
+            self._alice, self._bob = self._alice[n:], self._bob[n:]
+        return blocks
+
+
+class _Estimator:
+    """Discloses a random sample of each block to bound its QBER."""
+
+    def __init__(self, sample_fraction, seed=None):
+        self.sample_fraction = sample_fraction
+        self._rng = np.random.default_rng(seed)
+
+    def __call__(self, block):
+        n = len(block["alice"])
+        sample = np.zeros(n, dtype=bool)
+        sample[self._rng.choice(n, max(1, int(n * self.sample_fraction)), replace=False)] = True
+        errors = int(np.count_nonzero(block["alice"][sample] != block["bob"][sample]))
+        _, high = wilson_interval(errors, int(sample.sum()))
+        if float(high) > QBER_THRESHOLD:
+            return []
+        keep = ~sample
+        return [{"alice": block["alice"][keep], "bob": block["bob"][keep], "qber": float(high),
+                 "sample_qber": errors / int(sample.sum())}]
+
+
+def _reconcile(block):
+    stats = {}
+    corrected = cascade_error_correction(block["alice"].tolist(), block["bob"].tolist(),
+                                         initial_block_size=initial_block_size(block["sample_qber"]),
+                                         stats=stats)
+    return [{**block, "bob": np.array(corrected, dtype=np.uint8),
+             "leaked_bits": block.get("leaked_bits", 0) + stats["leaked_bits"]}]
+
+
+def _reconcile_ldpc(block):
+    run = ldpc_reconcile(block["alice"], block["bob"], block["qber"], frame_bits=len(block["alice"]))
+    if run["frame_errors"]:
+        return []
+    return [{**block, "bob": run["bob"], "leaked_bits": block.get("leaked_bits", 0) + run["leaked_bits"]}]
+
+
+def _verify(block, reconcile=None):
+    rerun = None
+    if reconcile is not None:
+        def rerun(bob):
+            # Keep the second run's leaked parities
+            nonlocal block
+            block = reconcile({**block, "bob": bob})[0]
+            return block["bob"]
+    check = verify_reconciliation(block["alice"], block["bob"], rerun)
+    if not check["verified"]:
+        return []
+    return [{**block, "bob": check["bob"], "leaked_bits": block.get("leaked_bits", 0) + check["leaked_bits"]}]
+
+
+def _block_bits(item):
+    if "bits" in item:
+        return item["bits"]
+    if "alice_bits" in item:
+        return len(item["alice_bits"])
+    return len(item["alice"])
+
+
+class Stage:
+    """
+    One pipeline stage: a thread moving items from `inbox` through `func`
+    (item -> list of output items) to `outbox`.
+
+    `abort` is shared by all stages of a pipeline: a failing stage sets it,
+    and every stage then drops its items until _DONE arrives.
+    """
+
+    def __init__(self, name, func, inbox, outbox, abort):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.abort = abort
+        self.error = None
+        self.finished_at = None
+        self._stats = {"blocks_in": 0, "blocks_out": 0, "bits_in": 0, "bits_out": 0,
+                       "busy_s": 0.0, "blocked_s": 0.0}
+        self._thread = threading.Thread(target=self._run, name=f"distill-{name}", daemon=True)
+
+    def _put(self, item):
+        start = time.perf_counter()
+        self.outbox.put(item)
+        self._stats["blocked_s"] += time.perf_counter() - start
+
+    def _run(self):
+        try:
+            while True:
+                item = self.inbox.get()
+                if item is _DONE:
+                    break
+                if self.abort.is_set():
+                    continue
+                start = time.perf_counter()
+                outputs = self.func(item)
+                busy = time.perf_counter() - start
+                observe("qkd_stage_duration_seconds", busy, stage=f"distill_{self.name}")
+                self._stats["busy_s"] += busy
+                self._stats["blocks_in"] += 1
+                self._stats["bits_in"] += _block_bits(item)
+                for out in outputs:
+                    self._stats["blocks_out"] += 1
+                    self._stats["bits_out"] += _block_bits(out)
+                    if self.outbox is not None:
+                        self._put(out)
+        except Exception as e:
+            self.error = e
+            self.abort.set()
+            # Unblock the stages feeding this one until they finish
+            while self.inbox.get() is not _DONE:
+                pass
+        finally:
+            self.finished_at = time.perf_counter()
+            if self.outbox is not None:
+                self.outbox.put(_DONE)
+
+    def stats(self):
+        s = dict(self._stats)
+        s["throughput_bits_per_s"] = s["bits_in"] / s["busy_s"] if s["busy_s"] else 0.0
+        s["queue_depth"] = self.inbox.qsize()
+        if self.error is not None:
+            s["error"] = str(self.error)
+        return s
+
+
+class DistillationPipeline:
+    """
+    Source -> sift -> estimate -> reconcile -> verify -> amplify.
+
+    Args:
+        source (iterable): Raw blocks (see monte_carlo_source, aer_source)
+        block_bits (int): Sifted bits per distilled block
+        sample_fraction (float): Share of each block disclosed for the QBER
+        queue_size (int): Blocks buffered between two stages
+        max_blocks (int, optional): Stop after this many raw blocks
+        sink (callable, optional): sink(hex_key, bits) for each final key
+        seed (int, optional): Seed of the estimation sample
+        reconciliation (str): "cascade" or "ldpc"
+    """
+
+    def __init__(self, source, block_bits=1024, sample_fraction=0.1, queue_size=4, max_blocks=None,
+                 sink=None, seed=None, reconciliation="cascade"):
+        if block_bits < 16:
+            raise ValueError("block_bits must be at least 16")
+        if not 0 < sample_fraction < 1:
+            raise ValueError("sample_fraction must be between 0 and 1")
+        if reconciliation not in ("cascade", "ldpc"):
+            raise ValueError("reconciliation must be 'cascade' or 'ldpc'")
+        self.source = iter(source)
+        self.block_bits = block_bits
+        self.max_blocks = max_blocks
+        self.sink = sink
+        self._stop = threading.Event()
+        self._abort = threading.Event()
+        self._secure_bits = 0
+        self._keys = 0
+        self._started = None
+        self._source_stats = {"blocks_out": 0, "bits_out": 0, "busy_s": 0.0, "blocked_s": 0.0}
+        self.source_error = None
+
+        queues = [queue.Queue(max(1, queue_size)) for _ in range(5)]
+        if reconciliation == "cascade":
+            reconcile, verify = _reconcile, partial(_verify, reconcile=_reconcile)
+        else:
+            reconcile, verify = _reconcile_ldpc, _verify
+        funcs = [("sift", _Sifter(block_bits)), ("estimate", _Estimator(sample_fraction, seed)),
+                 ("reconcile", reconcile), ("verify", verify), ("amplify", self._amplify)]
+        self.stages = [Stage(name, func, queues[i], queues[i + 1] if i + 1 < len(queues) else None,
+                             self._abort)
+                       for i, (name, func) in enumerate(funcs)]
+        self._source_thread = threading.Thread(target=self._produce, name="distill-source", daemon=True)
+
+    def _amplify(self, block):
+        # leaked_bits: reconciliation disclosures plus verification tags
+        key = "".join(map(str, block["bob"].tolist()))
+        bits = secret_key_length(len(key), block["qber"], block["leaked_bits"])
+        hex_key = privacy_amplify(key, qber=block["qber"], leaked_bits=block["leaked_bits"])
+        if bits:
+            self._secure_bits += bits
+            self._keys += 1
+            inc("qkd_events_total", amount=bits, event="distilled_bits")
+            if self.sink is not None:
+                self.sink(hex_key, bits)
+        return [{"bits": bits}]
+
+    def _produce(self):
+        outbox = self.stages[0].inbox
+        stats = self._source_stats
+        try:
+            while not (self._stop.is_set() or self._abort.is_set()):
+                if self.max_blocks is not None and stats["blocks_out"] >= self.max_blocks:
+                    break
+                start = time.perf_counter()
+                raw = next(self.source, None)
+                stats["busy_s"] += time.perf_counter() - start
+                if raw is None:
+                    break
+                stats["blocks_out"] += 1
+                stats["bits_out"] += _block_bits(raw)
+                start = time.perf_counter()
+                outbox.put(raw)
+                stats["blocked_s"] += time.perf_counter() - start
+        except Exception as e:
+            self.source_error = e
+        finally:
+            # Finish the source generator here, in its own thread
+            close = getattr(self.source, "close", None)
+            if close is not None:
+                close()
+            outbox.put(_DONE)
+
+    def start(self):
+        self._started = time.perf_counter()
+        for stage in self.stages:
+            stage._thread.start()
+        self._source_thread.start()
+        return self
+
+    def stop(self):
+        """Stop producing; blocks already in the queues are still distilled."""
+        self._stop.set()
+
+    def join(self, timeout=None):
+        """
+        Wait until every stage has drained.
+
+        Returns:
+            bool: True if the pipeline finished within timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in [self._source_thread] + [s._thread for s in self.stages]:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                return False
+        return True
+
+    @property
+    def running(self):
+        """True while any thread of the pipeline is alive."""
+        return self._started is not None and any(
+            t.is_alive() for t in [self._source_thread] + [s._thread for s in self.stages])
+
+    def stats(self):
+        """
+        Returns:
+            dict: running, elapsed_s, secure_bits, keys, secure_key_rate_bps
+                  and per-stage stats (source first)
+        """
+        end = self.stages[-1].finished_at or time.perf_counter()
+        elapsed = end - self._started if self._started else 0.0
+        source = dict(self._source_stats)
+        source["throughput_bits_per_s"] = source["bits_out"] / source["busy_s"] if source["busy_s"] else 0.0
+        if self.source_error is not None:
+            source["error"] = str(self.source_error)
+        return {
+            "running": self.running,
+            "elapsed_s": elapsed,
+            "secure_bits": self._secure_bits,
+            "keys": self._keys,
+            "secure_key_rate_bps": self._secure_bits / elapsed if elapsed else 0.0,
+            "stages": {"source": source, **{s.name: s.stats() for s in self.stages}},
+        }
+
+
+# ---------------- worker-wide pipeline ----------------
+_pipeline = None
+_lock = threading.Lock()
+
+
+def is_operator(req):
+    """True if the request carries the X-Distillation-Token operator token."""
+    if not OPERATOR_TOKEN:
+        return False
+    supplied = req.headers.get("X-Distillation-Token")
+    if not supplied:
+        return False
+    return hmac.compare_digest(supplied.encode(), OPERATOR_TOKEN.encode())
+
+
+def _clamp(params, limits):
+    params = dict(params)
+    for name, (cast, low, high) in limits.items():
+        if name not in params:
+            continue
+        value = params[name]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"{name} must be a finite number")
+        params[name] = cast(min(max(value, low), high))
+    return params
+
+
+def request_options(data, operator=False):
+    """
+    start() arguments of a /api/distillation/start body, clamped to
+    REQUEST_LIMITS.
+
+    Args:
+        data (dict): {"source", "source_params", "block_bits", ...}
+        operator (bool): Caller holds the operator token; max_blocks may then
+                         be omitted or exceed MAX_REQUEST_BLOCKS
+
+    Returns:
+        tuple: (source, source_params, options)
+
+    Raises:
+        ValueError: For an unknown source, a non-numeric limited parameter or
+                    a missing max_blocks
+    """
+    source = data.get("source", "monte_carlo")
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+    source_params = data.get("source_params") or {}
+    if not isinstance(source_params, dict):
+        raise ValueError("source_params must be an object")
+    options = {k: data[k] for k in ("block_bits", "sample_fraction", "queue_size", "max_blocks", "seed",
+                                    "reconciliation")
+               if k in data}
+    limits = dict(REQUEST_LIMITS["options"])
+    if operator:
+        del limits["max_blocks"]
+    elif options.get("max_blocks") is None:
+        raise ValueError(f"max_blocks is required (at most {MAX_REQUEST_BLOCKS})")
+    return source, _clamp(source_params, REQUEST_LIMITS[source]), _clamp(options, limits)
+
+
+def start(source="monte_carlo", source_params=None, sink=None, **options):
+    """
+    Start the worker's pipeline.
+
+    Args:
+        source (str): "monte_carlo" or "aer"
+        source_params (dict, optional): Keyword arguments of the source
+        sink (callable, optional): sink(hex_key, bits)
+        **options: DistillationPipeline options
+
+    Raises:
+        RuntimeError: If a pipeline is already running
+        ValueError, TypeError: For an unknown source or invalid parameters
+    """
+    global _pipeline
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+    factory = monte_carlo_source if source == "monte_carlo" else aer_source
+    with _lock:
+        if _pipeline is not None and _pipeline.running:
+            raise RuntimeError("a distillation pipeline is already running")
+        _pipeline = DistillationPipeline(factory(**(source_params or {})), sink=sink, **options).start()
+    return _pipeline
+
+
+def stop():
+    """Stop the worker's pipeline (it drains in the background)."""
+    with _lock:
+        if _pipeline is not None:
+            _pipeline.stop()
+
+
+def stats():
+    """Statistics of the worker's pipeline, None before the first start."""
+    with _lock:
+        pipeline = _pipeline
+    return pipeline.stats() if pipeline is not None else None
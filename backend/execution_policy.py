@@ -0,0 +1,149 @@
+"""
+Aer Execution Policy
+
+Chooses the Aer simulation method for each circuit and limits Aer's
+threading to this worker's share of the CPU.
+
+Method selection:
+1. Up to SMALL_CIRCUIT_QUBITS -> "statevector": 2^n amplitudes are cheap
+   and all shots are sampled from one state (8 qubits: 3 ms vs 8 ms
+   stabilizer at 1024 shots)
+2. Wider Clifford-only circuits (every BB84 prepare-and-measure circuit) ->
+   "stabilizer": polynomial in qubits, so 64-qubit runs are cheap
+3. Other circuits up to STATEVECTOR_MAX_QUBITS -> "statevector"
+4. Wider circuits -> "matrix_product_state", which handles the weakly
+   entangled circuits of this app where a statevector would not fit
+
+Thread budget:
+- Aer defaults to one OpenMP thread per core in every call; with gunicorn's
+  workers x threads requests in flight at once, that oversubscribes the host
+- Each call gets cpus // (workers x threads) threads (at least 1), used for
+  both state updates and parallel shots
+- QKD_AER_THREADS overrides the budget; WEB_CONCURRENCY and
+  QKD_WORKER_THREADS describe the gunicorn layout (defaults match the
+  Procfile: 1 worker x 4 threads)
+"""
+
+import math
+import os
+
+CLIFFORD_OPS = frozenset({
+    "id", "x", "y", "z", "h", "s", "sdg", "sx", "sxdg", "cx", "cy", "cz", "swap",
+    "measure", "barrier", "reset", "delay",
+})
+SMALL_CIRCUIT_QUBITS = 16
+STATEVECTOR_MAX_QUBITS = 20
+DEFAULT_WORKERS = 1
+DEFAULT_WORKER_THREADS = 4
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+def available_cpus():
+    """CPUs this process may run on (respects taskset/cpuset affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def thread_budget():
+    """
+    Aer threads for one simulation call in this worker.
+
+    Returns:
+        int: QKD_AER_THREADS if set, else cpus // (workers x threads), min 1
+    """
+    if os.getenv("QKD_AER_THREADS"):
+        return _env_int("QKD_AER_THREADS", 1)
+    concurrent = _env_int("WEB_CONCURRENCY", DEFAULT_WORKERS) * _env_int("QKD_WORKER_THREADS", DEFAULT_WORKER_THREADS)
+    return max(1, available_cpus() // concurrent)
+
+
+def is_clifford(circuit):
+    """
+    True if every instruction is a Clifford gate, measurement or barrier
+    that the stabilizer method runs.
+
+    Classify circuits before transpiling them for AerSimulator: its default
+    basis merges x+h into u2, which the stabilizer method rejects.
+    """
+    for inst in circuit.data:
+        op = inst.operation
+        if op.name in CLIFFORD_OPS:
+            continue
+        # Transpiled circuits: rz by a multiple of pi/2 is Clifford (S, Z, Sdg)
+        if op.name == "rz" and not op.is_parameterized():
+            turns = float(op.params[0]) / (math.pi / 2)
+            if abs(turns - round(turns)) < 1e-9:
+                continue
+        return False
+    return True
+
+
+def choose_method(circuits):
+    """
+    Pick one Aer method able to run all given circuits.
+
+    Args:
+        circuits (QuantumCircuit or list): Circuits of one sampler call
+
+    Returns:
+        str: "stabilizer", "statevector" or "matrix_product_state"
+    """
+    if not isinstance(circuits, (list, tuple)):
+        circuits = [circuits]
+    width = max(qc.num_qubits for qc in circuits)
+    if width <= SMALL_CIRCUIT_QUBITS:
+        return "statevector"
+    if all(is_clifford(qc) for qc in circuits):
+        return "stabilizer"
+    if width <= STATEVECTOR_MAX_QUBITS:
+        return "statevector"
+    return "matrix_product_state"
+
+
+def aer_run_options(circuits):
+    """
+    Aer run options for one sampler call.
+
+    Returns:
+        dict: method, max_parallel_threads, max_parallel_shots and
+              max_parallel_experiments; pass as backend.run(**options) or
+              BackendSamplerV2(options={"run_options": options})
+    """
+    threads = thread_budget()
+    return {
+        "method": choose_method(circuits),
+        "max_parallel_threads": threads,
+        "max_parallel_shots": threads,
+        "max_parallel_experiments": 1,
+    }
+
+
+def local_sampler(sampler_cls, backend, circuits):
+    """
+    Build a BackendSamplerV2 that runs `circuits` with the policy's options.
+
+    The (cached, shared) simulator is never reconfigured: the options travel
+    with each run.
+
+    Returns:
+        tuple: (sampler, metadata dict for the response)
+    """
+    options = aer_run_options(circuits)
+    sampler = sampler_cls(backend=backend, options={"run_options": options})
+    return sampler, simulator_metadata(options)
+
+
+def simulator_metadata(options):
+    """Response metadata describing how a local run was simulated."""
+    return {
+        "method": options["method"],
+        "threads": options["max_parallel_threads"],
+    }
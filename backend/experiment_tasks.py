@@ -0,0 +1,169 @@
+"""
+Background IBM Experiment Tasks
+
+An IBM experiment waits minutes to hours in the provider's queue. Running it
+inside the HTTP request would hold a gunicorn thread (and, with two
+threads per worker, soon the whole worker) for that long. Instead the route
+hands the experiment to this module and answers 202 with a task id; the
+client polls GET /api/tasks/<id> until the result is there.
+
+Design:
+- Experiments run on a bounded thread pool (QKD_IBM_EXPERIMENT_THREADS,
+  default QKD_IBM_MAX_JOBS), separate from the request threads. Their
+  runtime jobs still pass admission.py and are polled by job_multiplexer
+- At most QKD_IBM_MAX_PENDING tasks may be queued or running; beyond that
+  submit() raises QueueFull (503 with Retry-After)
+- Each task belongs to the token key that submitted it (admission.token_key),
+  and only that key can read it. Ids are random and unguessable
+- Finished tasks are kept for QKD_IBM_TASK_TTL seconds (default one hour),
+  at most QKD_IBM_TASK_KEEP of them
+- Tasks live in the memory of the worker process that accepted them, so
+  polls must reach that worker: run the service with a single worker
+"""
+
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(RuntimeError):
+    """Too many background experiments are queued or running."""
+
+
+def _env_number(name, default, cast=int):
+    try:
+        return cast(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class ExperimentTasks:
+    """
+    Registry and thread pool for background experiments.
+
+    Args:
+        max_workers (int): Experiments running at once
+        max_pending (int): Experiments queued or running at once
+        ttl (float): Seconds a finished task stays readable
+        keep (int): Finished tasks kept at most
+    """
+
+    def __init__(self, max_workers=8, max_pending=32, ttl=3600.0, keep=256):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(self.max_workers, max_pending)
+        self.ttl = ttl
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._tasks = OrderedDict()
+        self._pending = 0
+        self._pid = None
+        self._executor = None
+
+    def _pool(self):
+        # Lazily, and again in a forked child (threads do not survive fork)
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="ibm-experiment")
+            self._pid = os.getpid()
+        return self._executor
+
+    def _expire(self, now):
+        # Caller holds the lock
+        finished = [tid for tid, t in self._tasks.items() if t["finished"] is not None]
+        for tid in finished[:max(0, len(finished) - self.keep)]:
+            del self._tasks[tid]
+        for tid in finished:
+            task = self._tasks.get(tid)
+            if task is not None and now - task["finished"] > self.ttl:
+                del self._tasks[tid]
+
+    def submit(self, owner, experiment, call):
+        """
+        Run `call()` in the background.
+
+        Args:
+            owner (str): Token key allowed to read the task
+            experiment (str): Experiment name, reported back on polls
+            call (callable): Runs the experiment and returns its result dict
+
+        Returns:
+            str: Task id
+
+        Raises:
+            QueueFull: If max_pending tasks are already queued or running
+        """
+        task_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._expire(time.time())
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} IBM experiments are already pending, retry later")
+            self._pending += 1
+            self._tasks[task_id] = {"owner": owner, "experiment": experiment, "status": "queued",
+                                    "created": time.time(), "finished": None, "result": None, "error": None}
+            pool = self._pool()
+        pool.submit(self._run, task_id, call)
+        return task_id
+
+    def _run(self, task_id, call):
+        with self._lock:
+            task = self._tasks[task_id]
+            task["status"] = "running"
+        outcome = {}
+        try:
+            outcome["result"] = call()
+            outcome["status"] = "done"
+        except Exception as e:
+            outcome.update(status="failed", error=str(e), error_type=type(e).__name__)
+        finally:
+            with self._lock:
+                task.update(outcome, finished=time.time())
+                self._pending -= 1
+
+    def get(self, task_id, owner):
+        """
+        Returns:
+            dict or None: id, experiment, status ("queued", "running", "done"
+                          or "failed"), created/finished times and the
+                          result or error; None if unknown or not `owner`'s
+        """
+        with self._lock:
+            self._expire(time.time())
+            task = self._tasks.get(task_id)
+            if task is None or task["owner"] != owner:
+                return None
+            return {"id": task_id, **{k: v for k, v in task.items() if k != "owner"}}
+
+    def stats(self):
+        """
+        Returns:
+            dict: pending (queued or running) and stored tasks, and the limits
+        """
+        with self._lock:
+            return {"pending": self._pending, "stored": len(self._tasks),
+                    "limits": {"max_workers": self.max_workers, "max_pending": self.max_pending}}
+
+
+# Worker-wide registry (QKD_IBM_* environment variables)
+tasks = ExperimentTasks(
+    max_workers=_env_number("QKD_IBM_EXPERIMENT_THREADS", _env_number("QKD_IBM_MAX_JOBS", 8)),
+    max_pending=_env_number("QKD_IBM_MAX_PENDING", 32),
+    ttl=_env_number("QKD_IBM_TASK_TTL", 3600.0, float),
+    keep=_env_number("QKD_IBM_TASK_KEEP", 256),
+)
+
+
+def submit(owner, experiment, call):
+    """Run an experiment on the worker-wide registry; returns the task id."""
+    return tasks.submit(owner, experiment, call)
+
+
+def get(task_id, owner):
+    """A task of the worker-wide registry (None if unknown or not owner's)."""
+    return tasks.get(task_id, owner)
+
+
+def stats():
+    """Statistics of the worker-wide registry."""
+    return tasks.stats()
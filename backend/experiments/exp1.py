@@ -7,14 +7,15 @@ import matplotlib.pyplot as plt
 import os
 
 # Robust imports for deployment compatibility
-from backend_config import get_backend_service
-from qrng import generate_qrng_bits
-from cascade_error_correction import cascade_error_correction
-from privacy_amplification import privacy_amplify
-try:
-    from qiskit_ibm_runtime import SamplerV2 as Sampler
-except ImportError:
-    from qiskit_ibm_runtime import Sampler
+from backend_config import get_backend_service, get_local_simulator, normalize_noise_profile
+from qrng import generate_qrng_draws
+from cascade_error_correction import cascade_reconcile
+from privacy_amplification import privacy_amplify, secret_key_length
+from sifting import sift
+from sampler_results import measured_bits
+from execution_policy import local_sampler
+from runtime_modes import open_mode, runtime_sampler, mode_name
+from metrics import timed, inc
 
 from qiskit_aer import AerSimulator
 try:
@@ -30,18 +31,8 @@ def xor_encrypt_decrypt(message_bytes, key_bits):
     key_bytes = bytes([int(b) for b in key])
     return bytes([mb ^ kb for mb, kb in zip(message_bytes, key_bytes)])
 
-def run_exp1(message=None, backend_type="local", noise_mitigation=True, bit_num=20, shots=1024, rng_seed=None, api_token=None):
-    rng = np.random.default_rng(rng_seed)
-    if backend_type == "ibm":
-        backend = get_backend_service("ibm", api_token=api_token)
-        abits = np.array(generate_qrng_bits(bit_num, backend, shots=1))
-        abase = np.array(generate_qrng_bits(bit_num, backend, shots=1))
-        bbase = np.array(generate_qrng_bits(bit_num, backend, shots=1))
-    else:
-        abits = np.round(rng.random(bit_num)).astype(int)
-        abase = np.round(rng.random(bit_num)).astype(int)
-        bbase = np.round(rng.random(bit_num)).astype(int)
-
+def bb84_circuit(abits, abase, bbase):
+    bit_num = len(abits)
     qc = QuantumCircuit(bit_num, bit_num)
     for n in range(bit_num):
         if abits[n] == 0:
@@ -58,148 +49,92 @@ def run_exp1(message=None, backend_type="local", noise_mitigation=True, bit_num=
         if bbase[m] == 1:
             qc.h(m)
         qc.measure(m, m)
+    return qc
 
-    if backend_type == "local":
-        backend = AerSimulator()
-        tqc = transpile(qc, backend)
-        sampler = BackendSampler(backend=backend)
-        result = sampler.run([tqc], shots=shots).result()
-        # Handle different Qiskit API versions for accessing counts
-        counts = None
-        if hasattr(result, "quasi_dists"):
-            counts = {}
-            bit_num = tqc.num_qubits
-            for dist in result.quasi_dists:
-                for int_key, prob in dist.items():
-                    bitstring = format(int_key, f'0{bit_num}b')
-                    counts[bitstring] = prob
-                break  # Only use the first quasi_dist
-        if counts is None or not counts:
-            try:
-                for quasi_dist in result:
-                    if hasattr(quasi_dist, 'data'):
-                        if hasattr(quasi_dist.data, 'c'):
-                            counts = quasi_dist.data.c.get_counts()
-                        else:
-                            counts = quasi_dist.data.get_counts()
-                    break
-            except (TypeError, AttributeError, IndexError) as e:
-                pass
-            if counts is None:
-                try:
-                    quasi_dist = result[0]
-                    if hasattr(quasi_dist, 'data'):
-                        if hasattr(quasi_dist.data, 'c'):
-                            counts = quasi_dist.data.c.get_counts()
-                        else:
-                            counts = quasi_dist.data.get_counts()
-                except (TypeError, AttributeError, IndexError) as e:
-                    pass
-            if counts is None:
+def run_exp1(message=None, backend_type="local", noise_mitigation=True, bit_num=20, shots=1024, rng_seed=None, api_token=None,
+             noise_profile=None, circuits=32):
+    # `circuits` BB84 circuits of bit_num qubits in one sampler job: a single
+    # circuit sifts ~10 bits, fewer than reconciliation and verification disclose
+    rng = np.random.default_rng(rng_seed)
+    # Local runs: "ideal" or a fake-backend noise profile (hardware noise is real on ibm)
+    noise_profile = None if backend_type == "ibm" else normalize_noise_profile(noise_profile)
+    inc("qkd_events_total", event="run", experiment="exp1", backend=backend_type)
+    if backend_type == "ibm":
+        backend = get_backend_service("ibm", api_token=api_token)
+        # QRNG draws and the BB84 job share one runtime Session/Batch: one queue wait
+        with open_mode(backend) as mode:
+            with timed("qrng", experiment="exp1"):
+                draws = generate_qrng_draws(bit_num, 3 * circuits, backend, mode=mode, api_token=api_token)
+                abits, abase, bbase = np.array(draws).reshape(3, circuits, bit_num)
+            qcs = [bb84_circuit(*row) for row in zip(abits, abase, bbase)]
+            with timed("transpile", experiment="exp1"):
+                tqcs = transpile(qcs, backend)
+            sampler = runtime_sampler(mode, api_token)
+            simulator = None
+            runtime_mode = mode_name(mode)
+            if noise_mitigation:
                 try:
-                    if hasattr(result, 'get_counts'):
-                        counts = result.get_counts()
-                    elif hasattr(result, '__iter__'):
-                        items = list(result)
-                        if items:
-                            counts = items[0].data.c.get_counts() if hasattr(items[0].data, 'c') else items[0].data.get_counts()
-                except (TypeError, AttributeError, Exception) as e:
+                    sampler.options.resilience_level = 2
+                    sampler.options.resilience.zne_mitigation = True
+                    sampler.options.resilience.zne.noise_factors = [1, 3, 5]
+                    sampler.options.dynamical_decoupling.enable = True
+                    sampler.options.dynamical_decoupling.sequence_type = "XpXm"
+                except Exception:
                     pass
-        if counts is None or not counts:
-            raise RuntimeError("Failed to extract counts from sampler result. Try using AerSimulator or check qiskit version.")
+            with timed("sampler_run", experiment="exp1"):
+                result = sampler.run(tqcs, shots=shots).result()
     else:
-        tqc = transpile(qc, backend)
-        sampler = Sampler(mode=backend)
-        if noise_mitigation:
-            try:
-                sampler.options.resilience_level = 2
-                sampler.options.resilience.zne_mitigation = True
-                sampler.options.resilience.zne.noise_factors = [1, 3, 5]
-                sampler.options.dynamical_decoupling.enable = True
-                sampler.options.dynamical_decoupling.sequence_type = "XpXm"
-            except Exception:
-                pass
-        result = sampler.run([tqc], shots=shots).result()
-        # Handle different Qiskit API versions for accessing counts
-        counts = None
-        if hasattr(result, "quasi_dists"):
-            counts = {}
-            bit_num = tqc.num_qubits
-            for dist in result.quasi_dists:
-                for int_key, prob in dist.items():
-                    bitstring = format(int_key, f'0{bit_num}b')
-                    counts[bitstring] = prob
-                break  # Only use the first quasi_dist
-        if counts is None or not counts:
-            try:
-                for quasi_dist in result:
-                    if hasattr(quasi_dist, 'data'):
-                        if hasattr(quasi_dist.data, 'c'):
-                            counts = quasi_dist.data.c.get_counts()
-                        else:
-                            counts = quasi_dist.data.get_counts()
-                    break
-            except (TypeError, AttributeError, IndexError) as e:
-                pass
-            if counts is None:
-                try:
-                    quasi_dist = result[0]
-                    if hasattr(quasi_dist, 'data'):
-                        if hasattr(quasi_dist.data, 'c'):
-                            counts = quasi_dist.data.c.get_counts()
-                        else:
-                            counts = quasi_dist.data.get_counts()
-                except (TypeError, AttributeError, IndexError) as e:
-                    pass
-            if counts is None:
-                try:
-                    if hasattr(result, 'get_counts'):
-                        counts = result.get_counts()
-                    elif hasattr(result, '__iter__'):
-                        items = list(result)
-                        if items:
-                            counts = items[0].data.c.get_counts() if hasattr(items[0].data, 'c') else items[0].data.get_counts()
-                except (TypeError, AttributeError, Exception) as e:
-                    pass
-        if counts is None or not counts:
-            raise RuntimeError("Failed to extract counts from sampler result. Try using AerSimulator or check qiskit version.")
+        abits = np.round(rng.random((circuits, bit_num))).astype(int)
+        abase = np.round(rng.random((circuits, bit_num))).astype(int)
+        bbase = np.round(rng.random((circuits, bit_num))).astype(int)
+        qcs = [bb84_circuit(*row) for row in zip(abits, abase, bbase)]
+        backend = get_local_simulator(noise_profile)
+        # Only x/h/measure/barrier, which Aer runs natively (as in batch_runner);
+        # transpiling would merge x+h into u2, which the stabilizer method cannot run
+        sampler, simulator = local_sampler(BackendSampler, backend, qcs)
+        runtime_mode = None
+        with timed("sampler_run", experiment="exp1"):
+            result = sampler.run(qcs, shots=shots).result()
+    qc = qcs[0]  # the diagram and "counts" show the first circuit
+    with timed("counts_extraction", experiment="exp1"):
+        measured = [measured_bits(result, i, num_bits=bit_num) for i in range(circuits)]
 
     # Get absolute path to static folder (backend/static)
     backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     static_dir = os.path.join(backend_dir, "static")
     os.makedirs(static_dir, exist_ok=True)
     circuit_path = os.path.join(static_dir, "circuit_exp1.png")
-    fig = circuit_drawer(qc, output='mpl', style='clifford')
-    fig.savefig(circuit_path)
-    plt.close(fig)
-
-    if not counts:
-        raise RuntimeError("Counts not available")
+    with timed("circuit_drawer", experiment="exp1"):
+        fig = circuit_drawer(qc, output='mpl', style='clifford')
+        fig.savefig(circuit_path)
+        plt.close(fig)
 
-    # Find the most likely outcome string
-    max_key = max(counts, key=counts.get)
-    bbits = list(map(int, reversed(list(max_key))))
+    # Most likely outcome of each circuit, bit i = qubit i
+    bbits = np.concatenate([m.most_likely() for m in measured]).tolist()
+    abits, abase, bbase = abits.ravel(), abase.ravel(), bbase.ravel()
 
-    agoodbits = []
-    bgoodbits = []
-    match_count = 0
-    for n in range(bit_num):
-        if abase[n] == bbase[n]:
-            ab = int(abits[n])
-            bb = bbits[n]
-            agoodbits.append(ab)
-            bgoodbits.append(bb)
-            if ab == bb:
-                match_count += 1
+    with timed("sifting", experiment="exp1"):
+        sifted = sift(abits, abase, bbits[:len(abits)], bbase)
+        agoodbits = sifted["alice"].tolist()
+        bgoodbits = sifted["bob"].tolist()
+        match_count = sifted["sifted"] - sifted["errors"]
 
-    corrected_bbits = cascade_error_correction(agoodbits, bgoodbits, num_rounds=4, initial_block_size=8)
     fidelity = match_count / len(agoodbits) if agoodbits else 0
     loss = 1 - fidelity if agoodbits else 1
     fidelity_percent = fidelity * 100
     loss_percent = loss * 100
     qber = loss  # QBER is still a fraction; multiply by 100 if you want percent
+
+    # Cascade (first block sized for the QBER) and hash verification; every
+    # parity and tag bit is charged to privacy amplification
+    with timed("cascade", experiment="exp1"):
+        verification = cascade_reconcile(agoodbits, bgoodbits, qber)
+    # A key that still fails verification is discarded (no final key)
+    corrected_bbits = verification["bob"] or []
+    leaked_bits = verification["leaked_bits"]
     error_corrected_key = ''.join(map(str, corrected_bbits))
-    secret_key = privacy_amplify(error_corrected_key, qber=qber)
+    with timed("privacy_amplification", experiment="exp1"):
+        secret_key = privacy_amplify(error_corrected_key, qber=qber, leaked_bits=leaked_bits)
 
     if message is None:
         message = "QKD demo"
@@ -233,11 +168,19 @@ def run_exp1(message=None, backend_type="local", noise_mitigation=True, bit_num=
         "fidelity": fidelity_percent,
         "loss": loss_percent,
         "qber": qber * 100,  # QBER as percent for consistency
+        "qber_ci": [sifted["qber_low"] * 100, sifted["qber_high"] * 100],
         "error_corrected_key": error_corrected_key,
         "final_secret_key": secret_key,
+        "final_secret_key_bits": secret_key_length(len(error_corrected_key), qber, leaked_bits),
+        "key_verified": verification["verified"],
+        "verification_leaked_bits": leaked_bits,
         "original_message": message,
         "encrypted_message_hex": encrypted_hex,
         "decrypted_message": decrypted_message,
         "circuit_diagram_url": "/static/circuit_exp1.png",
-        "counts": dict(counts) if not isinstance(counts, dict) else counts
+        "noise_profile": noise_profile,
+        "simulator": simulator,
+        "runtime_mode": runtime_mode,
+        "circuits": circuits,
+        "counts": measured[0].get_counts()
     }
@@ -7,14 +7,15 @@ import matplotlib.pyplot as plt
 import os
 
 # Robust imports for deployment compatibility
-from backend_config import get_backend_service
-from qrng import generate_qrng_bits
-from cascade_error_correction import cascade_error_correction
-from privacy_amplification import privacy_amplify
-try:
-    from qiskit_ibm_runtime import SamplerV2 as Sampler
-except ImportError:
-    from qiskit_ibm_runtime import Sampler
+from backend_config import get_backend_service, get_local_simulator, normalize_noise_profile
+from qrng import generate_qrng_draws
+from cascade_error_correction import cascade_reconcile
+from privacy_amplification import privacy_amplify, secret_key_length
+from sifting import sift
+from sampler_results import measured_bits
+from execution_policy import local_sampler
+from runtime_modes import open_mode, runtime_sampler, mode_name
+from metrics import timed, inc
 
 from qiskit_aer import AerSimulator
 try:
@@ -26,22 +27,8 @@ except ImportError:
         BackendSampler = None
 
 
-def run_exp2(message=None, backend_type="local",
-             bit_num=20, shots=1024,
-             rng_seed=None, api_token=None):
-
-    rng = np.random.default_rng(rng_seed)
-
-    if backend_type == "ibm":
-        backend = get_backend_service("ibm", api_token=api_token)
-        abits = np.array(generate_qrng_bits(bit_num, backend, shots=1))
-        abase = np.array(generate_qrng_bits(bit_num, backend, shots=1))
-        bbase = np.array(generate_qrng_bits(bit_num, backend, shots=1))
-    else:
-        abits = rng.integers(0, 2, bit_num)
-        abase = rng.integers(0, 2, bit_num)
-        bbase = rng.integers(0, 2, bit_num)
-
+def bb84_circuit(abits, abase, bbase):
+    bit_num = len(abits)
     qc = QuantumCircuit(bit_num, bit_num)
 
     # Alice encodes
@@ -58,92 +45,75 @@ def run_exp2(message=None, backend_type="local",
         if bbase[n] == 1:
             qc.h(n)
         qc.measure(n, n)
+    return qc
 
-    # Run backend
-    if backend_type == "local":
-        backend = AerSimulator()
-        tqc = transpile(qc, backend)
-        sampler = BackendSampler(backend=backend)
-        result = sampler.run([tqc], shots=shots).result()
-    else:
-        tqc = transpile(qc, backend)
-        sampler = Sampler(mode=backend)
-        result = sampler.run([tqc], shots=shots).result()
-
-    # --- Robust counts extraction (copied from exp1) ---
-    counts = None
-    if hasattr(result, "quasi_dists"):
-        counts = {}
-        bit_num = tqc.num_qubits
-        for dist in result.quasi_dists:
-            for int_key, prob in dist.items():
-                bitstring = format(int_key, f'0{bit_num}b')
-                counts[bitstring] = prob
-            break
-    if counts is None or not counts:
-        try:
-            for quasi_dist in result:
-                if hasattr(quasi_dist, 'data'):
-                    if hasattr(quasi_dist.data, 'c'):
-                        counts = quasi_dist.data.c.get_counts()
-                    else:
-                        counts = quasi_dist.data.get_counts()
-                break
-        except (TypeError, AttributeError, IndexError):
-            pass
-        if counts is None:
-            try:
-                quasi_dist = result[0]
-                if hasattr(quasi_dist, 'data'):
-                    if hasattr(quasi_dist.data, 'c'):
-                        counts = quasi_dist.data.c.get_counts()
-                    else:
-                        counts = quasi_dist.data.get_counts()
-            except (TypeError, AttributeError, IndexError):
-                pass
-        if counts is None:
-            try:
-                if hasattr(result, 'get_counts'):
-                    counts = result.get_counts()
-                elif hasattr(result, '__iter__'):
-                    items = list(result)
-                    if items:
-                        counts = items[0].data.c.get_counts() if hasattr(items[0].data, 'c') else items[0].data.get_counts()
-            except (TypeError, AttributeError, Exception):
-                pass
-    if counts is None or not counts:
-        raise RuntimeError("Failed to extract counts from sampler result. Try using AerSimulator or check qiskit version.")
-    # --- End robust counts extraction ---
-
-    # Convert quasi-dist to bitstrings
-    # counts = {
-    #     format(k, f"0{bit_num}b"): float(v)
-    #     for k, v in dist.items()
-    # }
-
-    # ✅ Sample ONE real backend outcome (authentic BB84)
-    bitstrings = list(counts.keys())
-    weights = np.array(list(counts.values()), dtype=float)
-    weights = weights.astype(float)
-    weights /= weights.sum()
-
-    sampled = rng.choice(bitstrings, p=weights)
-    bbits = list(map(int, reversed(sampled)))
 
-    # Sifting
-    agoodbits = []
-    bgoodbits = []
-    for i in range(bit_num):
-        if abase[i] == bbase[i]:
-            agoodbits.append(int(abits[i]))
-            bgoodbits.append(bbits[i])
+def run_exp2(message=None, backend_type="local",
+             bit_num=20, shots=1024,
+             rng_seed=None, api_token=None, noise_profile=None, circuits=32):
+
+    # `circuits` BB84 circuits of bit_num qubits in one sampler job: a single
+    # circuit sifts ~10 bits, fewer than reconciliation and verification disclose
+    rng = np.random.default_rng(rng_seed)
+    # Local runs: "ideal" or a fake-backend noise profile (hardware noise is real on ibm)
+    noise_profile = None if backend_type == "ibm" else normalize_noise_profile(noise_profile)
+    inc("qkd_events_total", event="run", experiment="exp2", backend=backend_type)
 
-    # QBER (true BB84 definition)
-    mismatches = sum(a != b for a, b in zip(agoodbits, bgoodbits))
-    qber = mismatches / len(agoodbits) if agoodbits else 0.0
+    if backend_type == "ibm":
+        backend = get_backend_service("ibm", api_token=api_token)
+        # QRNG draws and the BB84 job share one runtime Session/Batch: one queue wait
+        with open_mode(backend) as mode:
+            with timed("qrng", experiment="exp2"):
+                draws = generate_qrng_draws(bit_num, 3 * circuits, backend, mode=mode, api_token=api_token)
+                abits, abase, bbase = np.array(draws).reshape(3, circuits, bit_num)
+            qcs = [bb84_circuit(*row) for row in zip(abits, abase, bbase)]
+            with timed("transpile", experiment="exp2"):
+                tqcs = transpile(qcs, backend)
+            sampler = runtime_sampler(mode, api_token)
+            simulator = None
+            runtime_mode = mode_name(mode)
+            with timed("sampler_run", experiment="exp2"):
+                result = sampler.run(tqcs, shots=shots).result()
+    else:
+        abits = rng.integers(0, 2, (circuits, bit_num))
+        abase = rng.integers(0, 2, (circuits, bit_num))
+        bbase = rng.integers(0, 2, (circuits, bit_num))
+        qcs = [bb84_circuit(*row) for row in zip(abits, abase, bbase)]
+        backend = get_local_simulator(noise_profile)
+        # Only x/h/measure/barrier, which Aer runs natively (as in batch_runner);
+        # transpiling would merge x+h into u2, which the stabilizer method cannot run
+        sampler, simulator = local_sampler(BackendSampler, backend, qcs)
+        runtime_mode = None
+        with timed("sampler_run", experiment="exp2"):
+            result = sampler.run(qcs, shots=shots).result()
+
+    qc = qcs[0]  # the diagram and "counts" show the first circuit
+    with timed("counts_extraction", experiment="exp2"):
+        measured = [measured_bits(result, i, num_bits=bit_num) for i in range(circuits)]
+
+    # ✅ Sample ONE real backend outcome per circuit (authentic BB84)
+    bbits = np.concatenate([m.sample(rng) for m in measured]).tolist()
+    abits, abase, bbase = abits.ravel(), abase.ravel(), bbase.ravel()
 
-    corrected = cascade_error_correction(agoodbits, bgoodbits)
-    final_key = privacy_amplify("".join(map(str, corrected)), qber=qber)
+    # Sifting
+    with timed("sifting", experiment="exp2"):
+        sifted = sift(abits, abase, bbits[:len(abits)], bbase)
+        agoodbits = sifted["alice"].tolist()
+        bgoodbits = sifted["bob"].tolist()
+
+        # QBER (true BB84 definition)
+        mismatches = sifted["errors"]
+        qber = sifted["qber"]
+
+    # Cascade (first block sized for the QBER) and hash verification; every
+    # parity and tag bit is charged to privacy amplification
+    with timed("cascade", experiment="exp2"):
+        verification = cascade_reconcile(agoodbits, bgoodbits, qber)
+    # A key that still fails verification is discarded (no final key)
+    corrected = verification["bob"] or []
+    leaked_bits = verification["leaked_bits"]
+    with timed("privacy_amplification", experiment="exp2"):
+        final_key = privacy_amplify("".join(map(str, corrected)), qber=qber, leaked_bits=leaked_bits)
 
     # Calculate fidelity and loss as percentages
     match_count = len(agoodbits) - mismatches
@@ -159,9 +129,10 @@ def run_exp2(message=None, backend_type="local",
     static_dir = os.path.join(backend_dir, "static")
     os.makedirs(static_dir, exist_ok=True)
     circuit_path = os.path.join(static_dir, "circuit_exp2.png")
-    fig = circuit_drawer(qc, output="mpl", style='clifford')
-    fig.savefig(circuit_path)
-    plt.close(fig)
+    with timed("circuit_drawer", experiment="exp2"):
+        fig = circuit_drawer(qc, output="mpl", style='clifford')
+        fig.savefig(circuit_path)
+        plt.close(fig)
 
     return {
         "Sender_bits": abits.tolist(),
@@ -173,9 +144,17 @@ def run_exp2(message=None, backend_type="local",
         "fidelity": fidelity_percent,
         "loss": loss_percent,
         "qber": qber_percent,
+        "qber_ci": [sifted["qber_low"] * 100, sifted["qber_high"] * 100],
         "final_secret_key": final_key,
+        "final_secret_key_bits": secret_key_length(len(corrected), qber, leaked_bits),
+        "key_verified": verification["verified"],
+        "verification_leaked_bits": leaked_bits,
         "circuit_diagram_url": "/static/circuit_exp2.png",
-        "counts": counts
+        "noise_profile": noise_profile,
+        "simulator": simulator,
+        "runtime_mode": runtime_mode,
+        "circuits": circuits,
+        "counts": measured[0].get_counts()
     }
 
 def encrypt_with_existing_key(exp2_result, message):
@@ -16,11 +16,9 @@ except Exception:
         Sampler = None
 try:
     from qiskit_aer import AerSimulator
-    from qiskit_aer.noise import NoiseModel
     HAS_AER = True
 except ImportError:
     HAS_AER = False
-    NoiseModel = None
 try:
     from qiskit.primitives import BackendSamplerV2
 except Exception:
@@ -33,8 +31,14 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Robust imports for deployment compatibility
-from backend_config import get_backend_service
-from qrng import generate_qrng_bits
+from backend_config import get_backend_service, get_local_simulator, normalize_noise_profile
+from qrng import generate_qrng_draws
+from metrics import timed, inc
+from sifting import sift
+from sampler_results import measured_bits
+from execution_policy import local_sampler
+from runtime_modes import open_mode, runtime_sampler, mode_name
+from contextlib import nullcontext
 from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
 import os
 from qiskit.visualization import circuit_drawer
@@ -49,172 +53,106 @@ exp3: BB84 with Eve intercept-resend
 Changes:
 - Avoid initializing IBM Runtime at import time.
 - Respect backend_type ("local" | "ibm").
-- Use AerSimulator + BackendSamplerV2 for local fast runs.
-- Safely extract a single bitstring from counts (sampling when shots>1).
+- Use AerSimulator + BackendSamplerV2 for local fast runs (cached, optionally
+  with a fake-backend noise profile).
+- IBM runs put the QRNG draws and both stages in one runtime Session
+  (runtime_modes), so the dependent Eve -> Bob job does not queue again.
+- Take the most likely outcome of each stage from the sampler's bit arrays
+  (sampler_results), counts are only formatted for the response.
 """
 
-def extract_bitstring(counts, n):
-    """Extract a deterministic bitstring from counts dict (single-shot)."""
-    if not counts:
-        raise RuntimeError("Empty measurement counts.")
-    bitstring = max(counts, key=counts.get)
-    return bitstring.zfill(n)
-
-def run_exp3(message=None, bit_num=20, backend_type="local", api_token=None, shots=1024):
+def run_exp3(message=None, bit_num=20, backend_type="local", api_token=None, shots=1024, noise_profile=None):
     # Use multiple shots for counts visualization, but extract single bitstring for protocol
     rng = np.random.default_rng()
+    # Local runs: "ideal" or a fake-backend noise profile (hardware noise is real on ibm)
+    noise_profile = None if backend_type == "ibm" else normalize_noise_profile(noise_profile)
+    inc("qkd_events_total", event="run", experiment="exp3", backend=backend_type)
 
-    # Generate random bits: use QRNG if IBM backend, otherwise NumPy
     if backend_type == "ibm":
         # Get IBM backend first for QRNG
         backend = get_backend_service("ibm", api_token=api_token)
-        # Generate random bits using QRNG
-        abits = np.array(generate_qrng_bits(bit_num, backend, shots=1)).astype(int)
-        abase = np.array(generate_qrng_bits(bit_num, backend, shots=1)).astype(int)
-        ebase = np.array(generate_qrng_bits(bit_num, backend, shots=1)).astype(int)
-        bbase = np.array(generate_qrng_bits(bit_num, backend, shots=1)).astype(int)
+        # QRNG draws, Eve's job and the dependent Eve -> Bob job share one runtime
+        # Session (Batch on plans without sessions): one queue wait
+        runtime = open_mode(backend)
     else:
-        # Use NumPy random for local backend
-        abits = rng.integers(0, 2, bit_num)
-        abase = rng.integers(0, 2, bit_num)
-        ebase = rng.integers(0, 2, bit_num)
-        bbase = rng.integers(0, 2, bit_num)
+        runtime = nullcontext()
 
-    # --- Sender prepares and sends qubits ---
-    qr = QuantumRegister(bit_num, "q")
-    cr = ClassicalRegister(bit_num, "c")
-    qc = QuantumCircuit(qr, cr)
-    for i in range(bit_num):
-        if abits[i] == 1:
-            qc.x(i)
-        if abase[i] == 1:
-            qc.h(i)
-    for i in range(bit_num):
-        if ebase[i] == 1:
-            qc.h(i)
-        qc.measure(i, i)
-    # Backend execution (Eve)
-    if backend_type == "local":
-        if not HAS_AER:
-            raise RuntimeError("AerSimulator not available.")
-        backend = AerSimulator()
-        sampler = BackendSamplerV2(backend=backend)
-        qc_isa = qc
-    else:
-        pm = generate_preset_pass_manager(target=backend.target, optimization_level=1)
-        qc_isa = pm.run(qc)
-        sampler = Sampler(mode=backend)
-    result = sampler.run([qc_isa], shots=shots).result()
-    # --- Robust counts extraction for Eve ---
-    counts = None
-    if hasattr(result, "quasi_dists"):
-        counts = {}
-        bit_num_circuit = qc_isa.num_qubits
-        for dist in result.quasi_dists:
-            for k, v in dist.items():
-                counts[format(k, f"0{bit_num_circuit}b")] = v
-            break
-    if counts is None or not counts:
-        try:
-            for quasi_dist in result:
-                if hasattr(quasi_dist, 'data'):
-                    if hasattr(quasi_dist.data, 'c'):
-                        counts = quasi_dist.data.c.get_counts()
-                    else:
-                        counts = quasi_dist.data.get_counts()
-                break
-        except (TypeError, AttributeError, IndexError):
-            pass
-        if counts is None:
-            try:
-                quasi_dist = result[0]
-                if hasattr(quasi_dist, 'data'):
-                    if hasattr(quasi_dist.data, 'c'):
-                        counts = quasi_dist.data.c.get_counts()
-                    else:
-                        counts = quasi_dist.data.get_counts()
-            except (TypeError, AttributeError, IndexError):
-                pass
-        if counts is None:
-            try:
-                if hasattr(result, 'get_counts'):
-                    counts = result.get_counts()
-                elif hasattr(result, '__iter__'):
-                    items = list(result)
-                    if items:
-                        counts = items[0].data.c.get_counts() if hasattr(items[0].data, 'c') else items[0].data.get_counts()
-            except (TypeError, AttributeError, Exception):
-                pass
-    if counts is None or not counts:
-        raise RuntimeError("Failed to extract counts from sampler result. Try using AerSimulator or check qiskit version.")
-    eve_key = extract_bitstring(counts, bit_num)
-    ebits = [int(b) for b in eve_key][::-1]
-    # Eve → Bob
-    qr2 = QuantumRegister(bit_num, "q")
-    cr2 = ClassicalRegister(bit_num, "c")
-    qc2 = QuantumCircuit(qr2, cr2)
-    for i in range(bit_num):
-        if ebits[i] == 1:
-            qc2.x(i)
-        if ebase[i] == 1:
-            qc2.h(i)
-    for i in range(bit_num):
-        if bbase[i] == 1:
-            qc2.h(i)
-        qc2.measure(i, i)
-    qc2_isa = qc2 if backend_type == "local" else pm.run(qc2)
-    result2 = sampler.run([qc2_isa], shots=shots).result()
-    # --- Robust counts extraction for Bob ---
-    counts2 = None
-    if hasattr(result2, "quasi_dists"):
-        counts2 = {}
-        bit_num_circuit2 = qc2_isa.num_qubits
-        for dist in result2.quasi_dists:
-            for k, v in dist.items():
-                counts2[format(k, f"0{bit_num_circuit2}b")] = v
-            break
-    if counts2 is None or not counts2:
-        try:
-            for quasi_dist in result2:
-                if hasattr(quasi_dist, 'data'):
-                    if hasattr(quasi_dist.data, 'c'):
-                        counts2 = quasi_dist.data.c.get_counts()
-                    else:
-                        counts2 = quasi_dist.data.get_counts()
-                break
-        except (TypeError, AttributeError, IndexError):
-            pass
-        if counts2 is None:
-            try:
-                quasi_dist = result2[0]
-                if hasattr(quasi_dist, 'data'):
-                    if hasattr(quasi_dist.data, 'c'):
-                        counts2 = quasi_dist.data.c.get_counts()
-                    else:
-                        counts2 = quasi_dist.data.get_counts()
-            except (TypeError, AttributeError, IndexError):
-                pass
-        if counts2 is None:
-            try:
-                if hasattr(result2, 'get_counts'):
-                    counts2 = result2.get_counts()
-                elif hasattr(result2, '__iter__'):
-                    items = list(result2)
-                    if items:
-                        counts2 = items[0].data.c.get_counts() if hasattr(items[0].data, 'c') else items[0].data.get_counts()
-            except (TypeError, AttributeError, Exception):
-                pass
-    if counts2 is None or not counts2:
-        raise RuntimeError("Failed to extract counts from sampler result. Try using AerSimulator or check qiskit version.")
-    bob_key = extract_bitstring(counts2, bit_num)
-    bbits = [int(b) for b in bob_key][::-1]
+    with runtime as mode:
+        # Generate random bits: use QRNG if IBM backend, otherwise NumPy
+        if backend_type == "ibm":
+            # Generate random bits using QRNG, one job with a PUB per draw
+            with timed("qrng", experiment="exp3"):
+                draws = generate_qrng_draws(bit_num, 4, backend, mode=mode, api_token=api_token)
+                abits, abase, ebase, bbase = (np.array(d).astype(int) for d in draws)
+        else:
+            # Use NumPy random for local backend
+            abits = rng.integers(0, 2, bit_num)
+            abase = rng.integers(0, 2, bit_num)
+            ebase = rng.integers(0, 2, bit_num)
+            bbase = rng.integers(0, 2, bit_num)
+
+        # --- Sender prepares and sends qubits ---
+        qr = QuantumRegister(bit_num, "q")
+        cr = ClassicalRegister(bit_num, "c")
+        qc = QuantumCircuit(qr, cr)
+        for i in range(bit_num):
+            if abits[i] == 1:
+                qc.x(i)
+            if abase[i] == 1:
+                qc.h(i)
+        for i in range(bit_num):
+            if ebase[i] == 1:
+                qc.h(i)
+            qc.measure(i, i)
+        # Backend execution (Eve)
+        if backend_type == "local":
+            if not HAS_AER:
+                raise RuntimeError("AerSimulator not available.")
+            backend = get_local_simulator(noise_profile)
+            qc_isa = qc
+            # Eve -> Bob (built later) has the same gate set, so one policy covers both stages
+            sampler, simulator = local_sampler(BackendSamplerV2, backend, [qc_isa])
+            runtime_mode = None
+        else:
+            pm = generate_preset_pass_manager(target=backend.target, optimization_level=1)
+            with timed("transpile", experiment="exp3"):
+                qc_isa = pm.run(qc)
+            sampler = runtime_sampler(mode, api_token)
+            simulator = None
+            runtime_mode = mode_name(mode)
+        with timed("sampler_run", experiment="exp3"):
+            result = sampler.run([qc_isa], shots=shots).result()
+        with timed("counts_extraction", experiment="exp3"):
+            eve_measured = measured_bits(result, num_bits=bit_num)
+        ebits = eve_measured.most_likely().tolist()
+        eve_key = "".join(map(str, ebits[::-1]))
+        # Eve → Bob
+        qr2 = QuantumRegister(bit_num, "q")
+        cr2 = ClassicalRegister(bit_num, "c")
+        qc2 = QuantumCircuit(qr2, cr2)
+        for i in range(bit_num):
+            if ebits[i] == 1:
+                qc2.x(i)
+            if ebase[i] == 1:
+                qc2.h(i)
+        for i in range(bit_num):
+            if bbase[i] == 1:
+                qc2.h(i)
+            qc2.measure(i, i)
+        with timed("transpile", experiment="exp3"):
+            qc2_isa = qc2 if backend_type == "local" else pm.run(qc2)
+        with timed("sampler_run", experiment="exp3"):
+            result2 = sampler.run([qc2_isa], shots=shots).result()
+    with timed("counts_extraction", experiment="exp3"):
+        bob_measured = measured_bits(result2, num_bits=bit_num)
+    bbits = bob_measured.most_likely().tolist()
+    bob_key = "".join(map(str, bbits[::-1]))
 
     # --- Sifting: Alice and Bob compare bases over public channel ---
-    agood, bgood = [], []
-    for i in range(bit_num):
-        if abase[i] == bbase[i]:
-            agood.append(int(abits[i]))
-            bgood.append(int(bbits[i]))
+    with timed("sifting", experiment="exp3"):
+        sifted = sift(abits, abase, bbits[:bit_num], bbase)
+        agood = sifted["alice"].tolist()
+        bgood = sifted["bob"].tolist()
     sifted_key_len = len(agood)
 
     # --- Key length limitation for testing ---
@@ -225,9 +163,9 @@ def run_exp3(message=None, bit_num=20, backend_type="local", api_token=None, sho
         bgood = bgood[:sifted_key_len]
 
     # --- Compute fidelity: compare Alice and Bob's sifted keys ---
-    matches = sum(1 for a, b in zip(agood, bgood) if a == b)
-    mismatches = sum(1 for a, b in zip(agood, bgood) if a != b)
     sifted_len = len(agood)
+    mismatches = int(np.count_nonzero(sifted["alice"][:sifted_len] != sifted["bob"][:sifted_len]))
+    matches = sifted_len - mismatches
     fidelity = matches / sifted_len if sifted_len > 0 else 0.0
     loss = 1 - fidelity if sifted_len > 0 else 1.0
     qber = mismatches / sifted_len if sifted_len > 0 else 0.0
@@ -248,6 +186,9 @@ def run_exp3(message=None, bit_num=20, backend_type="local", api_token=None, sho
         "message": message,
         "bit_num": bit_num,
         "backend_type": backend_type,
+        "noise_profile": noise_profile,
+        "simulator": simulator,
+        "runtime_mode": runtime_mode,
         "sifted_key_len": sifted_key_len,
         "Sender_bits": abits.tolist() if isinstance(abits, np.ndarray) else list(abits),
         "Sender_bases": abase.tolist() if isinstance(abase, np.ndarray) else list(abase),
@@ -258,10 +199,11 @@ def run_exp3(message=None, bit_num=20, backend_type="local", api_token=None, sho
         "bgoodbits": bgood,
         "eve_key": eve_key,
         "bob_key": bob_key,
-        "counts": counts,
-        "counts2": counts2,
+        "counts": eve_measured.get_counts(),
+        "counts2": bob_measured.get_counts(),
         "fidelity": fidelity,
         "qber": qber,
+        "qber_ci": [sifted["qber_low"], sifted["qber_high"]],
         "loss": loss,
         "abort_reason": abort_reason,
         "circuit_diagram_url": circuit_diagram_url,
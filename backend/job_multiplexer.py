@@ -0,0 +1,193 @@
+"""
+Runtime Job Multiplexer
+
+One asyncio event loop, in a dedicated daemon thread, owns every pending
+IBM Runtime job of this worker. Callers get a concurrent.futures.Future per
+job instead of each blocking in job.result(), which polls the API every
+0.1-0.5 s on its own.
+
+Design:
+- track(job) hands a submitted job to the loop and returns a Future;
+  wait(job) is the blocking bridge for the synchronous experiment code,
+  gather(jobs) waits for several jobs at once
+- Each job is one coroutine: it polls job.status(), sleeping between polls
+  for poll_ratio x the time spent in the current status, clamped to
+  [min_interval, max_interval]. A status change (QUEUED -> RUNNING) resets
+  the clock, so a job that has queued for an hour is polled every
+  max_interval while one that just started running is polled quickly.
+  The wait overshoots a job's completion by at most poll_ratio of its time
+  in that status (or max_interval)
+- status() and result() are blocking HTTP calls, so they run on a small
+  shared thread pool (QKD_JOB_POLL_THREADS); hundreds of pending jobs need
+  the loop thread plus these few pollers
+- Up to max_status_errors consecutive status() errors are tolerated
+  (transient network failures) before the Future fails
+- The loop starts lazily on first use and again after a fork, so every
+  gunicorn worker gets its own
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FINAL_STATES = frozenset({"DONE", "ERROR", "CANCELLED"})
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def job_status(job):
+    """Job status as an upper-case name (RuntimeJobV2 str or JobStatus enum)."""
+    status = job.status()
+    return str(getattr(status, "name", status)).upper()
+
+
+class JobMultiplexer:
+    """
+    Event loop thread tracking many runtime jobs.
+
+    Args:
+        min_interval (float): Shortest time between two polls of a job (s)
+        max_interval (float): Longest time between two polls of a job (s)
+        poll_ratio (float): Poll interval as a fraction of the time spent
+            in the current status
+        poll_threads (int): Threads for the blocking status()/result() calls
+        max_status_errors (int): Consecutive status() errors before failing
+    """
+
+    def __init__(self, min_interval=0.1, max_interval=30.0, poll_ratio=0.2, poll_threads=4,
+                 max_status_errors=5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.poll_ratio = poll_ratio
+        self.poll_threads = max(1, poll_threads)
+        self.max_status_errors = max_status_errors
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._executor = None
+        self._stats = {"tracked": 0, "pending": 0, "polls": 0, "done": 0, "failed": 0}
+
+    # ---------------- loop thread ----------------
+    def _ensure_loop(self):
+        if self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use, or a forked child that inherited a dead loop thread
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="job-multiplexer", daemon=True)
+                thread.start()
+                self._executor = ThreadPoolExecutor(self.poll_threads, thread_name_prefix="job-poll")
+                self._loop = loop
+                self._pid = os.getpid()
+        return self._loop
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._stats[key] += delta
+
+    def interval(self, elapsed):
+        """Seconds until the next poll of a job `elapsed` s into its status."""
+        return min(self.max_interval, max(self.min_interval, elapsed * self.poll_ratio))
+
+    # ---------------- coroutines ----------------
+    async def watch(self, job):
+        """
+        Wait (on the loop) until `job` reaches a final state.
+
+        Returns:
+            job.result()
+
+        Raises:
+            Whatever job.result() raises for a failed or cancelled job, or the
+            last status() error after max_status_errors in a row
+        """
+        loop = asyncio.get_running_loop()
+        status, since, errors = None, time.monotonic(), 0
+        while True:
+            try:
+                current = await loop.run_in_executor(self._executor, job_status, job)
+                errors = 0
+            except Exception:
+                errors += 1
+                if errors >= self.max_status_errors:
+                    raise
+                current = status
+            self._count(polls=1)
+            if current in FINAL_STATES:
+                break
+            if current != status:
+                status, since = current, time.monotonic()
+            await asyncio.sleep(self.interval(time.monotonic() - since))
+        return await loop.run_in_executor(self._executor, job.result)
+
+    async def _track(self, job):
+        try:
+            result = await self.watch(job)
+        except BaseException:
+            self._count(pending=-1, failed=1)
+            raise
+        self._count(pending=-1, done=1)
+        return result
+
+    # ---------------- thread-safe API ----------------
+    def track(self, job):
+        """
+        Hand a submitted job to the loop.
+
+        Returns:
+            concurrent.futures.Future: Resolves to job.result()
+        """
+        loop = self._ensure_loop()
+        self._count(tracked=1, pending=1)
+        return asyncio.run_coroutine_threadsafe(self._track(job), loop)
+
+    def wait(self, job, timeout=None):
+        """Blocking bridge: job.result(), with polling done by the loop."""
+        return self.track(job).result(timeout)
+
+    def gather(self, jobs, timeout=None):
+        """Results of several jobs, waited for concurrently."""
+        futures = [self.track(job) for job in jobs]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        return [f.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                for f in futures]
+
+    def stats(self):
+        """
+        Returns:
+            dict: tracked/pending/done/failed jobs, status polls so far and
+                  the polling configuration
+        """
+        with self._lock:
+            s = dict(self._stats)
+        s["poll_interval_s"] = [self.min_interval, self.max_interval]
+        s["poll_ratio"] = self.poll_ratio
+        return s
+
+
+# Worker-wide multiplexer (QKD_JOB_POLL_* environment variables)
+multiplexer = JobMultiplexer(
+    min_interval=_env_float("QKD_JOB_POLL_MIN", 0.1),
+    max_interval=_env_float("QKD_JOB_POLL_MAX", 30.0),
+    poll_ratio=_env_float("QKD_JOB_POLL_RATIO", 0.2),
+    poll_threads=int(_env_float("QKD_JOB_POLL_THREADS", 4)),
+)
+
+
+def wait(job, timeout=None):
+    """job.result() through the worker-wide multiplexer."""
+    return multiplexer.wait(job, timeout)
+
+
+def stats():
+    """Statistics of the worker-wide multiplexer."""
+    return multiplexer.stats()
@@ -0,0 +1,276 @@
+"""
+QKD Key Pool
+
+Keeps the keys distilled by exp1/exp2 instead of returning them once, and
+delivers them to applications (SAEs, secure application entities) in the
+style of ETSI GS QKD 014: the master SAE asks for keys with enc_keys and
+gets key IDs, the slave SAE fetches the same keys by ID with dec_keys.
+
+Design:
+- One pool per (master SAE, slave SAE) pair. Deposits append the leading
+  final_secret_key_bits of a hex key, bit-packed: whole bytes go to a
+  bytearray, the (< 8) leftover bits wait for the next deposit
+- enc_keys cuts whole keys off the front of the buffer. The bytes are
+  zeroed, then deleted; CPython deletes a bytearray prefix by moving its
+  start pointer, so a key costs O(key size) whatever the pool holds
+- Issued keys wait in an insertion-ordered dict until dec_keys pops them;
+  key material is held once for delivery to the slave and never again.
+  Beyond max_issued the oldest undelivered keys are discarded
+- Deposits beyond max_bits are dropped (and counted), as are keys of
+  results whose QBER exceeds the 11% BB84 bound
+- status() reports capacity (stored bits and keys of the default size) and
+  throughput (deposited and served bits per second since the pool was
+  created)
+
+A deposited key is removed from the experiment result (final_secret_key
+becomes None, key_pool_bits records what was stored), so key material that
+the pool serves was never part of an HTTP response or a cached result.
+
+Pools live in the memory of the server process: enc_keys and dec_keys of a
+key (and OTP encrypt/decrypt) must reach the same process, so the deploy
+(Procfile, railway.json, nixpacks.toml) runs a single gunicorn worker.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+QBER_THRESHOLD = 11.0  # percent, as in experiment results
+MASTER_SAE_ID = os.getenv("QKD_MASTER_SAE_ID", "alice")
+SLAVE_SAE_ID = os.getenv("QKD_SLAVE_SAE_ID", "bob")
+KME_ID = os.getenv("QKD_KME_ID", "kme-local")
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+KEY_SIZE = _env_int("QKD_KEY_SIZE", 256)
+MAX_KEY_SIZE = 8192
+MIN_KEY_SIZE = 8
+MAX_KEY_PER_REQUEST = _env_int("QKD_MAX_KEY_PER_REQUEST", 128)
+MAX_BITS = _env_int("QKD_KEY_POOL_MAX_BITS", 1 << 23)
+MAX_ISSUED = _env_int("QKD_KEY_POOL_MAX_ISSUED", 4096)
+
+
+class KeyPoolEmpty(RuntimeError):
+    """Not enough key material for the request."""
+
+
+class KeyPool:
+    """
+    Key material shared by one master/slave SAE pair.
+
+    Args:
+        master (str): Master SAE ID (calls enc_keys)
+        slave (str): Slave SAE ID (calls dec_keys)
+        max_bits (int): Capacity of the buffer in bits
+        max_issued (int): Keys kept for dec_keys before the oldest are dropped
+    """
+
+    def __init__(self, master, slave, max_bits=MAX_BITS, max_issued=MAX_ISSUED):
+        self.master = master
+        self.slave = slave
+        self.max_bytes = max(1, max_bits // 8)
+        self.max_issued = max_issued
+        self._buffer = bytearray()
+        self._tail = 0       # leftover bits of the last deposit, as an integer
+        self._tail_bits = 0
+        self._issued = OrderedDict()
+        self._lock = threading.Lock()
+        self._created = time.monotonic()
+        self._stats = {"deposited_bits": 0, "dropped_bits": 0, "served_keys": 0,
+                       "served_bits": 0, "delivered_keys": 0, "expired_keys": 0}
+
+    # ---------------- deposits ----------------
+    def deposit(self, hex_key, num_bits):
+        """
+        Append the first `num_bits` bits of a hex key.
+
+        Returns:
+            int: Bits added to the buffer (whole bytes, including leftover
+                 bits of earlier deposits; excess bits are dropped)
+        """
+        num_bits = min(num_bits, len(hex_key) * 4)
+        if num_bits <= 0:
+            return 0
+        value = int(hex_key, 16) >> (len(hex_key) * 4 - num_bits)
+        with self._lock:
+            value |= self._tail << num_bits
+            total = self._tail_bits + num_bits
+            self._tail_bits = total % 8
+            self._tail = value & ((1 << self._tail_bits) - 1)
+            whole = value >> self._tail_bits
+            nbytes = total // 8
+            room = self.max_bytes - len(self._buffer)
+            if nbytes > room:
+                # Keep the oldest bytes of this deposit, drop what does not fit
+                whole >>= 8 * (nbytes - room)
+                self._stats["dropped_bits"] += 8 * (nbytes - room)
+                nbytes = room
+            self._buffer += whole.to_bytes(nbytes, "big")
+            self._stats["deposited_bits"] += 8 * nbytes
+        return 8 * nbytes
+
+    # ---------------- delivery ----------------
+    def enc_keys(self, number=1, size=KEY_SIZE):
+        """
+        Take `number` keys of `size` bits out of the pool.
+
+        Returns:
+            list: [{"key_ID": str, "key": bytearray}]
+
+        Raises:
+            ValueError: If number or size is out of range
+            KeyPoolEmpty: If the pool holds fewer than number x size bits
+        """
+        validate_request(number, size)
+        nbytes = size // 8
+        with self._lock:
+            if number * nbytes > len(self._buffer):
+                raise KeyPoolEmpty(
+                    f"{number} key(s) of {size} bits requested, {8 * len(self._buffer)} bits available")
+            keys = [self._issue(nbytes) for _ in range(number)]
+        return keys
+
+    def take(self, nbytes):
+        """
+        One key of `nbytes` bytes, without the enc_keys size limits (for
+        one-time-pad streams, see otp_stream.py).
+
+        Returns:
+            dict: {"key_ID": str, "key": bytearray}
+
+        Raises:
+            KeyPoolEmpty: If the pool holds fewer than nbytes bytes
+        """
+        if nbytes < 1:
+            raise ValueError("key length must be at least one byte")
+        with self._lock:
+            if nbytes > len(self._buffer):
+                raise KeyPoolEmpty(
+                    f"{8 * nbytes} key bits requested, {8 * len(self._buffer)} bits available")
+            return self._issue(nbytes)
+
+    def _issue(self, nbytes):
+        # Caller holds the lock and checked the length
+        key = bytearray(self._buffer[:nbytes])
+        self._buffer[:nbytes] = bytes(nbytes)
+        del self._buffer[:nbytes]
+        key_id = str(uuid.uuid4())
+        self._issued[key_id] = bytearray(key)
+        while len(self._issued) > self.max_issued:
+            self._issued.popitem(last=False)
+            self._stats["expired_keys"] += 1
+        self._stats["served_keys"] += 1
+        self._stats["served_bits"] += 8 * nbytes
+        return {"key_ID": key_id, "key": key}
+
+    def dec_keys(self, key_ids):
+        """
+        Hand the keys issued under `key_ids` to the slave SAE, once.
+
+        Returns:
+            list: [{"key_ID": str, "key": bytearray}]
+
+        Raises:
+            KeyError: If an ID is unknown or already delivered (no key is
+                      delivered then)
+        """
+        with self._lock:
+            missing = [k for k in key_ids if k not in self._issued]
+            if missing or len(set(key_ids)) != len(key_ids):
+                raise KeyError(f"unknown or already delivered key_ID: {(missing or key_ids)[0]}")
+            keys = [{"key_ID": k, "key": self._issued.pop(k)} for k in key_ids]
+            self._stats["delivered_keys"] += len(keys)
+        return keys
+
+    def status(self, size=KEY_SIZE):
+        """
+        Returns:
+            dict: ETSI status fields (stored_key_count of `size`-bit keys,
+                  limits) plus stored/pending bits, deposit and delivery
+                  totals and their rates per second
+        """
+        with self._lock:
+            s = dict(self._stats)
+            stored_bits = 8 * len(self._buffer)
+            pending_bits = self._tail_bits
+            issued = len(self._issued)
+        elapsed = max(time.monotonic() - self._created, 1e-9)
+        return {
+            "source_KME_ID": KME_ID,
+            "target_KME_ID": KME_ID,
+            "master_SAE_ID": self.master,
+            "slave_SAE_ID": self.slave,
+            "key_size": size,
+            "stored_key_count": stored_bits // size,
+            "max_key_count": 8 * self.max_bytes // size,
+            "max_key_per_request": MAX_KEY_PER_REQUEST,
+            "max_key_size": MAX_KEY_SIZE,
+            "min_key_size": MIN_KEY_SIZE,
+            "max_SAE_ID_count": 0,
+            "stored_bits": stored_bits,
+            "pending_bits": pending_bits,
+            "issued_keys": issued,
+            **s,
+            "deposited_bits_per_s": s["deposited_bits"] / elapsed,
+            "served_bits_per_s": s["served_bits"] / elapsed,
+            "served_keys_per_s": s["served_keys"] / elapsed,
+        }
+
+
+def validate_request(number, size):
+    """Raise ValueError unless number and size are valid for enc_keys."""
+    if not 1 <= number <= MAX_KEY_PER_REQUEST:
+        raise ValueError(f"number must be between 1 and {MAX_KEY_PER_REQUEST}")
+    if not MIN_KEY_SIZE <= size <= MAX_KEY_SIZE or size % 8:
+        raise ValueError(f"size must be a multiple of 8 between {MIN_KEY_SIZE} and {MAX_KEY_SIZE}")
+
+
+# ---------------- worker-wide pools ----------------
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(master, slave, create=False):
+    """
+    Pool of a master/slave SAE pair.
+
+    Raises:
+        KeyError: If the pair has no pool and create is False
+    """
+    with _pools_lock:
+        pool = _pools.get((master, slave))
+        if pool is None:
+            if not create:
+                raise KeyError(f"no keys shared between SAE {master} and SAE {slave}")
+            pool = _pools[(master, slave)] = KeyPool(master, slave)
+    return pool
+
+
+def deposit_result(result, master=MASTER_SAE_ID, slave=SLAVE_SAE_ID):
+    """
+    Move the distilled key of an exp1/exp2 (or batch) result into the pool.
+
+    The key is taken out of `result` (final_secret_key set to None,
+    key_pool_bits set), so it is never returned to the client or cached.
+
+    Returns:
+        int: Bits stored; 0 without a key or above the QBER bound (the
+             result keeps its key then)
+    """
+    key = result.get("final_secret_key")
+    num_bits = result.get("final_secret_key_bits") or 0
+    if not key or not num_bits or result.get("qber", 100.0) > QBER_THRESHOLD:
+        return 0
+    stored = get_pool(master, slave, create=True).deposit(key, num_bits)
+    result["final_secret_key"] = None
+    result["key_pool_bits"] = stored
+    return stored
+
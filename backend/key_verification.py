@@ -0,0 +1,166 @@
+"""
+Post-Reconciliation Key Verification
+
+Checks that Alice's and Bob's keys match after error correction by comparing
+short universal hash tags, so a residual error is caught before privacy
+amplification instead of producing two different final keys.
+
+Algorithm:
+1. The key is bit-packed into 16-bit words w_1..w_d, prefixed with its
+   length (two words), and read as a polynomial over GF(p), p = 2^31 - 1 (Mersenne)
+2. Alice draws k random points r and sends r and h(r) = sum w_i r^i mod p;
+   Bob evaluates his key at the same points. Two different keys collide at
+   a point with probability <= d/p, at all k with (d/p)^k; k is the
+   smallest count reaching `epsilon`
+3. Each tag value is public: 31 bits per point count as leaked (the points
+   themselves are independent of the key)
+4. A mismatch re-runs reconciliation on Bob's key (Cascade with a fresh
+   shuffle finds errors the last pass missed) and verifies again with new
+   points; after max_attempts the key is discarded
+
+Evaluation is vectorized: the words form an m x c matrix (c ~ sqrt(d)) and
+h(r) = sum_j r^j (sum_i w_ij (r^c)^i): one float64 matrix product (BLAS,
+exact because operands are split into 16-bit halves) plus O(sqrt(d))
+powers, reduced by Mersenne folding instead of division.
+"""
+
+import math
+
+import numpy as np
+
+PRIME = (1 << 31) - 1
+POINT_BITS = 31
+EPSILON = 1e-12
+MAX_ATTEMPTS = 2
+
+
+def _fold(x):
+    # x mod PRIME for uint64 x < 2^63, without division
+    x = (x & PRIME) + (x >> 31)
+    x = (x & PRIME) + (x >> 31)
+    return np.where(x >= PRIME, x - PRIME, x)
+
+
+def _powers(points, n):
+    # (k, n) array of r^0 .. r^(n-1) mod PRIME for each point r, by doubling
+    out = np.empty((len(points), n), dtype=np.uint64)
+    out[:, 0] = 1
+    step = points.astype(np.uint64)[:, None]
+    filled = 1
+    while filled < n:
+        size = min(filled, n - filled)
+        out[:, filled:filled + size] = _fold(out[:, :size] * step)
+        step = _fold(step * step)
+        filled += size
+    return out
+
+
+def _word_matrix(bits):
+    # 16-bit words of the length prefix and the key, zero-padded to rows x cols
+    packed = np.packbits(np.asarray(bits, dtype=np.uint8))
+    count = (len(packed) + 1) // 2 + 2
+    cols = math.isqrt(count - 1) + 1
+    rows = -(-count // cols)
+    words = np.zeros(rows * cols)
+    # Length prefix (two words): keys differing only in trailing zeros differ
+    words[0], words[1] = len(bits) >> 16 & 0xFFFF, len(bits) & 0xFFFF
+    words[2:2 + len(packed) // 2] = packed[:len(packed) // 2 * 2].view(">u2")
+    if len(packed) % 2:
+        words[count - 1] = int(packed[-1]) << 8
+    return words.reshape(rows, cols)
+
+
+def _degree(key_bits):
+    return math.ceil(key_bits / 16) + 2
+
+
+def points_needed(key_bits, epsilon=EPSILON):
+    """
+    Evaluation points for a collision probability of at most epsilon.
+
+    Returns:
+        int: k with (d / p)^k <= epsilon, d = 16-bit words of the key
+             and its length
+    """
+    return max(1, math.ceil(math.log(epsilon) / math.log(_degree(key_bits) / PRIME)))
+
+
+def polynomial_hash(bits, points):
+    """
+    Evaluate the key polynomial at each point.
+
+    Args:
+        bits (array-like): Key bits (0/1)
+        points (array-like): Evaluation points in [0, PRIME)
+
+    Returns:
+        np.ndarray: uint64 hash values, one per point
+    """
+    matrix = _word_matrix(bits)
+    points = np.asarray(points, dtype=np.uint64)
+    k = len(points)
+    rows, cols = matrix.shape
+    inner = _powers(points, cols)
+    # Word i * cols + j has the coefficient (r^cols)^i * r^j
+    outer = _powers(_fold(inner[:, -1] * points), rows)
+    # Outer powers split into 16-bit halves: each product is below 2^32 and
+    # each sum below rows * 2^32 < 2^53, so the float64 (BLAS) product is exact
+    halves = np.concatenate([outer >> 16, outer & 0xFFFF]).astype(np.float64)
+    sums = (halves @ matrix).astype(np.uint64)
+    sums = _fold((_fold(sums[:k]) << 16) + _fold(sums[k:]))
+    return _fold(sums * inner).sum(axis=1) % PRIME
+
+
+def verify(alice_bits, bob_bits, epsilon=EPSILON, rng=None):
+    """
+    Compare hash tags of Alice's and Bob's keys.
+
+    Args:
+        alice_bits, bob_bits (array-like): Reconciled keys
+        epsilon (float): Bound on the probability that different keys pass
+        rng (np.random.Generator, optional): Source of the points
+
+    Returns:
+        dict: match (bool), points, tag_bits (leaked), epsilon (the bound
+              actually reached)
+    """
+    if len(alice_bits) != len(bob_bits):
+        raise ValueError("Alice and Bob bit sequences must have the same length")
+    rng = rng or np.random.default_rng()
+    k = points_needed(len(alice_bits), epsilon)
+    points = rng.integers(0, PRIME, k, dtype=np.uint64)
+    match = np.array_equal(polynomial_hash(alice_bits, points), polynomial_hash(bob_bits, points))
+    return {"match": bool(match), "points": k, "tag_bits": POINT_BITS * k,
+            "epsilon": (_degree(len(alice_bits)) / PRIME) ** k}
+
+
+def verify_reconciliation(alice_bits, bob_bits, reconcile=None, max_attempts=MAX_ATTEMPTS,
+                          epsilon=EPSILON, rng=None):
+    """
+    Verify a reconciled key, re-reconciling Bob's key on a mismatch.
+
+    Args:
+        alice_bits, bob_bits (list or np.ndarray): Alice's key and Bob's
+            corrected key
+        reconcile (callable, optional): reconcile(bob_bits) -> corrected bits,
+            run after a failed check; without it a failing key is discarded
+        max_attempts (int): Verifications before the key is discarded
+
+    Returns:
+        dict:
+            bob          Bob's verified key, None if discarded
+            verified     True if the tags matched
+            attempts     verifications run
+            leaked_bits  tag bits sent over all attempts
+    """
+    leaked = 0
+    for attempt in range(1, max(1, max_attempts) + 1):
+        check = verify(alice_bits, bob_bits, epsilon, rng)
+        leaked += check["tag_bits"]
+        if check["match"]:
+            return {"bob": bob_bits, "verified": True, "attempts": attempt, "leaked_bits": leaked}
+        if reconcile is None:
+            break
+        if attempt < max_attempts:
+            bob_bits = reconcile(bob_bits)
+    return {"bob": None, "verified": False, "attempts": attempt, "leaked_bits": leaked}
@@ -0,0 +1,259 @@
+"""
+Key Rate vs Distance Models
+
+Server-side, vectorized versions of the key-rate curves drawn by
+keyrate.html (secureRepeaterSingleLink, tfQKDRate) and KeyrateVsDistance.html
+(simulate). Every model is evaluated over a NumPy distance array for many
+parameter sets at once: each parameter may carry several values and the
+cartesian product of all values is broadcast against the distance axis.
+
+Models:
+- "repeater": trusted-repeater chain, each segment L / (repeaters + 1)
+- "tf":       illustrative twin-field scaling, R ~ sqrt(eta)
+- "bb84", "decoy", "e91", "cvqkd": single-link WCP model; "decoy" uses the
+  asymptotic GLLP rate from decoy_state instead of a fixed boost
+
+Results are cached per normalized parameter set (LRU), and each cached
+payload carries an ETag so clients can revalidate cheaply.
+"""
+
+import base64
+import hashlib
+import json
+import math
+from functools import lru_cache
+from itertools import product
+
+import numpy as np
+
+from decoy_state import binary_entropy, gllp_key_rate
+
+MAX_POINTS = 2_000_000
+CACHE_SIZE = 256
+
+MODEL_DEFAULTS = {
+    "repeater": {
+        "alpha": 0.2, "eta_det": 0.6, "f_rep": 10e6, "dark_count_rate": 100.0,
+        "e_channel": 0.01, "emission_prob": 1.0, "basis_sift_factor": 0.5, "repeaters": 0.0,
+    },
+    "tf": {"alpha": 0.2, "eta_det": 0.6, "f_rep": 10e6, "basis_sift_factor": 0.5},
+    "bb84": {"mu": 0.5, "eta": 0.6, "dark": 100.0, "rep_rate": 1e6, "alpha": 0.2, "e0": 0.01},
+}
+for _protocol in ("decoy", "e91", "cvqkd"):
+    MODEL_DEFAULTS[_protocol] = MODEL_DEFAULTS["bb84"]
+
+
+def distance_grid(max_distance=400.0, step=2.0):
+    """Distances 0..max_distance (inclusive) in km."""
+    _check_grid(max_distance, step)
+    return np.arange(0.0, max_distance + step / 2, step)
+
+
+def _check_grid(max_distance, step):
+    if not (math.isfinite(max_distance) and math.isfinite(step)) or step <= 0 or max_distance < 0:
+        raise ValueError("step must be positive and max_distance non-negative")
+
+
+def point_count(max_distance, step, params):
+    """
+    Number of (parameter set, distance) points a query evaluates to.
+
+    Computed from the list lengths alone, so oversized requests can be
+    rejected before any grid or combination list is allocated.
+    """
+    _check_grid(max_distance, step)
+    ratio = max_distance / step
+    if not math.isfinite(ratio):
+        return math.inf
+    distances = math.floor(ratio + 0.5) + 1
+    return math.prod(len(values) for _, values in params) * distances
+
+
+def check_size(max_distance, step, params):
+    """Raise ValueError if a query would exceed MAX_POINTS."""
+    if point_count(max_distance, step, params) > MAX_POINTS:
+        raise ValueError(f"Request exceeds {MAX_POINTS} points")
+
+
+def repeater_rate(L, alpha, eta_det, f_rep, dark_count_rate, e_channel,
+                  emission_prob, basis_sift_factor, repeaters=0):
+    """
+    Secure key rate of a chain of equal trusted-repeater segments.
+
+    Args:
+        L (np.ndarray): Total distances in km (broadcastable)
+        alpha (float or np.ndarray): Fiber loss in dB/km
+        eta_det (float or np.ndarray): Detector efficiency
+        f_rep (float or np.ndarray): Repetition rate in Hz
+        dark_count_rate (float or np.ndarray): Dark counts per second
+        e_channel (float or np.ndarray): Optical misalignment error
+        emission_prob (float or np.ndarray): Source emission probability
+        basis_sift_factor (float or np.ndarray): Sifting factor
+        repeaters (int or np.ndarray): Number of trusted repeaters
+
+    Returns:
+        tuple: (secure rate in bits/s, per-segment QBER)
+    """
+    seg_len = L / (np.asarray(repeaters) + 1)
+    eta_ch = 10 ** (-alpha * seg_len / 10)
+    p_signal = emission_prob * eta_ch * eta_det
+    dark_per_gate = dark_count_rate / f_rep
+    p_total = p_signal + dark_per_gate
+    r_raw = f_rep * p_signal * basis_sift_factor
+    qber = np.clip((0.5 * dark_per_gate + e_channel * p_signal) / np.maximum(p_total, 1e-30), 0, 0.4999)
+    return r_raw * np.maximum(0, 1 - 2 * _entropy(qber)), qber
+
+
+def tf_rate(L, alpha, eta_det, f_rep, basis_sift_factor):
+    """Illustrative twin-field rate with square-root loss scaling (bits/s)."""
+    eta = 10 ** (-alpha * L / 10)
+    return np.maximum(0, f_rep * basis_sift_factor * 0.2 * np.sqrt(eta) * eta_det)
+
+
+def wcp_rate(L, mu, eta, dark, rep_rate, alpha, e0, protocol="bb84"):
+    """
+    Single-link weak-coherent-pulse rate as in KeyrateVsDistance.html.
+
+    Args:
+        L (np.ndarray): Distances in km (broadcastable)
+        mu (float or np.ndarray): Mean photon number
+        eta (float or np.ndarray): Detector efficiency
+        dark (float or np.ndarray): Dark count rate in Hz
+        rep_rate (float or np.ndarray): Pulse rate in Hz
+        alpha (float or np.ndarray): Fiber loss in dB/km
+        e0 (float or np.ndarray): Optical misalignment error
+        protocol (str): "bb84", "decoy", "e91" or "cvqkd"
+
+    Returns:
+        tuple: (key rate in bits/s, QBER)
+    """
+    T = 10 ** (-alpha * L / 10)
+    S = mu * eta * rep_rate * T
+    qber = (e0 * S + 0.5 * dark) / (S + dark)
+
+    if protocol == "decoy":
+        # Asymptotic (infinite-decoy) estimates: Y1 = eta_sys + Y0
+        y0 = dark / rep_rate
+        eta_sys = eta * T
+        q_mu = y0 + 1 - np.exp(-eta_sys * mu)
+        e_mu = (0.5 * y0 + e0 * (1 - np.exp(-eta_sys * mu))) / q_mu
+        y1 = y0 + eta_sys
+        e1 = (0.5 * y0 + e0 * eta_sys) / y1
+        rate = rep_rate * gllp_key_rate(q_mu, e_mu, y1 * mu * np.exp(-mu), e1, q=1.0)
+        return rate, e_mu
+
+    rate = S * np.maximum(0, 1 - 2 * _entropy(qber))
+    if protocol == "e91":
+        qber = qber + 0.01
+        rate = rate * 0.9
+    elif protocol == "cvqkd":
+        qber = np.minimum(0.15, qber + 0.05)
+        rate = rate * 1.5
+    return rate, qber
+
+
+def _entropy(q):
+    # keyrate.html treats H(0) = H(1) = 0 exactly
+    return np.where((q <= 0) | (q >= 1), 0.0, binary_entropy(q))
+
+
+def normalize_query(args):
+    """
+    Turn request arguments into a hashable, canonical cache key.
+
+    Args:
+        args (Mapping): Query arguments; every model parameter may be a
+                        comma-separated list of values
+
+    Returns:
+        tuple: (model, max_distance, step, encoding, ((name, values), ...))
+    """
+    model = str(args.get("model", "repeater")).lower()
+    if model not in MODEL_DEFAULTS:
+        raise ValueError(f"Unknown model '{model}'")
+    encoding = str(args.get("encoding", "json")).lower()
+    if encoding not in ("json", "b64"):
+        raise ValueError("encoding must be 'json' or 'b64'")
+
+    params = []
+    for name, default in MODEL_DEFAULTS[model].items():
+        raw = args.get(name)
+        values = [default] if raw in (None, "") else [float(v) for v in str(raw).split(",") if v.strip()]
+        # 12 significant digits: slider jitter maps onto the same key
+        params.append((name, tuple(sorted({float(f"{v:.12g}") for v in values}))))
+
+    max_distance = float(f"{float(args.get('max_distance', 400)):.12g}")
+    step = float(f"{float(args.get('step', 2)):.12g}")
+    check_size(max_distance, step, params)
+    return model, max_distance, step, encoding, tuple(params)
+
+
+def evaluate(model, distances, params):
+    """
+    Evaluate a model for every combination of parameter values.
+
+    Args:
+        model (str): Model name (see MODEL_DEFAULTS)
+        distances (np.ndarray): Distance axis in km, shape (D,)
+        params (tuple): ((name, values), ...) as from normalize_query
+
+    Returns:
+        tuple: (list of parameter dicts, key_rate (S, D), qber (S, D) or None)
+    """
+    names = [name for name, _ in params]
+    if math.prod(len(values) for _, values in params) * len(distances) > MAX_POINTS:
+        raise ValueError(f"Request exceeds {MAX_POINTS} points")
+    combos = list(product(*[values for _, values in params]))
+
+    grid = np.array(combos, dtype=float).T[:, :, None]  # (P, S, 1)
+    kwargs = dict(zip(names, grid))
+    L = distances[None, :]
+
+    if model == "repeater":
+        rate, qber = repeater_rate(L, **kwargs)
+    elif model == "tf":
+        rate, qber = tf_rate(L, **kwargs), None
+    else:
+        rate, qber = wcp_rate(L, protocol=model, **kwargs)
+
+    shape = (len(combos), len(distances))
+    rate = np.broadcast_to(rate, shape)
+    qber = None if qber is None else np.broadcast_to(qber, shape)
+    return [dict(zip(names, c)) for c in combos], rate, qber
+
+
+def _encode(arr, encoding):
+    if encoding == "b64":
+        return base64.b64encode(np.ascontiguousarray(arr, dtype="<f4").tobytes()).decode("ascii")
+    # 6 significant digits keeps JSON short without visible loss on a chart
+    return np.char.mod("%.6g", arr).astype(float).tolist()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def keyrate_payload(key):
+    """
+    Build (and cache) the serialized response for a normalized query.
+
+    Args:
+        key (tuple): Output of normalize_query
+
+    Returns:
+        tuple: (JSON body str, ETag str)
+    """
+    model, max_distance, step, encoding, params = key
+    check_size(max_distance, step, params)
+    distances = distance_grid(max_distance, step)
+    param_sets, rate, qber = evaluate(model, distances, params)
+
+    body = {
+        "model": model,
+        "encoding": encoding,
+        "shape": [len(param_sets), len(distances)],
+        "distances": _encode(distances, encoding),
+        "params": param_sets,
+        "key_rate": _encode(rate, encoding),
+        "qber": None if qber is None else _encode(qber, encoding),
+    }
+    text = json.dumps(body, separators=(",", ":"))
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()
+    return text, etag
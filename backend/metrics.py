@@ -0,0 +1,236 @@
+"""
+Lightweight Stage Instrumentation
+
+Timers, histograms and counters for the slow stages of an experiment
+(QRNG, transpile, sampler run, counts extraction, sifting, Cascade, privacy
+amplification, circuit drawing, ...) exposed in Prometheus text format.
+
+Design:
+- Disabled unless QKD_METRICS=1: timed() then returns one shared no-op
+  context manager, so instrumented code pays a single function call
+- Enabled: each observation is a perf_counter() pair plus a bisect into fixed
+  histogram buckets under a lock
+- Gunicorn workers are separate processes. Without QKD_METRICS_DIR, /metrics
+  only shows the totals of the worker that happens to serve the scrape.
+  When it is set, every worker periodically writes its snapshot to
+  <dir>/metrics_<pid>.json (atomic replace), and /metrics merges all worker
+  files on scrape. Files of pids that no longer exist are skipped and
+  removed, so totals of dead or restarted workers drop out (the directory
+  must be local to the host running the workers)
+"""
+
+import contextlib
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+ENABLED = os.getenv("QKD_METRICS", "0").lower() in ("1", "true", "yes")
+METRICS_DIR = os.getenv("QKD_METRICS_DIR")
+FLUSH_INTERVAL = float(os.getenv("QKD_METRICS_FLUSH_INTERVAL", "5"))
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    "qkd_stage_duration_seconds": "Wall time spent in each experiment stage",
+    "qkd_http_request_duration_seconds": "Wall time of HTTP requests per endpoint",
+    "qkd_events_total": "Count of notable events (runs, fallbacks, errors)",
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_last_flush = 0.0
+_NOOP = contextlib.nullcontext()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name, value, **labels):
+    """Record one observation (seconds) into histogram `name`."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    slot = bisect_left(BUCKETS, value)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+        hist[0][slot] += 1
+        hist[1] += value
+    _maybe_flush()
+
+
+def inc(name, amount=1, **labels):
+    """Increment counter `name`."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    _maybe_flush()
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def timed(stage, **labels):
+    """
+    Context manager timing one stage into qkd_stage_duration_seconds.
+
+    Args:
+        stage (str): Stage name, e.g. "transpile" or "cascade"
+        **labels: Extra labels, e.g. experiment="exp1"
+
+    Returns:
+        Context manager (a shared no-op when metrics are disabled)
+    """
+    if not ENABLED:
+        return _NOOP
+    labels["stage"] = stage
+    return _Timer("qkd_stage_duration_seconds", labels)
+
+
+def instrumented(stage, **labels):
+    """
+    Decorator form of timed(). When metrics are disabled the function is
+    returned unchanged, so there is no per-call cost at all.
+    """
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ---------------- MULTI-WORKER AGGREGATION ----------------
+def _snapshot():
+    with _lock:
+        return {
+            "histograms": [[name, list(labels), list(h[0]), h[1]] for (name, labels), h in _histograms.items()],
+            "counters": [[name, list(labels), v] for (name, labels), v in _counters.items()],
+        }
+
+
+def _maybe_flush(force=False):
+    global _last_flush
+    if not METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"metrics_{os.getpid()}.json")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(_snapshot(), f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+def _merged():
+    if not METRICS_DIR:
+        return _snapshot()
+    _maybe_flush(force=True)
+    histograms, counters = {}, {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics_*.json")):
+        try:
+            pid = int(os.path.basename(path)[len("metrics_"):-len(".json")])
+        except ValueError:
+            continue
+        if not _pid_alive(pid):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            continue
+        try:
+            with open(path) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, buckets, total in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+    return {
+        "histograms": [[n, list(l), h[0], h[1]] for (n, l), h in histograms.items()],
+        "counters": [[n, list(l), v] for (n, l), v in counters.items()],
+    }
+
+
+def _fmt_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def render_prometheus():
+    """
+    Render all (merged) metrics in Prometheus text exposition format.
+
+    Returns:
+        str: Exposition text, version 0.0.4
+    """
+    snap = _merged()
+    lines = []
+    seen = set()
+    for name, labels, buckets, total in sorted(snap["histograms"]):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip(BUCKETS, buckets):
+            cumulative += count
+            lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', bound))} {cumulative}")
+        cumulative += buckets[-1]
+        lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {cumulative}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {total}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+    for name, labels, value in sorted(snap["counters"]):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,16 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import math
 import matplotlib.pyplot as plt
 import networkx as nx
+from multiuser_engine import (
+    simulate_network,
+    summarize,
+    simulate_schedule,
+    calculate_per_link_qber,
+    calculate_trusted_nodes,
+)
+from network_routing import TrustedNodeNetwork
 
 # --- Streamlit App ---
 st.set_page_config(page_title="Multi-user QKD BB84 Simulator", layout="wide")
@@ -17,6 +24,7 @@ link_length = st.sidebar.number_input("Link length per trusted node (km)", min_v
 n_users = st.sidebar.number_input("Number of receivers (N_users)", min_value=1, value=3)
 session_key_length = st.sidebar.selectbox("K_session length (bits)", [128, 256, 512, 1024])
 distribution_mode = st.sidebar.selectbox("Distribution mode", ["Sequential", "Parallel"])
+shared_trunk = st.sidebar.checkbox("Receivers share trusted nodes", value=False)
 detector_efficiency = st.sidebar.slider("Detector efficiency (%)", 0, 100, 90)
 dark_count_prob = st.sidebar.number_input("Dark count probability", 0.0, 0.01, 0.001)
 channel_attenuation = st.sidebar.number_input("Channel attenuation (dB/km)", 0.0, 1.0, 0.2)
@@ -29,57 +37,40 @@ for i in range(1, n_users + 1):
     d = st.sidebar.number_input(f"Distance to Bob{i} (km)", min_value=1, value=int(total_distance*i/n_users))
     user_distances.append(d)
 
-# --- 2. Derived Parameters Calculation Functions ---
-def calculate_trusted_nodes(distance, link_length):
-    return math.ceil(distance / link_length)
-
-def calculate_per_link_qber(detector_eff, dark_count, attenuation, misalignment):
-    # Simplified QBER formula
-    qber = (100 - detector_eff) * 0.01 + dark_count*100 + misalignment
-    return round(qber, 2)
-
-def calculate_end_to_end_qber(per_link_qber, n_hops):
-    # Approximate: Q_total = 1 - (1 - qber_per_link)^n
-    q_total = 1 - ((1 - per_link_qber/100) ** n_hops)
-    return round(q_total * 100, 2)
-
-def calculate_key_rate(end_to_end_qber, base_rate=50):
-    # Simplified formula: key rate decreases with QBER
-    rate = base_rate * (1 - end_to_end_qber/100)
-    return round(rate, 2)
-
-def calculate_time_to_form_key(session_length, key_rate, n_hops, latency):
-    # Total time = session_length / key_rate + hop latencies
-    t = session_length / key_rate + n_hops * latency / 1000.0  # convert ms to s
-    return round(t, 2)
-
-# --- 3. Simulate per-user ---
-data = []
-for i, dist in enumerate(user_distances):
-    user_name = f"Bob{i+1}"
-    n_hops = calculate_trusted_nodes(dist, link_length)
-    per_link_qber = calculate_per_link_qber(detector_efficiency, dark_count_prob, channel_attenuation, misalignment_error)
-    end_to_end_qber = calculate_end_to_end_qber(per_link_qber, n_hops)
-    key_rate = calculate_key_rate(end_to_end_qber)
-    time_to_form = calculate_time_to_form_key(session_key_length, key_rate, n_hops, key_relay_latency)
-    success_flag = "✔" if key_rate > 0 else "✖"
-    data.append([user_name, dist, n_hops, per_link_qber, end_to_end_qber, key_rate, success_flag, time_to_form, session_key_length])
+# --- 2./3. Simulate all receivers with the vectorized engine ---
+results = simulate_network(
+    user_distances,
+    link_length=link_length,
+    session_key_length=session_key_length,
+    detector_efficiency=detector_efficiency,
+    dark_count_prob=dark_count_prob,
+    channel_attenuation=channel_attenuation,
+    misalignment_error=misalignment_error,
+    key_relay_latency=key_relay_latency,
+)
 
 # --- 4. Output Table ---
-df = pd.DataFrame(data, columns=[
-    "Receiver", "Distance (km)", "Trusted Nodes", "Per-link QBER (%)",
-    "End-to-end QBER (%)", "End-to-end Key Rate (kbps)", "K_session formed?", 
-    "Time to Form Key (s)", "Final Key Length (bits)"
-])
+df = pd.DataFrame({
+    "Receiver": [f"Bob{i}" for i in results["receiver"]],
+    "Distance (km)": results["distance_km"],
+    "Trusted Nodes": results["trusted_nodes"],
+    "Per-link QBER (%)": results["per_link_qber"],
+    "End-to-end QBER (%)": results["end_to_end_qber"],
+    "End-to-end Key Rate (kbps)": results["key_rate_kbps"],
+    "K_session formed?": np.where(results["session_formed"], "✔", "✖"),
+    "Time to Form Key (s)": results["time_to_form_key_s"],
+    "Final Key Length (bits)": results["final_key_length_bits"],
+})
 st.subheader("Per-Receiver Output Table")
 st.dataframe(df)
 
 # --- 5. Summary Statistics ---
-avg_qber = round(df["End-to-end QBER (%)"].mean(),2)
-total_key_rate = round(df["End-to-end Key Rate (kbps)"].sum(),2)
-success_count = df["K_session formed?"].value_counts().get("✔",0)
-failure_count = df["K_session formed?"].value_counts().get("✖",0)
-total_time = round(df["Time to Form Key (s)"].sum(),2)
+summary = summarize(results)
+avg_qber = summary["avg_qber"]
+total_key_rate = summary["total_key_rate"]
+success_count = summary["success_count"]
+failure_count = summary["failure_count"]
+total_time = summary["total_time"]
 
 st.subheader("Summary Statistics")
 st.markdown(f"- **Average end-to-end QBER across all users:** {avg_qber}%")
@@ -88,6 +79,17 @@ st.markdown(f"- **Number of successful sessions:** {success_count}")
 st.markdown(f"- **Number of failed sessions:** {failure_count}")
 st.markdown(f"- **Total time to form all session keys:** {total_time} s")
 
+# --- 5b. Discrete-event schedule for the selected distribution mode ---
+schedule = simulate_schedule(results, distribution_mode, key_relay_latency, shared_trunk=shared_trunk)
+st.subheader(f"{distribution_mode} Distribution (discrete-event simulation)")
+st.markdown(f"- **Makespan:** {schedule['makespan_s']:.3f} s")
+if schedule["completed"]:
+    st.markdown(f"- **Per-user latency p50 / p95 / p99:** {schedule['latency_p50_s']:.3f} / "
+                f"{schedule['latency_p95_s']:.3f} / {schedule['latency_p99_s']:.3f} s")
+if schedule["throughput_keys_per_s"]:
+    st.markdown(f"- **Throughput:** {schedule['throughput_keys_per_s']:.2f} keys/s "
+                f"({schedule['throughput_bits_per_s']:.0f} bits/s)")
+
 # --- 6. Visualizations ---
 st.subheader("Visualizations")
 
@@ -102,7 +104,7 @@ st.pyplot(plt)
 # Line graph: Per-link QBER (simplified example for first user)
 st.markdown("**Per-link QBER Along the Path (Example: Bob1)**")
 plt.figure(figsize=(8,4))
-per_link_qbers = [calculate_per_link_qber(detector_efficiency, dark_count_prob, channel_attenuation, misalignment_error)]*calculate_trusted_nodes(user_distances[0], link_length)
+per_link_qbers = [float(calculate_per_link_qber(detector_efficiency, dark_count_prob, channel_attenuation, misalignment_error))]*int(calculate_trusted_nodes(user_distances[0], link_length))
 plt.plot(range(1,len(per_link_qbers)+1), per_link_qbers, marker='o', linestyle='-', color='orange')
 plt.ylabel("Per-link QBER (%)")
 plt.xlabel("Hop Number")
@@ -111,35 +113,38 @@ st.pyplot(plt)
 
 # 6c. Network Diagram with color-coded session success/failure
 st.markdown("**Network Diagram (Alice → Trusted Nodes → Bobs)**")
+
+
+@st.cache_resource
+def build_network(hops_per_user):
+    # Cached per topology, so spring_layout runs once instead of on every rerun
+    net = TrustedNodeNetwork()
+    net.add_node("Alice", role="sender")
+    for i, n_hops in enumerate(hops_per_user):
+        prev = "Alice"
+        for h in range(1, n_hops + 1):
+            node_name = f"Node{i+1}_{h}"
+            net.set_link(prev, node_name, 1.0)
+            prev = node_name
+        net.add_node(f"Bob{i+1}", role="receiver")
+        net.set_link(prev, f"Bob{i+1}", 1.0)
+    net.layout(seed=42)
+    return net
+
+
+net = build_network(tuple(int(h) for h in results["trusted_nodes"]))
 G = nx.Graph()
-G.add_node("Alice")
-node_colors = []
-
-for i, dist in enumerate(user_distances):
-    prev = "Alice"
-    n_hops = calculate_trusted_nodes(dist, link_length)
-    # add hops
-    for h in range(1, n_hops+1):
-        node_name = f"Node{i+1}_{h}"
-        G.add_node(node_name)
-        G.add_edge(prev, node_name)
-        prev = node_name
-        node_colors.append('lightgreen')  # trusted nodes always green
-    # connect final hop to Bob
-    bob_name = f"Bob{i+1}"
-    G.add_node(bob_name)
-    G.add_edge(prev, bob_name)
-    # color-code Bob by session success/failure
-    color = 'green' if df.loc[i, "K_session formed?"] == "✔" else 'red'
-    node_colors.append(color)
+G.add_nodes_from(node["name"] for node in net.to_dict()["nodes"])
+G.add_edges_from((link["a"], link["b"]) for link in net.to_dict()["links"])
+pos = net.layout()
 
 plt.figure(figsize=(10,6))
-pos = nx.spring_layout(G, seed=42)
 # Generate node color list for all nodes: Alice + trusted nodes + Bobs
-all_nodes = list(G.nodes())
-colors_final = ['skyblue']  # Alice
-for node in all_nodes[1:]:
-    if "Bob" in node:
+colors_final = []
+for node in G.nodes():
+    if node == "Alice":
+        colors_final.append('skyblue')
+    elif "Bob" in node:
         idx = int(node.replace("Bob","")) - 1
         colors_final.append('green' if df.loc[idx,"K_session formed?"]=="✔" else 'red')
     else:
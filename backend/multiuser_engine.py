@@ -0,0 +1,200 @@
+"""
+Multi-User QKD Network Engine
+
+Vectorized core of the multi-user BB84 simulator (multiuser.py). Each
+receiver Bob_i sits at distance d_i from Alice behind a chain of trusted
+nodes spaced link_length km apart. All formulas operate on NumPy arrays of
+user distances, so 10^5 receivers are evaluated in a few milliseconds and the
+same code serves the Streamlit UI and the Flask API.
+
+Model (per receiver):
+1. Trusted nodes / hops:  n = ceil(d / link_length)
+2. Per-link QBER (%):     (100 - eta_det) * 0.01 + p_dark * 100 + e_mis
+3. End-to-end QBER (%):   100 * (1 - (1 - Q_link / 100) ^ n)
+4. Key rate (kbps):       base_rate * (1 - Q_e2e / 100)
+5. Time to key (s):       K_session / rate + n * latency_ms / 1000
+
+simulate_schedule replaces the closed-form time with a discrete-event run
+(key_distribution_sim) honoring the Sequential/Parallel distribution mode.
+"""
+
+import math
+
+import numpy as np
+
+from key_distribution_sim import chain_paths, simulate_distribution
+
+MAX_USERS = 100_000
+# Trusted-node links over all receivers (sum of n); bounds the schedule
+# simulation, which walks every link
+MAX_LINKS = 500_000
+
+COLUMNS = [
+    "receiver", "distance_km", "trusted_nodes", "per_link_qber",
+    "end_to_end_qber", "key_rate_kbps", "session_formed",
+    "time_to_form_key_s", "final_key_length_bits",
+]
+
+
+def calculate_trusted_nodes(distance, link_length):
+    return np.ceil(np.asarray(distance, dtype=float) / link_length).astype(np.int64)
+
+
+def calculate_per_link_qber(detector_eff, dark_count, attenuation, misalignment):
+    # Simplified QBER formula
+    qber = (100 - np.asarray(detector_eff, dtype=float)) * 0.01 + np.asarray(dark_count) * 100 + misalignment
+    return np.round(qber, 2)
+
+
+def calculate_end_to_end_qber(per_link_qber, n_hops):
+    # Approximate: Q_total = 1 - (1 - qber_per_link)^n
+    q_total = 1 - ((1 - np.asarray(per_link_qber, dtype=float) / 100) ** np.asarray(n_hops))
+    return np.round(q_total * 100, 2)
+
+
+def calculate_key_rate(end_to_end_qber, base_rate=50):
+    # Simplified formula: key rate decreases with QBER
+    rate = base_rate * (1 - np.asarray(end_to_end_qber, dtype=float) / 100)
+    return np.round(rate, 2)
+
+
+def calculate_time_to_form_key(session_length, key_rate, n_hops, latency):
+    # Total time = session_length / key_rate + hop latencies; infinite when no key forms
+    key_rate = np.asarray(key_rate, dtype=float)
+    with np.errstate(divide="ignore"):
+        t = np.where(key_rate > 0, session_length / key_rate, np.inf) + np.asarray(n_hops) * latency / 1000.0
+    return np.round(t, 2)
+
+
+def default_user_distances(n_users, total_distance):
+    """Evenly spread receivers as the UI does: int(total * i / n), i = 1..n."""
+    n_users = int(n_users)
+    if not 1 <= n_users <= MAX_USERS:
+        raise ValueError(f"n_users must be between 1 and {MAX_USERS}")
+    if not math.isfinite(total_distance) or total_distance < 0:
+        raise ValueError("total_distance must be finite and non-negative")
+    i = np.arange(1, n_users + 1)
+    return np.maximum((total_distance * i / n_users).astype(np.int64), 1)
+
+
+def simulate_network(user_distances, link_length=100, session_key_length=256,
+                     detector_efficiency=90, dark_count_prob=0.001,
+                     channel_attenuation=0.2, misalignment_error=2,
+                     key_relay_latency=5, base_rate=50):
+    """
+    Evaluate every receiver of the star network at once.
+
+    Args:
+        user_distances (array-like): Distance from Alice to each Bob (km)
+        link_length (float): Link length per trusted node (km)
+        session_key_length (int): K_session length in bits
+        detector_efficiency (float): Detector efficiency (%)
+        dark_count_prob (float): Dark count probability
+        channel_attenuation (float): Channel attenuation (dB/km)
+        misalignment_error (float): Misalignment error (%)
+        key_relay_latency (float): Key relay latency per hop (ms)
+        base_rate (float): Single-link key rate (kbps)
+
+    Returns:
+        dict: Column name -> NumPy array, one entry per receiver (see COLUMNS);
+              "receiver" holds the 1-based index i of Bob_i
+    """
+    distances = np.asarray(user_distances, dtype=float)
+    if distances.size > MAX_USERS:
+        raise ValueError(f"At most {MAX_USERS} receivers per network")
+    if not math.isfinite(link_length) or link_length <= 0:
+        raise ValueError("link_length must be positive")
+    if not np.isfinite(distances).all() or (distances < 0).any():
+        raise ValueError("user distances must be finite and non-negative")
+    # Checked in floating point, before any per-link work
+    if np.ceil(distances / link_length).sum() > MAX_LINKS:
+        raise ValueError(f"At most {MAX_LINKS} trusted-node links in total; increase link_length")
+
+    n_hops = calculate_trusted_nodes(distances, link_length)
+    per_link_qber = calculate_per_link_qber(detector_efficiency, dark_count_prob,
+                                            channel_attenuation, misalignment_error)
+    end_to_end_qber = calculate_end_to_end_qber(per_link_qber, n_hops)
+    key_rate = calculate_key_rate(end_to_end_qber, base_rate)
+    time_to_form = calculate_time_to_form_key(session_key_length, key_rate, n_hops, key_relay_latency)
+
+    return {
+        "receiver": np.arange(1, len(distances) + 1),
+        "distance_km": distances,
+        "trusted_nodes": n_hops,
+        "per_link_qber": np.broadcast_to(per_link_qber, distances.shape),
+        "end_to_end_qber": end_to_end_qber,
+        "key_rate_kbps": key_rate,
+        "session_formed": key_rate > 0,
+        "time_to_form_key_s": time_to_form,
+        "final_key_length_bits": np.full(distances.shape, session_key_length, dtype=np.int64),
+    }
+
+
+def _finite(value):
+    return value if math.isfinite(value) else None
+
+
+def summarize(results):
+    """
+    Summary statistics shown under the per-receiver table.
+
+    Args:
+        results (dict): Output of simulate_network
+
+    Returns:
+        dict: average QBER, total rate, success/failure counts, total time
+              (None if a session never forms, as in to_json)
+    """
+    formed = results["session_formed"]
+    if len(formed) == 0:
+        return {"avg_qber": 0.0, "total_key_rate": 0.0, "success_count": 0,
+                "failure_count": 0, "total_time": 0.0}
+    return {
+        "avg_qber": round(float(results["end_to_end_qber"].mean()), 2),
+        "total_key_rate": round(float(results["key_rate_kbps"].sum()), 2),
+        "success_count": int(formed.sum()),
+        "failure_count": int((~formed).sum()),
+        "total_time": _finite(round(float(results["time_to_form_key_s"].sum()), 2)),
+    }
+
+
+
+def simulate_schedule(results, distribution_mode="Sequential", key_relay_latency=5,
+                      base_rate=50, shared_trunk=False):
+    """
+    Discrete-event key relay for the receivers of simulate_network.
+
+    Every link of the chains produces key at the per-link rate
+    base_rate * (1 - Q_link / 100) kbps.
+
+    Args:
+        results (dict): Output of simulate_network
+        distribution_mode (str): "Sequential" or "Parallel"
+        key_relay_latency (float): Key relay latency per hop (ms)
+        base_rate (float): Single-link key rate (kbps)
+        shared_trunk (bool): Share trusted nodes along a common trunk
+
+    Returns:
+        dict: makespan, latency percentiles and throughput (see
+              key_distribution_sim.simulate_distribution)
+    """
+    paths, n_links = chain_paths(results["trusted_nodes"], shared_trunk)
+    per_link_qber = results["per_link_qber"][0] if len(paths) else 0.0
+    link_rate = float(calculate_key_rate(per_link_qber, base_rate)) * 1000.0
+    session_bits = int(results["final_key_length_bits"][0]) if len(paths) else 0
+    return simulate_distribution(paths, np.full(n_links, link_rate), session_bits,
+                                 key_relay_latency / 1000.0, mode=distribution_mode)
+
+
+def to_json(results):
+    """Column-oriented, JSON-serializable view (infinite times become None)."""
+    out = {}
+    for name in COLUMNS:
+        col = results[name]
+        if name == "receiver":
+            out[name] = [f"Bob{i}" for i in col.tolist()]
+        elif col.dtype.kind == "f":
+            out[name] = [_finite(v) for v in col.tolist()]
+        else:
+            out[name] = col.tolist()
+    return out
@@ -0,0 +1,378 @@
+"""
+Trusted-Node Network Routing
+
+Topology model for multi-user QKD where trusted nodes are shared between
+receivers. Each link carries a key rate and a QBER; a route is only as fast
+as its slowest link, so routing maximizes the bottleneck key rate (widest
+path) between two nodes.
+
+Algorithm:
+1. Widest paths of an undirected graph all lie on its maximum spanning
+   forest, so only that forest is kept for path queries
+2. All-pairs bottleneck rates are built Kruskal-style: when two components
+   A and B merge through an edge of rate w, every pair (a, b) gets w
+3. Link insert / rate increase (u, v, w) updates the matrix in place:
+   M = max(M, min(M[:, u], w, M[v, :]), min(M[:, v], w, M[u, :]))
+4. Rate decrease / removal of a forest edge cuts the tree into sides A and B;
+   the best remaining crossing edge (x, y, w') reconnects them and only the
+   cross block is recomputed: M[A, B] = min(M[A, x], w', M[y, B])
+5. Node positions are computed once (spring layout when networkx is
+   installed) and new nodes are placed next to their neighbors afterwards
+
+Zero-rate links are kept in the topology but never enter the forest, so they
+are not offered as routes. verify() checks the incrementally maintained
+matrix against a from-scratch Kruskal rebuild.
+
+A network is safe to share between request threads (all public methods take
+one re-entrant lock; hold `lock` to apply several updates atomically). It
+lives in process memory and is not persisted: every server process keeps its
+own copy, which starts empty.
+"""
+
+import threading
+from collections import OrderedDict, deque
+from functools import wraps
+
+import numpy as np
+
+try:
+    import networkx as nx
+    HAS_NETWORKX = True
+except ImportError:
+    HAS_NETWORKX = False
+
+ROUTE_CACHE_SIZE = 4096
+
+
+def _locked(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def reference_bottleneck_matrix(n, links):
+    """
+    All-pairs bottleneck rates recomputed from scratch (plain Kruskal).
+
+    Args:
+        n (int): Number of nodes
+        links (dict): (p, q) -> (key_rate, qber)
+
+    Returns:
+        np.ndarray: (n, n) matrix in the format of bottleneck_matrix()
+    """
+    M = np.zeros((n, n))
+    np.fill_diagonal(M, np.inf)
+    owner = list(range(n))
+    members = [[i] for i in range(n)]
+    for (p, q), (w, _) in sorted(links.items(), key=lambda item: -item[1][0]):
+        a, b = owner[p], owner[q]
+        if a == b or w <= 0:
+            continue
+        M[np.ix_(members[a], members[b])] = w
+        M[np.ix_(members[b], members[a])] = w
+        for m in members[b]:
+            owner[m] = a
+        members[a].extend(members[b])
+        members[b] = []
+    return M
+
+
+class TrustedNodeNetwork:
+    """
+    Shared trusted-node topology with cached widest-path routing.
+    """
+
+    def __init__(self):
+        self._index = {}
+        self._names = []
+        self._roles = []
+        self._links = {}
+        self._tree = []
+        self._matrix = None
+        self._buffer = None
+        self._routes = OrderedDict()
+        self._layout = None
+        self.version = 0
+        self.lock = threading.RLock()
+
+    # ---------------- TOPOLOGY ----------------
+    @_locked
+    def add_node(self, name, role="trusted"):
+        """Add a node (no-op if it exists). Returns its integer id."""
+        if name in self._index:
+            return self._index[name]
+        i = len(self._names)
+        self._index[name] = i
+        self._names.append(name)
+        self._roles.append(role)
+        self._tree.append({})
+        if self._matrix is not None:
+            self._grow_matrix(i + 1)
+        if self._layout is not None:
+            self._layout[name] = None
+        return i
+
+    @_locked
+    def set_link(self, a, b, key_rate, qber=0.0):
+        """
+        Create or update an undirected link.
+
+        Args:
+            a, b (str): Node names (created as trusted nodes if missing)
+            key_rate (float): Link secret key rate (any consistent unit)
+            qber (float): Link QBER as a fraction (0-0.5)
+        """
+        if a == b:
+            raise ValueError("A link needs two distinct nodes")
+        if key_rate < 0 or not 0 <= qber <= 0.5:
+            raise ValueError("key_rate must be >= 0 and qber within [0, 0.5]")
+        u, v = self.add_node(a), self.add_node(b)
+        edge = (min(u, v), max(u, v))
+        old = self._links.get(edge)
+        self._links[edge] = (float(key_rate), float(qber))
+
+        if old is None or key_rate >= old[0]:
+            if key_rate > 0:
+                self._increase(u, v, float(key_rate))
+        elif v in self._tree[u]:
+            self._tree[u][v] = self._tree[v][u] = float(key_rate)
+            self._cut_and_reconnect(u, v)
+        self._changed()
+
+    @_locked
+    def remove_link(self, a, b):
+        """Remove a link; routes are repaired with the best alternative."""
+        u, v = self._index[a], self._index[b]
+        edge = (min(u, v), max(u, v))
+        if self._links.pop(edge, None) is None:
+            raise KeyError(f"No link {a}-{b}")
+        if v in self._tree[u]:
+            self._cut_and_reconnect(u, v)
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._routes.clear()
+
+    # ---------------- SPANNING FOREST MAINTENANCE ----------------
+    def _increase(self, u, v, w):
+        if v in self._tree[u]:
+            self._tree[u][v] = self._tree[v][u] = w
+        else:
+            path = self._tree_path(u, v)
+            if path is None:
+                self._tree[u][v] = self._tree[v][u] = w
+            else:
+                x, y, w_min = min(((p, q, self._tree[p][q]) for p, q in zip(path, path[1:])),
+                                  key=lambda e: e[2])
+                if w <= w_min:
+                    return
+                del self._tree[x][y], self._tree[y][x]
+                self._tree[u][v] = self._tree[v][u] = w
+        if self._matrix is not None:
+            M = self._matrix
+            via_uv = np.minimum(np.minimum.outer(M[:, u], M[v, :]), w)
+            via_vu = np.minimum(np.minimum.outer(M[:, v], M[u, :]), w)
+            np.maximum(M, np.maximum(via_uv, via_vu), out=M)
+
+    def _cut_and_reconnect(self, u, v):
+        del self._tree[u][v], self._tree[v][u]
+        side_a = self._component(u)
+        in_a = np.zeros(len(self._names), dtype=bool)
+        in_a[side_a] = True
+
+        best = None
+        for (p, q), (rate, _) in self._links.items():
+            if in_a[p] != in_a[q] and rate > 0 and (best is None or rate > best[2]):
+                best = (p, q, rate)
+
+        side_b = self._component(v)
+        if best is not None:
+            x, y, w = best
+            self._tree[x][y] = self._tree[y][x] = w
+        if self._matrix is None:
+            return
+
+        M = self._matrix
+        if best is None:
+            cross = np.zeros((len(side_a), len(side_b)), dtype=M.dtype)
+        else:
+            x, y = (x, y) if in_a[x] else (y, x)
+            cross = np.minimum(np.minimum.outer(M[side_a, x], M[y, side_b]), w)
+        M[np.ix_(side_a, side_b)] = cross
+        M[np.ix_(side_b, side_a)] = cross.T
+
+    def _component(self, start):
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            n = queue.popleft()
+            for m in self._tree[n]:
+                if m not in seen:
+                    seen.add(m)
+                    queue.append(m)
+        return np.fromiter(seen, dtype=np.int64)
+
+    def _tree_path(self, src, dst):
+        parent = {src: None}
+        queue = deque([src])
+        while queue:
+            n = queue.popleft()
+            if n == dst:
+                path = []
+                while n is not None:
+                    path.append(n)
+                    n = parent[n]
+                return path[::-1]
+            for m in self._tree[n]:
+                if m not in parent:
+                    parent[m] = n
+                    queue.append(m)
+        return None
+
+    def _grow_matrix(self, size):
+        # Amortized growth: the matrix is a view into a buffer that doubles
+        if size > self._buffer.shape[0]:
+            old = self._matrix
+            self._buffer = np.zeros((2 * size, 2 * size))
+            self._buffer[:old.shape[0], :old.shape[1]] = old
+        self._matrix = self._buffer[:size, :size]
+        self._matrix[size - 1, size - 1] = np.inf
+
+    # ---------------- QUERIES ----------------
+    @_locked
+    def bottleneck_matrix(self):
+        """
+        All-pairs bottleneck key rates (built once, then kept incrementally).
+
+        Returns:
+            tuple: (node names, (N, N) float64 array; 0 = unreachable)
+        """
+        if self._matrix is None:
+            n = len(self._names)
+            M = np.zeros((n, n))
+            np.fill_diagonal(M, np.inf)
+            members = [[i] for i in range(n)]
+            owner = list(range(n))
+            tree_edges = [(min(p, q), max(p, q), w) for p in range(n) for q, w in self._tree[p].items() if p < q]
+            for p, q, w in sorted(tree_edges, key=lambda e: -e[2]):
+                a, b = owner[p], owner[q]
+                if len(members[a]) < len(members[b]):
+                    a, b = b, a
+                M[np.ix_(members[a], members[b])] = w
+                M[np.ix_(members[b], members[a])] = w
+                for m in members[b]:
+                    owner[m] = a
+                members[a].extend(members[b])
+                members[b] = []
+            self._buffer = M
+            self._matrix = M
+        return list(self._names), self._matrix
+
+    @_locked
+    def verify(self):
+        """
+        Check the incremental bottleneck matrix against a full recompute.
+
+        Returns:
+            bool: True if both agree for every pair of nodes
+        """
+        _, M = self.bottleneck_matrix()
+        return bool(np.array_equal(M, reference_bottleneck_matrix(len(self._names), self._links)))
+
+    @_locked
+    def bottleneck(self, a, b):
+        """Best achievable end-to-end key rate between two nodes."""
+        _, M = self.bottleneck_matrix()
+        return float(M[self._index[a], self._index[b]])
+
+    @_locked
+    def route(self, src, dst):
+        """
+        Widest path between two nodes.
+
+        Args:
+            src, dst (str): Node names
+
+        Returns:
+            dict: path (names), hops, bottleneck key_rate and end-to-end QBER,
+                  or None if dst is unreachable
+        """
+        if src == dst:
+            raise ValueError("Source and destination must differ")
+        key = (src, dst)
+        if key in self._routes:
+            self._routes.move_to_end(key)
+            return self._routes[key]
+
+        path = self._tree_path(self._index[src], self._index[dst])
+        if path is None:
+            result = None
+        else:
+            hops = list(zip(path, path[1:]))
+            links = [self._links[(min(p, q), max(p, q))] for p, q in hops]
+            rates = np.array([r for r, _ in links])
+            qbers = np.array([q for _, q in links])
+            result = {
+                "path": [self._names[i] for i in path],
+                "hops": len(hops),
+                "key_rate": float(rates.min()),
+                "qber": float(1 - np.prod(1 - qbers)),
+                "link_key_rates": rates.tolist(),
+                "link_qbers": qbers.tolist(),
+            }
+
+        self._routes[key] = result
+        if len(self._routes) > ROUTE_CACHE_SIZE:
+            self._routes.popitem(last=False)
+        return result
+
+    @_locked
+    def layout(self, seed=42):
+        """
+        Cached 2-D node positions for drawing.
+
+        The full layout is computed once; nodes added later are placed at the
+        centroid of their already-placed neighbors with a small jitter.
+
+        Returns:
+            dict: name -> (x, y)
+        """
+        rng = np.random.default_rng(seed)
+        if self._layout is None:
+            n = len(self._names)
+            if HAS_NETWORKX and n:
+                G = nx.Graph()
+                G.add_nodes_from(range(n))
+                G.add_edges_from(self._links)
+                pos = nx.spring_layout(G, seed=seed)
+                self._layout = {self._names[i]: tuple(map(float, p)) for i, p in pos.items()}
+            else:
+                angles = 2 * np.pi * np.arange(n) / max(n, 1)
+                self._layout = {name: (float(np.cos(t)), float(np.sin(t)))
+                                for name, t in zip(self._names, angles)}
+            return dict(self._layout)
+
+        for name, pos in self._layout.items():
+            if pos is not None:
+                continue
+            i = self._index[name]
+            neighbors = [self._layout[self._names[q if p == i else p]]
+                         for p, q in self._links if i in (p, q)]
+            neighbors = [p for p in neighbors if p is not None]
+            center = np.mean(neighbors, axis=0) if neighbors else rng.uniform(-1, 1, 2)
+            self._layout[name] = tuple(map(float, center + rng.normal(0, 0.05, 2)))
+        return dict(self._layout)
+
+    @_locked
+    def to_dict(self):
+        """JSON-serializable snapshot of nodes and links."""
+        return {
+            "version": self.version,
+            "nodes": [{"name": n, "role": r} for n, r in zip(self._names, self._roles)],
+            "links": [{"a": self._names[p], "b": self._names[q], "key_rate": rate, "qber": qber}
+                      for (p, q), (rate, qber) in self._links.items()],
+        }
@@ -0,0 +1,102 @@
+"""
+Streaming One-Time-Pad Encryption
+
+XORs request bodies of any size with key material from the key pool, chunk
+by chunk, so a payload is never held in memory as a whole.
+
+Design:
+- The sender's stream takes one key of exactly the payload length
+  (Content-Length) from the pool of its SAE pair; the receiver fetches the
+  same key once by its key ID (key_pool dec_keys) to decrypt
+- Key material is bit-packed bytes: every key bit is used once, against
+  one plaintext bit (exp1/exp2's demo XOR uses one key bit per byte)
+- Each chunk is XORed with np.bitwise_xor on uint8 views of the chunk and
+  the key slice into one preallocated buffer; used key bytes are zeroed.
+  Memory per stream is one chunk (QKD_OTP_CHUNK_SIZE bytes) besides the key
+- OneTimePad only moves forward: a body longer than its key raises
+  KeyReuseError instead of wrapping around
+"""
+
+import os
+
+import numpy as np
+
+CHUNK_SIZE = max(1, int(os.getenv("QKD_OTP_CHUNK_SIZE", 1 << 16)))
+
+
+class KeyReuseError(ValueError):
+    """More data than key material: the pad would have to be reused."""
+
+
+class OneTimePad:
+    """
+    Key stream over one key.
+
+    Args:
+        key (bytearray): Key material; consumed bytes are zeroed in place
+    """
+
+    def __init__(self, key):
+        self._key = np.frombuffer(key, dtype=np.uint8)
+        self._offset = 0
+
+    @property
+    def remaining(self):
+        """Key bytes not used yet."""
+        return len(self._key) - self._offset
+
+    def apply(self, chunk, out=None):
+        """
+        XOR the next len(chunk) key bytes into `chunk`.
+
+        Args:
+            chunk (bytes-like): Plaintext or ciphertext
+            out (np.ndarray, optional): uint8 buffer of at least len(chunk)
+
+        Returns:
+            np.ndarray: uint8 view of the result (a view of `out` if given)
+
+        Raises:
+            KeyReuseError: If fewer than len(chunk) key bytes remain
+        """
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        n = len(data)
+        if n > self.remaining:
+            raise KeyReuseError(f"{n} bytes to encrypt but only {self.remaining} key bytes left")
+        pad = self._key[self._offset:self._offset + n]
+        result = np.bitwise_xor(data, pad, out=None if out is None else out[:n])
+        if self._key.flags.writeable:
+            pad[:] = 0
+        self._offset += n
+        return result
+
+
+def read_chunks(stream, chunk_size=CHUNK_SIZE):
+    """Yield successive reads of up to chunk_size bytes from a file-like stream."""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def xor_stream(chunks, key, chunk_size=CHUNK_SIZE):
+    """
+    Encrypt (or decrypt) a stream of chunks with a one-time pad.
+
+    Args:
+        chunks (iterable): bytes chunks of at most chunk_size bytes
+        key (bytearray): Key of at least the total stream length
+
+    Yields:
+        bytes: One output chunk per input chunk
+
+    Raises:
+        KeyReuseError: When the chunks outrun the key
+    """
+    pad = OneTimePad(key)
+    out = np.empty(chunk_size, dtype=np.uint8)
+    for chunk in chunks:
+        if len(chunk) > len(out):
+            out = np.empty(len(chunk), dtype=np.uint8)
+        yield pad.apply(chunk, out).tobytes()
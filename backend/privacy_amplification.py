@@ -17,7 +17,37 @@ where each descending diagonal is constant.
 import random
 
 
-def toeplitz_privacy_amplification(error_corrected_key_bits, output_length=None, qber=None):
+def secret_key_length(input_length, qber=None, leaked_bits=0):
+    """
+    Default output length (bits) of privacy amplification.
+    
+    The hex key returned by privacy_amplify is zero-padded to whole bytes;
+    this is the number of its leading bits that are key material.
+    
+    Args:
+        input_length (int): Error-corrected key length in bits
+        qber (float, optional): Quantum Bit Error Rate (0-1)
+        leaked_bits (int): Bits disclosed during reconciliation and
+                           verification, subtracted from the output
+    
+    Returns:
+        int: Output length in bits; 0 (no key) for an empty input or when
+             the QBER term and leaked_bits use up the input
+    """
+    if input_length <= 0:
+        return 0
+    if qber is not None:
+        # Security: reduce key length based on error rate
+        # Simple approach: output_length = input_length * (1 - qber - security_margin)
+        security_margin = 0.1  # 10% security margin
+        output_length = int(input_length * (1 - qber - security_margin)) - leaked_bits
+    else:
+        # Default: reduce by 25%
+        output_length = min(int(input_length * 0.75) - leaked_bits, input_length - 1)
+    return max(0, min(output_length, input_length))
+
+
+def toeplitz_privacy_amplification(error_corrected_key_bits, output_length=None, qber=None, leaked_bits=0):
     """
     Perform privacy amplification using Toeplitz matrix universal hashing.
     
@@ -27,9 +57,12 @@ def toeplitz_privacy_amplification(error_corrected_key_bits, output_length=None,
         output_length (int, optional): Desired output key length in bits.
                                        If None, uses QBER-based or default reduction
         qber (float, optional): Quantum Bit Error Rate (0-1) for security parameter calculation
+        leaked_bits (int): Reconciliation and verification bits to remove from the
+                           default output length
     
     Returns:
-        str: Final secret key as hexadecimal string (compatible with existing code)
+        str: Final secret key as hexadecimal string (compatible with existing code),
+             "" if no secret bits remain
     """
     # Convert input to list of bits
     if isinstance(error_corrected_key_bits, str):
@@ -46,20 +79,12 @@ def toeplitz_privacy_amplification(error_corrected_key_bits, output_length=None,
     
     # Determine output length
     if output_length is None:
-        # Default: reduce by ~25% or use QBER-based calculation
-        if qber is not None:
-            # Security: reduce key length based on error rate
-            # Simple approach: output_length = input_length * (1 - qber - security_margin)
-            security_margin = 0.1  # 10% security margin
-            output_length = int(input_length * (1 - qber - security_margin))
-            output_length = max(8, output_length)  # Minimum 8 bits
-        else:
-            # Default: reduce by 25%
-            output_length = int(input_length * 0.75)
-            output_length = max(8, min(output_length, input_length - 1))
-    
-    # Ensure output_length is valid
-    output_length = max(1, min(output_length, input_length))
+        output_length = secret_key_length(input_length, qber, leaked_bits)
+    
+    # Ensure output_length is valid; nothing is left to extract at 0
+    output_length = min(output_length, input_length)
+    if output_length <= 0:
+        return ""
     
     # Generate random Toeplitz matrix
     # A Toeplitz matrix T of size (output_length x input_length) is defined by:
@@ -108,7 +133,7 @@ def toeplitz_privacy_amplification(error_corrected_key_bits, output_length=None,
     return hex_string
 
 
-def privacy_amplify(error_corrected_key, qber=None):
+def privacy_amplify(error_corrected_key, qber=None, leaked_bits=0):
     """
     Convenience wrapper for privacy amplification.
     Converts error_corrected_key string to bits and applies Toeplitz hashing.
@@ -116,9 +141,11 @@ def privacy_amplify(error_corrected_key, qber=None):
     Args:
         error_corrected_key (str): Error-corrected key as string of '0'/'1' characters
         qber (float, optional): Quantum Bit Error Rate for security parameter
+        leaked_bits (int): Reconciliation and verification bits (see key_verification.py)
     
     Returns:
-        str: Final secret key as hexadecimal string
+        str: Final secret key as hexadecimal string ("" if no secret bits remain)
     """
     # Use default output length (will be calculated based on input length and QBER)
-    return toeplitz_privacy_amplification(error_corrected_key, output_length=None, qber=qber)
+    return toeplitz_privacy_amplification(error_corrected_key, output_length=None, qber=qber,
+                                          leaked_bits=leaked_bits)
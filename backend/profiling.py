@@ -0,0 +1,265 @@
+"""
+Opt-in Per-Request Profiling
+
+Captures a profile of individual Flask requests under production traffic,
+e.g. a slow _binary_search_error recursion or Toeplitz hashing on a long key.
+
+A request is profiled when:
+- it carries the X-Profile-Token header matching QKD_PROFILE_TOKEN (the
+  token is never accepted in the query string, which ends up in access
+  logs), or
+- it is picked at random with probability QKD_PROFILE_SAMPLE_RATE
+
+Each capture stores two files in QKD_PROFILE_DIR (a ring of the newest
+QKD_PROFILE_KEEP reports; older ones are deleted):
+- <id>.pstats     cProfile statistics, readable with pstats / snakeviz
+- <id>.collapsed  "frame;frame;frame count" lines from a sampling thread,
+                  ready for flamegraph.pl or speedscope
+
+Listing and downloading reports over HTTP (/debug/profiles) always needs
+the token. With only QKD_PROFILE_SAMPLE_RATE set, sampled reports are still
+written but can only be read from QKD_PROFILE_DIR on the host.
+
+Streamed responses (batch NDJSON, OTP streams) do their work while the body
+is iterated, after the view has returned; wrap_stream keeps the capture
+running until the body is exhausted or closed.
+
+When neither variable is set, ENABLED is False and app.py registers no
+hooks at all, so disabled profiling costs nothing.
+"""
+
+import cProfile
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_TOKEN = os.getenv("QKD_PROFILE_TOKEN")
+SAMPLE_RATE = float(os.getenv("QKD_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("QKD_PROFILE_DIR", os.path.join("/tmp", "qkd_profiles"))
+KEEP = int(os.getenv("QKD_PROFILE_KEEP", "50"))
+SAMPLE_INTERVAL = float(os.getenv("QKD_PROFILE_SAMPLE_INTERVAL", "0.001"))
+
+ENABLED = bool(PROFILE_TOKEN) or SAMPLE_RATE > 0
+
+# cProfile can only be active once per interpreter (sys.monitoring), so at most
+# one request is captured at a time; concurrent requests simply run unprofiled.
+_active = threading.Lock()
+_REPORT_ID = re.compile(r"^[\w.-]+$")
+
+
+def is_authorized(req):
+    """True if the request presents the configured profiling token."""
+    if not PROFILE_TOKEN:
+        return False
+    supplied = req.headers.get("X-Profile-Token")
+    if not supplied:
+        return False
+    return hmac.compare_digest(supplied.encode(), PROFILE_TOKEN.encode())
+
+
+def should_profile(req):
+    """Decide whether to profile this request (token or random sample)."""
+    if req.path.startswith("/debug/profiles"):
+        # Fetching reports must not rotate the ring it reads from
+        return False
+    if is_authorized(req):
+        return True
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, thread_id):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """Profiler pair (cProfile + stack sampler) for one request."""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.sampler = _StackSampler(threading.get_ident())
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.start
+        return False
+
+
+def start():
+    """
+    Begin profiling the current request.
+
+    Returns:
+        RequestProfile or None if another capture is already running
+    """
+    if not _active.acquire(blocking=False):
+        return None
+    try:
+        return RequestProfile().__enter__()
+    except Exception:
+        _active.release()
+        return None
+
+
+def capture_id(profile, endpoint):
+    """Id under which a capture's files are (or will be) stored."""
+    return f"{int(profile.start_time * 1000)}-{os.getpid()}-{endpoint or 'unknown'}"
+
+
+def finish(profile, endpoint, method, status):
+    """
+    Stop a capture, write its files and trim the ring.
+
+    Returns:
+        str: Report id
+    """
+    try:
+        profile.__exit__(None, None, None)
+    finally:
+        _active.release()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    report_id = capture_id(profile, endpoint)
+    base = os.path.join(PROFILE_DIR, report_id)
+    profile.profiler.dump_stats(base + ".pstats")
+    with open(base + ".collapsed", "w") as f:
+        for stack, count in profile.sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(base + ".json", "w") as f:
+        json.dump({
+            "id": report_id,
+            "endpoint": endpoint,
+            "method": method,
+            "status": status,
+            "duration_s": profile.duration,
+            "created": profile.start_time,
+            "samples": sum(profile.sampler.stacks.values()),
+        }, f)
+    _trim()
+    return report_id
+
+
+class _StreamedBody:
+    """Response body that keeps a capture running until it is consumed."""
+
+    def __init__(self, profile, body, endpoint, method, status):
+        self._profile = profile
+        self._body = body
+        self._meta = (endpoint, method, status)
+        self._finished = False
+
+    def __iter__(self):
+        try:
+            yield from self._body
+        finally:
+            self.close()
+
+    def close(self):
+        # The WSGI server calls close() even if the body was never iterated
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            close = getattr(self._body, "close", None)
+            if close is not None:
+                close()
+        finally:
+            finish(self._profile, *self._meta)
+
+
+def wrap_stream(profile, response, endpoint, method):
+    """
+    Defer finish() of a streamed response until its body is done.
+
+    Args:
+        profile (RequestProfile): Running capture
+        response: Flask Response with is_streamed True
+
+    Returns:
+        str: Report id the capture will be stored under
+    """
+    response.response = _StreamedBody(profile, response.response, endpoint, method, response.status_code)
+    return capture_id(profile, endpoint)
+
+
+def _trim():
+    metas = sorted(
+        (name for name in os.listdir(PROFILE_DIR) if name.endswith(".json")),
+        reverse=True,
+    )
+    for name in metas[KEEP:]:
+        stem = name[:-len(".json")]
+        for ext in (".json", ".pstats", ".collapsed"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, stem + ext))
+            except OSError:
+                pass
+
+
+def list_reports():
+    """Metadata of stored reports, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    reports = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta["files"] = [f"{meta['id']}.pstats", f"{meta['id']}.collapsed"]
+        reports.append(meta)
+    return reports
+
+
+def report_filename(report_id, kind):
+    """
+    Validate a download request.
+
+    Args:
+        report_id (str): Report id from list_reports
+        kind (str): "pstats" or "collapsed"
+
+    Returns:
+        str or None: File name inside PROFILE_DIR, None if invalid/missing
+    """
+    if kind not in ("pstats", "collapsed") or not _REPORT_ID.match(report_id):
+        return None
+    name = f"{report_id}.{kind}"
+    return name if os.path.exists(os.path.join(PROFILE_DIR, name)) else None
@@ -1,11 +1,51 @@
-import random
 import numpy as np
 from itertools import product
 from flask import Flask, request, jsonify
+from decoy_state import run_decoy_bb84
+from sifting import sift
+from metrics import instrumented
 
 app = Flask(__name__)
 
 
+def detection_events(photons, transmission_prob, detector_eff, noise, dark, eve_on, rng=np.random):
+    """
+    Monte Carlo of one BB84 run: every photon of the run at once, one array
+    per random choice.
+
+    Args:
+        photons (int): Pulses sent
+        transmission_prob (float): Channel transmittance
+        detector_eff (float): Mean detections per arriving photon (Poisson)
+        noise (float): Probability a detected bit is flipped
+        dark (float): Mean dark counts per pulse (Poisson)
+        eve_on (bool): Intercept-resend attack in a random basis
+        rng: np.random or a np.random.RandomState
+
+    Returns:
+        dict: sift() keyword arguments (alice_bits, alice_bases, bob_bits,
+              bob_bases, received, flips)
+    """
+    alice_bit = rng.randint(0, 2, photons)
+    alice_basis = rng.randint(0, 2, photons)
+    transmitted = rng.random(photons) <= transmission_prob
+
+    if eve_on:
+        eve_basis = rng.randint(0, 2, photons)
+        photon_bit = np.where(eve_basis == alice_basis, alice_bit, rng.randint(0, 2, photons))
+        photon_basis = eve_basis
+    else:
+        photon_bit = alice_bit
+        photon_basis = alice_basis
+
+    bob_basis = rng.randint(0, 2, photons)
+    detected = (rng.poisson(detector_eff, photons) > 0) | (rng.poisson(dark, photons) > 0)
+    bob_bit = np.where(bob_basis == photon_basis, photon_bit, rng.randint(0, 2, photons))
+    noise_flips = rng.random(photons) < noise
+    return {"alice_bits": alice_bit, "alice_bases": alice_basis, "bob_bits": bob_bit,
+            "bob_bases": bob_basis, "received": transmitted & detected, "flips": noise_flips}
+
+
 class QKDCLI:
     """
     EXACT logic copy of Tkinter QKDCLI.
@@ -20,7 +60,9 @@ class QKDCLI:
         self.system = {
             "nodes": {},
             "link": {"loss": 0.2, "noise": 0.01, "distance": 10},
-            "receiver": {"dark_count": 0.0005}
+            "receiver": {"dark_count": 0.0005},
+            "source": {"photons": 5000},
+            "decoy": {"enabled": False, "signal": 0.5, "decoy": 0.1, "vacuum": 0.0, "pulses": 100000}
         }
 
         # -------- EXPERIMENT (SWEEP SETTINGS) --------
@@ -50,6 +92,7 @@ class QKDCLI:
             self._output_buffer.append(line)
 
     # ---------------- COMMAND ENTRY ----------------
+    @instrumented("cli_command")
     def execute(self, cmd):
         """
         Replaces Tkinter <Return> handler.
@@ -112,6 +155,26 @@ class QKDCLI:
                 self.system["receiver"]["dark_count"] = float(cmd.split()[2])
                 self.write("Dark count set")
 
+            elif cmd.startswith("set photons"):
+                self.system["source"]["photons"] = int(float(cmd.split()[2]))
+                self.write("Photons per run set")
+
+            elif cmd.startswith("set decoy-pulses"):
+                self.system["decoy"]["pulses"] = int(float(cmd.split()[2]))
+                self.write("Decoy pulses set")
+
+            elif cmd.startswith("set decoy"):
+                self.system["decoy"]["enabled"] = cmd.split()[2] == "on"
+                self.write(f"Decoy-state mode {'enabled' if self.system['decoy']['enabled'] else 'disabled'}")
+
+            elif cmd.startswith("set intensity"):
+                parts = cmd.split()
+                if parts[2] not in ("signal", "decoy", "vacuum"):
+                    self.write("Unknown intensity (use signal, decoy or vacuum)")
+                else:
+                    self.system["decoy"][parts[2]] = float(parts[3])
+                    self.write(f"{parts[2].capitalize()} intensity set")
+
             elif cmd == "exit":
                 self.current_mode = "privileged"
 
@@ -142,6 +205,13 @@ class QKDCLI:
         self.write(f"  Loss: {self.system['link']['loss']} dB/km")
         self.write(f"  Noise: {self.system['link']['noise']}")
         self.write(f"  Dark Count: {self.system['receiver']['dark_count']}")
+        self.write(f"  Photons/Run: {self.system['source']['photons']}")
+        decoy = self.system["decoy"]
+        if decoy["enabled"]:
+            self.write(f"  Decoy-State: signal={decoy['signal']} decoy={decoy['decoy']} "
+                       f"vacuum={decoy['vacuum']} pulses={decoy['pulses']}")
+        else:
+            self.write("  Decoy-State: off")
 
     def show_sweep_plan(self):
         if not self.sweep["mode"]:
@@ -180,6 +250,7 @@ class QKDCLI:
 
         self.write("Experiment completed.")
 
+    @instrumented("cli_bb84_run")
     def simulate_bb84_run(self, run_number, param_values, eve_on):
         # -------- Hardware baseline (non-ideal reality) --------
         BASE_LOSS = 0.2
@@ -199,38 +270,15 @@ class QKDCLI:
         transmission_prob = 10 ** (-(loss * distance) / 10)
 
         detector_eff = 0.15
-        photons = 5000
-        sifted, errors = 0, 0
-
-        for _ in range(photons):
-            alice_bit = random.randint(0, 1)
-            alice_basis = random.choice(["Z", "X"])
-
-            if random.random() > transmission_prob:
-                continue
-
-            if eve_on:
-                eve_basis = random.choice(["Z", "X"])
-                photon_bit = alice_bit if eve_basis == alice_basis else random.randint(0, 1)
-                photon_basis = eve_basis
-            else:
-                photon_bit = alice_bit
-                photon_basis = alice_basis
 
-            bob_basis = random.choice(["Z", "X"])
-            detected = np.random.poisson(detector_eff) > 0 or np.random.poisson(dark) > 0
-            if not detected:
-                continue
-
-            bob_bit = photon_bit if bob_basis == photon_basis else random.randint(0, 1)
-
-            if random.random() < noise:
-                bob_bit ^= 1
+        if self.system["decoy"]["enabled"]:
+            self.simulate_decoy_run(run_number, param_values, eve_on,
+                                    transmission_prob * detector_eff, noise, dark)
+            return
 
-            if bob_basis == alice_basis:
-                sifted += 1
-                if bob_bit != alice_bit:
-                    errors += 1
+        photons = self.system["source"]["photons"]
+        run = sift(**detection_events(photons, transmission_prob, detector_eff, noise, dark, eve_on))
+        sifted, errors = run["sifted"], run["errors"]
 
         if sifted > 0:
             intrinsic_errors = max(1, int(INTRINSIC_QBER * sifted))
@@ -251,6 +299,31 @@ class QKDCLI:
 
         self.write(f"Run {run_number}: QBER={qber*100:.2f}% Secure={secure}")
 
+    def simulate_decoy_run(self, run_number, param_values, eve_on, eta, noise, dark):
+        decoy = self.system["decoy"]
+        signal = param_values.get("signal", decoy["signal"])
+        weak = param_values.get("decoy", decoy["decoy"])
+        vacuum = param_values.get("vacuum", decoy["vacuum"])
+
+        try:
+            run = run_decoy_bb84(signal, weak, vacuum, decoy["pulses"], eta, dark, noise, eve_on)
+        except ValueError as e:
+            self.write(f"Run {run_number}: {e}")
+            return
+
+        self.results.append({
+            "run": run_number,
+            "params": param_values,
+            "qber": run["qber"],
+            "sifted": run["sifted"],
+            "final": run["final"],
+            "secure": run["secure"],
+            "decoy": run
+        })
+
+        self.write(f"Run {run_number}: QBER={run['qber']*100:.2f}% Y1={run['y1']:.2e} "
+                   f"e1={run['e1']*100:.2f}% R={run['key_rate']:.2e} Secure={run['secure']}")
+
     # ---------------- RESULTS TABLE ----------------
     def show_results_summary(self):
         if not self.results:
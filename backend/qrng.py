@@ -6,12 +6,27 @@ Falls back to NumPy ONLY if real hardware is not available.
 
 Designed as a drop-in replacement for NumPy randomness
 across all BB84 experiments (exp1–exp4).
+
+Hardware bits are not used as measured: every shot of every qubit is raw
+material that must pass continuous health tests and is then compressed by
+a Toeplitz extractor to near-uniform bits (qrng_health.py). A failing
+health test falls back to NumPy like any other QRNG failure; the report of
+the last hardware draw is available from get_last_rng_health().
+
+Request threads draw concurrently, so the module-level state (last source,
+last health report, the shared extractor) is only touched under _lock.
 """
 
+import threading
 import warnings
 import numpy as np
 from qiskit import QuantumCircuit
 
+from sampler_results import measured_bits
+from runtime_modes import runtime_sampler
+from qrng_health import HealthTests, HealthTestFailure, ToeplitzExtractor
+from metrics import inc
+
 try:
     from qiskit_ibm_runtime import SamplerV2 as Sampler
 except Exception:
@@ -20,8 +35,19 @@ except Exception:
     except Exception:
         Sampler = None
 
-# Track last randomness source (for debugging / UI display)
+# Track last randomness source and health report (for debugging / UI display)
+_lock = threading.Lock()
 _last_rng_source = None
+_last_rng_health = None
+_extractor = None
+
+
+def _record(source, health):
+    # Source and report of the same draw, set together
+    global _last_rng_source, _last_rng_health
+    with _lock:
+        _last_rng_source = source
+        _last_rng_health = health
 
 
 # -------------------------------------------------------------------
@@ -30,14 +56,43 @@ _last_rng_source = None
 def _is_real_ibm_hardware(backend):
     if backend is None:
         return False
+    # BackendV2.name is an attribute, BackendV1.name() a method
+    name = getattr(backend, "name", None)
     try:
-        name = backend.name()
+        name = name() if callable(name) else name
     except Exception:
         return False
     name = str(name).lower()
     return name.startswith("ibm_") and "sim" not in name and "aer" not in name
 
 
+def _quantum_source(backend):
+    """Randomness source of a backend: "ibm_quantum", "fake_runtime" (offline QPU stand-in) or None."""
+    if _is_real_ibm_hardware(backend):
+        return "ibm_quantum"
+    if getattr(backend, "emulates_hardware", False):
+        return "fake_runtime"
+    return None
+
+
+def _get_extractor():
+    # Built on first hardware use, so a bad QKD_QRNG_* setting only disables the QRNG
+    global _extractor
+    with _lock:
+        if _extractor is None:
+            _extractor = ToeplitzExtractor()
+        return _extractor
+
+
+def qrng_circuit(n):
+    """n qubits in |+>, each measured into its own bit."""
+    qc = QuantumCircuit(n, n)
+    for i in range(n):
+        qc.h(i)
+        qc.measure(i, i)
+    return qc
+
+
 # -------------------------------------------------------------------
 # Main QRNG API
 # -------------------------------------------------------------------
@@ -53,28 +108,55 @@ def generate_qrng_bits(n, backend, shots=1, return_source=False):
     Args:
         n (int): Number of bits
         backend: IBM backend instance
-        shots (int): Shots for QRNG circuit (default = 1)
+        shots (int): Minimum shots for QRNG circuit (default = 1; more are
+            run when extraction needs more raw bits)
         return_source (bool): Return (bits, source) if True
 
     Returns:
         list[int] OR (list[int], str)
     """
-    global _last_rng_source
+    draws, source = generate_qrng_draws(n, 1, backend, shots=shots, return_source=True)
+    return (draws[0], source) if return_source else draws[0]
+
+
+def generate_qrng_draws(n, draws, backend, mode=None, shots=1, return_source=False, api_token=None):
+    """
+    Generate `draws` independent n-bit strings in ONE sampler job.
+
+    Each draw is its own PUB of the QRNG circuit, so an experiment's bits and
+    bases wait in the IBM queue once. Each PUB runs enough shots for the
+    extractor to yield draws x n bits; the raw bits of each PUB are health
+    tested as one chunk, qubit by qubit (a stuck or biased qubit then shows
+    up as a long run). Falls back to NumPy like generate_qrng_bits.
 
-    if n <= 0:
+    Args:
+        n (int): Bits per draw
+        draws (int): Number of draws
+        backend: IBM backend instance
+        mode (optional): Runtime Session/Batch the job joins
+            (runtime_modes.open_mode); default: job mode on backend
+        shots (int): Minimum shots per PUB (default = 1)
+        return_source (bool): Return (draws, source) if True
+        api_token (str, optional): Token the job is admitted under (admission.py)
+
+    Returns:
+        list[list[int]] OR (list[list[int]], str)
+    """
+    if n <= 0 or draws <= 0:
         raise ValueError("Number of bits must be positive")
 
     # ----------------------------------------------------------------
     # Fallback path (no IBM hardware)
     # ----------------------------------------------------------------
-    if backend is None or not _is_real_ibm_hardware(backend):
+    source = _quantum_source(backend)
+    if source is None:
         warnings.warn(
             "IBM quantum hardware not detected — using NumPy PRNG",
             UserWarning,
         )
-        bits = np.random.randint(0, 2, size=n).tolist()
-        _last_rng_source = "numpy_fallback"
-        return (bits, _last_rng_source) if return_source else bits
+        bits = np.random.randint(0, 2, size=(draws, n)).tolist()
+        _record("numpy_fallback", None)
+        return (bits, "numpy_fallback") if return_source else bits
 
     # ----------------------------------------------------------------
     # Quantum RNG path (REAL hardware)
@@ -82,47 +164,53 @@ def generate_qrng_bits(n, backend, shots=1, return_source=False):
     if Sampler is None:
         raise RuntimeError("qiskit-ibm-runtime is not installed")
 
+    report = None
     try:
-        # Create QRNG circuit
-        qc = QuantumCircuit(n, n)
-        for i in range(n):
-            qc.h(i)
-            qc.measure(i, i)
-
         # Transpile for backend (safe, no backend.target)
         from qiskit import transpile
 
-        qc_isa = transpile(qc, backend)
+        qc_isa = transpile(qrng_circuit(n), backend)
+        extractor = _get_extractor()
+        shots = max(shots, -(-extractor.raw_bits_for(draws * n) // (draws * n)))
 
-        # Run job
-        sampler = Sampler(mode=backend)
-        job = sampler.run([qc_isa], shots=shots)
+        # One job, one PUB per draw
+        sampler = runtime_sampler(backend if mode is None else mode, api_token)
+        job = sampler.run([qc_isa] * draws, shots=shots)
         result = job.result()
 
-        # Extract counts (SamplerV2-compatible)
-        quasi = result.quasi_dists[0]
-        counts = quasi.binary_probabilities()
-
-        # Pick most probable bitstring
-        bitstring = max(counts, key=counts.get)
-
-        # Convert to list of ints (little-endian fix)
-        bits = [int(b) for b in bitstring][::-1]
-
-        # Ensure exact length
-        bits = bits[:n] if len(bits) >= n else bits + [0] * (n - len(bits))
-
-        _last_rng_source = "ibm_quantum"
-        return (bits, _last_rng_source) if return_source else bits
+        health = HealthTests(extractor.min_entropy)
+        raw = []
+        for i in range(draws):
+            measured = measured_bits(result, i, num_bits=n)
+            if measured.shots is None:
+                raise RuntimeError("QRNG extraction needs per-shot results (SamplerV2)")
+            # Qubit-major: column i (qubit i) holds that qubit's shots in order
+            chunk = measured.bits().T.ravel()
+            health.update(chunk)
+            raw.append(chunk)
+        raw = np.concatenate(raw)
+        report = {**health.stats(), "source": source, "raw_bits": len(raw),
+                  "output_bits": draws * n, "extractor_ratio": extractor.ratio}
+        if not health.healthy:
+            inc("qkd_events_total", event="qrng_health_failure")
+            raise HealthTestFailure(
+                f"health tests failed (longest run {report['repetition_count']['longest_run']}, "
+                f"largest window count {report['adaptive_proportion']['max_count']})")
+
+        bits = extractor.extract(raw)[:draws * n].reshape(draws, n).tolist()
+
+        _record(source, report)
+        return (bits, source) if return_source else bits
 
     except Exception as e:
         warnings.warn(
             f"IBM QRNG failed — falling back to NumPy ({e})",
             UserWarning,
         )
-        bits = np.random.randint(0, 2, size=n).tolist()
-        _last_rng_source = "numpy_fallback"
-        return (bits, _last_rng_source) if return_source else bits
+        bits = np.random.randint(0, 2, size=(draws, n)).tolist()
+        # Keep the report only if it explains the fallback
+        _record("numpy_fallback", report if isinstance(e, HealthTestFailure) else None)
+        return (bits, "numpy_fallback") if return_source else bits
 
 
 # -------------------------------------------------------------------
@@ -131,6 +219,19 @@ def generate_qrng_bits(n, backend, shots=1, return_source=False):
 def get_last_rng_source():
     """
     Returns:
-        "ibm_quantum" | "numpy_fallback" | None
+        "ibm_quantum" | "fake_runtime" | "numpy_fallback" | None
+    """
+    with _lock:
+        return _last_rng_source
+
+
+def get_last_rng_health():
+    """
+    Returns:
+        dict | None: Health report of the last hardware draw (samples,
+        healthy, repetition_count, adaptive_proportion, source, raw_bits,
+        output_bits, extractor_ratio); after a NumPy fallback, the failed
+        report if health tests caused it, else None
     """
-    return _last_rng_source
+    with _lock:
+        return _last_rng_health
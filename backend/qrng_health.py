@@ -0,0 +1,211 @@
+"""
+QRNG Health Tests and Randomness Extraction
+
+Checks raw QRNG measurements for a failing noise source and turns them into
+near-uniform bits, instead of using measured bits as they come off the
+device (where qubit bias and readout error show up in bases and key bits).
+
+Design:
+- Continuous health tests in the style of NIST SP 800-90B 4.4, run over
+  chunks of raw bits as they arrive (run state carries across chunks):
+  * repetition count: a run of identical bits of length >= 1 + ceil(a / H)
+    fails (H = assessed min-entropy per raw bit, false-positive rate 2^-a)
+  * adaptive proportion: in each window of APT_WINDOW bits, the first bit
+    must not recur more often than the binomial critical value for
+    p = 2^-H at 1 - 2^-a
+  Both are vectorized: run lengths from the positions where the bit
+  changes, window counts from a (windows, APT_WINDOW) reshape
+- Toeplitz extraction (leftover hash lemma): each block of BLOCK_BITS raw
+  bits with H min-entropy per bit yields floor(BLOCK_BITS x H) -
+  2 x SECURITY_BITS bits within 2^-SECURITY_BITS of uniform. The Toeplitz
+  product is a convolution with the seed, done for EXTRACT_BATCH blocks at
+  a time with one batched FFT; the seed is public and reused (a strong extractor)
+- H, the block size and the security parameter come from QKD_QRNG_*
+  environment variables
+"""
+
+import math
+import os
+
+import numpy as np
+from scipy.stats import binom
+
+
+def _env_number(name, default, cast=int):
+    try:
+        return cast(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+MIN_ENTROPY = min(1.0, max(0.01, _env_number("QKD_QRNG_MIN_ENTROPY", 0.8, float)))
+ALPHA_EXPONENT = 20  # false-positive probability 2^-20 per test, as SP 800-90B recommends
+APT_WINDOW = 1024    # SP 800-90B window for binary sources
+BLOCK_BITS = max(64, _env_number("QKD_QRNG_BLOCK_BITS", 4096))
+SECURITY_BITS = _env_number("QKD_QRNG_SECURITY_BITS", 64)
+EXTRACT_BATCH = 64  # blocks per FFT batch
+
+
+class HealthTestFailure(RuntimeError):
+    """Raw QRNG output failed a continuous health test."""
+
+
+def repetition_count_cutoff(min_entropy=MIN_ENTROPY, alpha_exponent=ALPHA_EXPONENT):
+    """Shortest failing run of identical bits."""
+    return 1 + math.ceil(alpha_exponent / min_entropy)
+
+
+def adaptive_proportion_cutoff(min_entropy=MIN_ENTROPY, window=APT_WINDOW, alpha_exponent=ALPHA_EXPONENT):
+    """Smallest failing count of the window's first bit within the window."""
+    return 1 + int(binom.ppf(1 - 2.0 ** -alpha_exponent, window, 2.0 ** -min_entropy))
+
+
+class HealthTests:
+    """
+    Repetition count and adaptive proportion tests over a stream of bits.
+
+    Args:
+        min_entropy (float): Assessed min-entropy per raw bit (0-1]
+        window (int): Adaptive proportion window
+        alpha_exponent (int): False-positive probability 2^-alpha_exponent
+    """
+
+    def __init__(self, min_entropy=MIN_ENTROPY, window=APT_WINDOW, alpha_exponent=ALPHA_EXPONENT):
+        self.min_entropy = min_entropy
+        self.window = window
+        self.rct_cutoff = repetition_count_cutoff(min_entropy, alpha_exponent)
+        self.apt_cutoff = adaptive_proportion_cutoff(min_entropy, window, alpha_exponent)
+        self._last = None       # last bit seen and the length of its run
+        self._run = 0
+        self._pending = np.empty(0, dtype=np.uint8)  # incomplete APT window
+        self._stats = {"samples": 0, "longest_run": 0, "rct_failures": 0,
+                       "windows": 0, "max_count": 0, "apt_failures": 0}
+
+    def update(self, bits):
+        """
+        Test the next chunk of raw bits.
+
+        Args:
+            bits (np.ndarray): 0/1 values (any integer dtype)
+
+        Returns:
+            int: Failures detected in this chunk (both tests)
+        """
+        bits = np.asarray(bits, dtype=np.uint8).ravel()
+        if len(bits) == 0:
+            return 0
+        return self._repetition_count(bits) + self._adaptive_proportion(bits)
+
+    def _repetition_count(self, bits):
+        starts = np.concatenate(([0], np.flatnonzero(bits[1:] != bits[:-1]) + 1))
+        runs = np.diff(np.append(starts, len(bits)))
+        carried = np.zeros(len(runs), dtype=np.int64)
+        if self._last is not None and bits[0] == self._last:
+            carried[0] = self._run
+        totals = runs + carried
+        # A run fails once, in the chunk where it reaches the cutoff
+        failures = int(np.count_nonzero((totals >= self.rct_cutoff) & (carried < self.rct_cutoff)))
+        self._last, self._run = bits[-1], int(totals[-1])
+        s = self._stats
+        s["samples"] += len(bits)
+        s["longest_run"] = max(s["longest_run"], int(totals.max()))
+        s["rct_failures"] += failures
+        return failures
+
+    def _adaptive_proportion(self, bits):
+        if len(self._pending):
+            bits = np.concatenate([self._pending, bits])
+        full = len(bits) // self.window * self.window
+        self._pending = bits[full:].copy()
+        if not full:
+            return 0
+        windows = bits[:full].reshape(-1, self.window)
+        counts = np.count_nonzero(windows == windows[:, :1], axis=1)
+        failures = int(np.count_nonzero(counts >= self.apt_cutoff))
+        s = self._stats
+        s["windows"] += len(windows)
+        s["max_count"] = max(s["max_count"], int(counts.max()))
+        s["apt_failures"] += failures
+        return failures
+
+    @property
+    def healthy(self):
+        return not (self._stats["rct_failures"] or self._stats["apt_failures"])
+
+    def stats(self):
+        """
+        Returns:
+            dict: samples, healthy, and per test the cutoff, the worst value
+                  seen (longest run, largest window count) and failures
+        """
+        s = self._stats
+        return {
+            "samples": s["samples"],
+            "min_entropy": self.min_entropy,
+            "healthy": self.healthy,
+            "repetition_count": {"cutoff": self.rct_cutoff, "longest_run": s["longest_run"],
+                                 "failures": s["rct_failures"]},
+            "adaptive_proportion": {"cutoff": self.apt_cutoff, "window": self.window,
+                                    "windows": s["windows"], "max_count": s["max_count"],
+                                    "failures": s["apt_failures"]},
+        }
+
+
+class ToeplitzExtractor:
+    """
+    Seeded Toeplitz-hashing extractor over blocks of raw bits.
+
+    Args:
+        block_bits (int): Raw bits per block
+        min_entropy (float): Min-entropy per raw bit
+        security_bits (int): Output within 2^-security_bits of uniform
+        seed (int, optional): Seed of the Toeplitz matrix (public); random
+            if None
+
+    Raises:
+        ValueError: If a block cannot yield any output at this min-entropy
+    """
+
+    def __init__(self, block_bits=BLOCK_BITS, min_entropy=MIN_ENTROPY, security_bits=SECURITY_BITS, seed=None):
+        self.block_bits = block_bits
+        self.min_entropy = min_entropy
+        self.output_bits = int(block_bits * min_entropy) - 2 * security_bits
+        if self.output_bits < 1:
+            raise ValueError(f"{block_bits}-bit blocks at min-entropy {min_entropy} yield no output "
+                             f"at {security_bits}-bit security")
+        toeplitz = np.random.default_rng(seed).integers(0, 2, block_bits + self.output_bits - 1)
+        # Circular convolution of this size leaves the entries used below unaliased
+        self._fft_size = 1 << (block_bits + self.output_bits - 2).bit_length()
+        self._toeplitz_fft = np.fft.rfft(toeplitz.astype(np.float64), self._fft_size)
+
+    @property
+    def ratio(self):
+        """Output bits per raw bit."""
+        return self.output_bits / self.block_bits
+
+    def raw_bits_for(self, output_bits):
+        """Raw bits (whole blocks) needed for at least output_bits output bits."""
+        return -(-output_bits // self.output_bits) * self.block_bits
+
+    def extract(self, raw):
+        """
+        Extract every complete block of `raw` (trailing bits are dropped).
+
+        Returns:
+            np.ndarray: uint8 0/1, output_bits per block
+        """
+        raw = np.asarray(raw, dtype=np.uint8).ravel()
+        blocks = len(raw) // self.block_bits
+        if not blocks:
+            return np.empty(0, dtype=np.uint8)
+        raw = raw[:blocks * self.block_bits].reshape(blocks, self.block_bits)
+        out = np.empty((blocks, self.output_bits), dtype=np.uint8)
+        start = self.block_bits - 1
+        # FFT batches of EXTRACT_BATCH blocks bound the float buffers
+        for first in range(0, blocks, EXTRACT_BATCH):
+            x = raw[first:first + EXTRACT_BATCH].astype(np.float64)
+            # out_i = sum_j T[n-1+i-j] x_j: entries n-1 .. n-2+m of the convolution T * x
+            conv = np.fft.irfft(np.fft.rfft(x, self._fft_size) * self._toeplitz_fft, self._fft_size)
+            sums = np.rint(conv[:, start:start + self.output_bits]).astype(np.int64)
+            out[first:first + len(x)] = sums & 1
+        return out.ravel()
@@ -0,0 +1,228 @@
+"""
+Compact Response Encoding
+
+Opt-in shaping of experiment responses plus transparent HTTP compression.
+
+Query parameters (all optional; without them responses are unchanged):
+- fields=a,b,c     keep only these top-level keys
+- bits=packed      encode 0/1 lists (Sender_bits, agoodbits, ...) as
+                   {"n": length, "b64": base64(np.packbits(bits))}, MSB first;
+                   lists containing null (exp4 lost photons) also get a
+                   "mask" with the same encoding (1 = value present)
+- counts_top=K     replace counts dicts by their K most frequent outcomes:
+                   {"top": {bitstring: count}, "other": rest, "distinct": d, "shots": s}
+- steps=aggregate  collapse per-(bitstring, qubit) step lists to one entry
+                   per qubit; steps=none drops them
+
+Compression:
+- JSON/text responses above MIN_COMPRESS_SIZE are brotli-compressed when
+  the client accepts "br" and the brotli package is installed, otherwise
+  gzip-compressed when it accepts "gzip"
+- Streamed (NDJSON) and file responses are left alone
+- An ETag gets a "-br"/"-gzip" suffix so each encoding has its own
+  validator; etag_matches() recognizes all of them
+"""
+
+import base64
+import gzip
+from heapq import nlargest
+
+import numpy as np
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+BIT_FIELDS = ("Sender_bits", "Sender_bases", "Receiver_bits", "Receiver_bases",
+              "agoodbits", "bgoodbits", "eve_bases")
+COUNT_FIELDS = ("counts", "counts2", "raw_counts")
+COMPRESSIBLE_TYPES = ("application/json", "text/plain")
+CODING_SUFFIXES = ("-br", "-gzip")
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+# ---------------- BIT VECTORS ----------------
+def pack_bits(bits):
+    """
+    Base64 bit-pack a list of 0/1 values (None entries are masked out).
+
+    Returns:
+        dict: {"n", "b64"} and, if any entry is None, "mask"
+    """
+    present = np.array([b is not None for b in bits], dtype=bool)
+    values = np.array([b if b is not None else 0 for b in bits], dtype=np.uint8)
+    packed = {"n": len(bits), "b64": base64.b64encode(np.packbits(values)).decode("ascii")}
+    if not present.all():
+        packed["mask"] = base64.b64encode(np.packbits(present)).decode("ascii")
+    return packed
+
+
+def unpack_bits(packed):
+    """Inverse of pack_bits (None where the mask is 0)."""
+    n = packed["n"]
+    values = np.unpackbits(np.frombuffer(base64.b64decode(packed["b64"]), dtype=np.uint8))[:n]
+    if "mask" not in packed:
+        return values.tolist()
+    mask = np.unpackbits(np.frombuffer(base64.b64decode(packed["mask"]), dtype=np.uint8))[:n]
+    return [int(v) if m else None for v, m in zip(values, mask)]
+
+
+# ---------------- COUNTS & STEPS ----------------
+def top_counts(counts, k):
+    """Keep the k most frequent outcomes of a counts dict."""
+    top = dict(nlargest(k, counts.items(), key=lambda kv: kv[1]))
+    shots = sum(counts.values())
+    return {
+        "top": top,
+        "other": shots - sum(top.values()),
+        "distinct": len(counts),
+        "shots": shots,
+    }
+
+
+def aggregate_steps(steps):
+    """
+    Collapse run_circuit_simulator step details to one entry per qubit.
+
+    Returns:
+        list[dict]: qubit, basis, Sender_bit, shots, mismatches, error_rate
+    """
+    per_qubit = {}
+    for step in steps:
+        entry = per_qubit.get(step["qubit"])
+        if entry is None:
+            entry = per_qubit[step["qubit"]] = {
+                "qubit": step["qubit"],
+                "basis": step["basis"],
+                "Sender_bit": step["Sender_bit"],
+                "shots": 0,
+                "mismatches": 0,
+            }
+        entry["shots"] += step["freq"]
+        if step["mismatch"]:
+            entry["mismatches"] += step["freq"]
+    out = [per_qubit[q] for q in sorted(per_qubit)]
+    for entry in out:
+        entry["error_rate"] = entry["mismatches"] / entry["shots"] if entry["shots"] else 0.0
+    return out
+
+
+# ---------------- RESPONSE SHAPING ----------------
+def options_from_args(args):
+    """
+    Parse shaping options from request query arguments.
+
+    Raises:
+        ValueError: On malformed values
+    """
+    fields = args.get("fields")
+    bits = args.get("bits", "json")
+    steps = args.get("steps", "full")
+    counts_top = args.get("counts_top")
+    if bits not in ("json", "packed"):
+        raise ValueError("bits must be 'json' or 'packed'")
+    if steps not in ("full", "aggregate", "none"):
+        raise ValueError("steps must be 'full', 'aggregate' or 'none'")
+    if counts_top is not None:
+        try:
+            counts_top = int(counts_top)
+        except ValueError:
+            raise ValueError("counts_top must be an integer")
+        if counts_top < 1:
+            raise ValueError("counts_top must be at least 1")
+    return {
+        "fields": [f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        "bits": bits,
+        "counts_top": counts_top,
+        "steps": steps,
+    }
+
+
+def shape_result(result, fields=None, bits="json", counts_top=None, steps="full"):
+    """
+    Apply field selection and compact encodings to one result dict.
+
+    Returns:
+        dict: A new dict; the input (often cached as last_expN_result) is not modified
+    """
+    if fields is not None:
+        result = {k: result[k] for k in fields if k in result}
+    else:
+        result = dict(result)
+
+    if bits == "packed":
+        for key in BIT_FIELDS:
+            value = result.get(key)
+            if isinstance(value, list):
+                result[key] = pack_bits(value)
+    if counts_top is not None:
+        for key in COUNT_FIELDS:
+            value = result.get(key)
+            if isinstance(value, dict):
+                result[key] = top_counts(value, counts_top)
+    if "steps" in result:
+        if steps == "aggregate":
+            # Prefer the simulator's own per-qubit totals: "steps" may be one page only
+            result["steps"] = result.get("qubit_stats") or aggregate_steps(result["steps"])
+        elif steps == "none":
+            del result["steps"]
+    return result
+
+
+# ---------------- HTTP COMPRESSION ----------------
+def compress_response(response, accept_encoding):
+    """
+    Compress a Flask response in place if the client accepts it.
+
+    Args:
+        response: Flask Response
+        accept_encoding: request.accept_encodings (werkzeug MIMEAccept-like)
+
+    Returns:
+        The same response object
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    if HAS_BROTLI and accept_encoding["br"]:
+        coding = "br"
+    elif accept_encoding["gzip"]:
+        coding = "gzip"
+    else:
+        return response
+
+    body = response.get_data()
+    response.vary.add("Accept-Encoding")
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    if coding == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = coding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{coding}", weak=weak)
+    return response
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Look up etag or one of its per-encoding variants in If-None-Match.
+
+    Returns:
+        str or None: The matching tag (to echo in the 304), None if no match
+    """
+    for tag in (etag,) + tuple(etag + s for s in CODING_SUFFIXES):
+        if tag in if_none_match:
+            return tag
+    return None
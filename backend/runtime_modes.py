@@ -0,0 +1,294 @@
+"""
+IBM Runtime Execution Modes
+
+Groups the jobs of one IBM experiment into one runtime Session or Batch, so
+the experiment waits in the public queue once instead of once per job.
+
+Design:
+- The QRNG draws of an experiment (Alice's bits and bases, Bob's and Eve's
+  bases) are one job with one PUB per draw (qrng.generate_qrng_draws)
+- The protocol circuits are built from those bits, so they follow as further
+  jobs in the same mode (exp3's Bob stage also needs Eve's outcome)
+- open_mode() prefers a Session, which holds the QPU between these dependent
+  jobs, then a Batch (Open plan accounts cannot open sessions), then plain
+  job mode. QKD_RUNTIME_MODE pins "session", "batch" or "job"
+- FakeRuntimeBackend stands in for a QPU offline: circuits are transpiled
+  for a fake device and run on Aer with its noise profile after a simulated
+  queue wait. Every job outside a mode waits queue_delay; in a Session or
+  Batch only the first one does. It can also reject jobs like a rate-limited
+  provider: randomly (failure_rate) and above max_in_flight running jobs
+"""
+
+import os
+import random
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+from qiskit.providers import BackendV2, Options
+
+from backend_config import get_fake_backend, get_local_simulator
+from execution_policy import local_sampler
+from metrics import inc
+from admission import AdmittedSampler
+
+try:
+    from qiskit_ibm_runtime import Batch, Session, SamplerV2 as Sampler
+except ImportError:
+    Batch = Session = Sampler = None
+try:
+    from qiskit.primitives import BackendSamplerV2
+except ImportError:
+    BackendSamplerV2 = None
+
+MODES = ("auto", "session", "batch", "job")
+RUNTIME_MODE = os.getenv("QKD_RUNTIME_MODE", "auto")
+FAKE_QUEUE_DELAY = float(os.getenv("QKD_FAKE_QUEUE_DELAY", "2.0"))
+
+
+def _mode_kinds(preference):
+    preference = str(preference or RUNTIME_MODE).strip().lower()
+    if preference not in MODES:
+        raise ValueError(f"runtime mode must be one of {', '.join(MODES)}")
+    if preference == "auto":
+        return ("session", "batch")
+    return () if preference == "job" else (preference,)
+
+
+def _create(backend, kind):
+    if isinstance(backend, FakeRuntimeBackend):
+        return backend.open(kind)
+    cls = Session if kind == "session" else Batch
+    if cls is None:
+        raise RuntimeError("qiskit-ibm-runtime is not installed")
+    return cls(backend=backend)
+
+
+def mode_name(mode):
+    """Kind of a mode yielded by open_mode: "session", "batch" or "job"."""
+    if isinstance(mode, FakeRuntimeMode):
+        return mode.kind
+    if Batch is not None and isinstance(mode, Batch):
+        return "batch"
+    if Session is not None and isinstance(mode, Session):
+        return "session"
+    return "job"
+
+
+@contextmanager
+def open_mode(backend, preference=None):
+    """
+    Execution mode shared by all jobs of one experiment.
+
+    Args:
+        backend: IBM backend (or FakeRuntimeBackend)
+        preference (str, optional): "auto", "session", "batch" or "job"
+            (default: QKD_RUNTIME_MODE)
+
+    Yields:
+        Session, Batch or, in job mode, the backend itself; pass it to
+        runtime_sampler and qrng.generate_qrng_draws. The mode is closed on
+        exit, so no further jobs can join it
+    """
+    mode = backend
+    for kind in _mode_kinds(preference):
+        try:
+            mode = _create(backend, kind)
+            break
+        except Exception as e:
+            warnings.warn(f"IBM runtime {kind} unavailable, trying next mode ({e})", UserWarning)
+    inc("qkd_events_total", event="runtime_mode", mode=mode_name(mode))
+    if mode is backend:
+        yield mode
+        return
+    with mode:
+        yield mode
+
+
+def runtime_sampler(mode, api_token=None):
+    """
+    SamplerV2 whose jobs run in `mode` (see open_mode).
+
+    With a token, every job goes through the admission controller under
+    that token (admission.py). Without one the backend is the local
+    fallback of get_backend_service, which needs no admission.
+    """
+    if isinstance(mode, (FakeRuntimeBackend, FakeRuntimeMode)):
+        sampler = mode.sampler()
+    elif Sampler is None:
+        raise RuntimeError("qiskit-ibm-runtime is not installed")
+    else:
+        sampler = Sampler(mode=mode)
+    return AdmittedSampler(sampler, api_token) if api_token else sampler
+
+
+# -------------------------------------------------------------------
+# Offline fake runtime (latency measurements, development without a token)
+# -------------------------------------------------------------------
+class FakeApiError(RuntimeError):
+    """Rejected submission, shaped like the runtime's RequestsApiError."""
+
+    def __init__(self, message, status_code=-1):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FakeRuntimeBackend(BackendV2):
+    """
+    QPU stand-in with a simulated job queue.
+
+    Attributes:
+        queue_delay (float): Seconds each queued job waits before it runs
+        failure_rate (float): Probability that a submission is rejected (429)
+        max_in_flight (int or None): Submissions beyond this many unfinished
+            jobs are rejected (429)
+        jobs (int): Jobs accepted so far
+        rejected (int): Jobs rejected so far
+        peak_in_flight (int): Most unfinished jobs at once
+        queued_s (float): Total simulated queue time
+    """
+
+    emulates_hardware = True
+
+    def __init__(self, queue_delay=None, noise_profile="brisbane", failure_rate=0.0,
+                 max_in_flight=None, seed=None):
+        super().__init__(name=f"fake_runtime_{noise_profile}")
+        self._target = get_fake_backend(noise_profile).target
+        self.simulator = get_local_simulator(noise_profile)
+        self.queue_delay = FAKE_QUEUE_DELAY if queue_delay is None else float(queue_delay)
+        self.failure_rate = failure_rate
+        self.max_in_flight = max_in_flight
+        self.jobs = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.queued_s = 0.0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def target(self):
+        return self._target
+
+    @property
+    def max_circuits(self):
+        return None
+
+    @classmethod
+    def _default_options(cls):
+        return Options()
+
+    def run(self, run_input, **options):
+        return self.simulator.run(run_input, **options)
+
+    def open(self, kind):
+        """A Session or Batch on this backend."""
+        return FakeRuntimeMode(self, kind)
+
+    def sampler(self):
+        """Job-mode sampler: every job queues."""
+        return FakeRuntimeSampler(self)
+
+    def _submit(self, delay):
+        with self._lock:
+            full = self.max_in_flight is not None and self.in_flight >= self.max_in_flight
+            if full or self._rng.random() < self.failure_rate:
+                self.rejected += 1
+                raise FakeApiError("Too Many Requests (fake runtime)", status_code=429)
+            self.jobs += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.queued_s += delay
+
+    def _finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class FakeRuntimeMode:
+    """Session or Batch on a FakeRuntimeBackend: only its first job queues."""
+
+    def __init__(self, backend, kind):
+        self.backend = backend
+        self.kind = kind
+        self._started = False
+
+    def sampler(self):
+        return FakeRuntimeSampler(self.backend, self)
+
+    def queue_delay(self):
+        if self._started:
+            return 0.0
+        self._started = True
+        return self.backend.queue_delay
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeRuntimeSampler:
+    """SamplerV2 look-alike: waits out the queue, then runs the PUBs on Aer."""
+
+    def __init__(self, backend, mode=None):
+        self.backend = backend
+        self.mode = mode
+
+    def run(self, pubs, shots=None):
+        delay = self.mode.queue_delay() if self.mode is not None else self.backend.queue_delay
+        self.backend._submit(delay)
+        return _FakeRuntimeJob(self.backend, list(pubs), shots, time.perf_counter() + delay)
+
+
+class _FakeRuntimeJob:
+    def __init__(self, backend, pubs, shots, ready_at):
+        self._backend = backend
+        self._pubs = pubs
+        self._shots = shots
+        self._ready_at = ready_at
+        self._result = None
+
+    def status(self):
+        # Runs in no time once out of the queue; result() then executes it on Aer
+        if self._result is not None or time.perf_counter() >= self._ready_at:
+            return "DONE"
+        return "QUEUED"
+
+    def result(self):
+        if self._result is None:
+            try:
+                time.sleep(max(0.0, self._ready_at - time.perf_counter()))
+                circuits = [pub[0] if isinstance(pub, tuple) else pub for pub in self._pubs]
+                sampler, _ = local_sampler(BackendSamplerV2, self._backend.simulator, circuits)
+                self._result = sampler.run(self._pubs, shots=self._shots).result()
+            finally:
+                self._backend._finish()
+        return self._result
+
+
+class FakeRuntimeService:
+    """
+    QiskitRuntimeService stand-in: least_busy() is a FakeRuntimeBackend.
+
+    Patch backend_config.QiskitRuntimeService with it to run the IBM code
+    path of the experiments offline. All accounts share `backend` (one
+    simulated QPU and provider), built from queue_delay on first use.
+    """
+
+    queue_delay = None
+    backend = None
+
+    def __init__(self, channel=None, token=None, **kwargs):
+        self.channel = channel
+
+    def least_busy(self, **kwargs):
+        cls = type(self)
+        if cls.backend is None:
+            cls.backend = FakeRuntimeBackend(cls.queue_delay)
+        return cls.backend
@@ -0,0 +1,152 @@
+"""
+Sampler Result Adapter
+
+One place to turn a sampler result into measurement bits, replacing the
+per-experiment "robust counts extraction" blocks.
+
+Design:
+- SamplerV2 results: the PUB's BitArray buffer ((shots, ceil(n/8)) uint8,
+  big-endian, as the primitive stores it) is used as-is, without copying
+- Legacy V1 results (quasi_dists): the distinct outcomes are packed into the
+  same layout, with their probabilities as weights
+- Per-shot bits, the most likely outcome and weighted samples are unpacked
+  with NumPy; bit i of a row is classical bit i (no bitstring reversal)
+- Counts ({bitstring: count}, qubit 0 rightmost) are built on demand from the
+  distinct rows only, so a 10^5-shot result formats a handful of strings
+"""
+
+import numpy as np
+
+EXTRACTION_ERROR = ("Failed to extract counts from sampler result. "
+                    "Try using AerSimulator or check qiskit version.")
+
+
+class MeasuredBits:
+    """
+    Measurement outcomes of one PUB.
+
+    Attributes:
+        packed (np.ndarray): (rows, ceil(num_bits/8)) uint8, big-endian bytes
+        num_bits (int): Classical bits per outcome
+        weights (np.ndarray or None): None when each row is one shot,
+            otherwise the probability of each (distinct) row
+    """
+
+    def __init__(self, packed, num_bits, weights=None):
+        self.packed = packed
+        self.num_bits = num_bits
+        self.weights = weights
+        self._outcomes = None
+
+    @classmethod
+    def from_bitarray(cls, bitarray):
+        """Wrap a SamplerV2 BitArray (zero-copy)."""
+        packed = bitarray.array
+        return cls(packed.reshape(-1, packed.shape[-1]), bitarray.num_bits)
+
+    @classmethod
+    def from_quasi_dist(cls, dist, num_bits):
+        """Wrap a V1 quasi-distribution {int outcome: probability}."""
+        nbytes = (num_bits + 7) // 8
+        keys = list(dist)
+        packed = np.frombuffer(b"".join(int(k).to_bytes(nbytes, "big") for k in keys),
+                               dtype=np.uint8).reshape(len(keys), nbytes)
+        weights = np.fromiter((dist[k] for k in keys), dtype=float, count=len(keys))
+        return cls(packed, num_bits, weights)
+
+    @property
+    def shots(self):
+        """Number of shots, None for a quasi-distribution."""
+        return len(self.packed) if self.weights is None else None
+
+    def _unpack(self, rows):
+        # Reversing the bytes and reading each LSB first puts classical bit 0 in column 0
+        return np.unpackbits(rows[..., ::-1], axis=-1, count=self.num_bits, bitorder="little")
+
+    def bits(self):
+        """
+        Per-row bits.
+
+        Returns:
+            np.ndarray: (rows, num_bits) uint8, column i = classical bit i
+        """
+        return self._unpack(self.packed)
+
+    def outcomes(self):
+        """
+        Distinct outcomes with their frequencies.
+
+        Returns:
+            tuple: (distinct packed rows, counts or probabilities)
+        """
+        if self.weights is not None:
+            return self.packed, self.weights
+        if self._outcomes is None:
+            nbytes = self.packed.shape[1]
+            if nbytes <= 8:
+                # Rows as big-endian integers: a 1-D integer sort instead of a row-wise one
+                keys = np.zeros((len(self.packed), 8), dtype=np.uint8)
+                keys[:, 8 - nbytes:] = self.packed
+                _, first, freq = np.unique(keys.view(">u8").ravel(),
+                                           return_index=True, return_counts=True)
+                self._outcomes = self.packed[first], freq
+            else:
+                self._outcomes = np.unique(self.packed, axis=0, return_counts=True)
+        return self._outcomes
+
+    def most_likely(self):
+        """Bits of the most frequent outcome, (num_bits,) uint8."""
+        rows, freq = self.outcomes()
+        if len(rows) == 0:
+            raise RuntimeError("Empty measurement counts.")
+        return self._unpack(rows[np.argmax(freq)])
+
+    def sample(self, rng):
+        """Bits of one outcome drawn with probability proportional to its frequency."""
+        if self.weights is None:
+            return self._unpack(self.packed[rng.integers(len(self.packed))])
+        p = self.weights / self.weights.sum()
+        return self._unpack(self.packed[rng.choice(len(self.packed), p=p)])
+
+    def get_counts(self):
+        """Counts dict {bitstring: count}, qubit 0 rightmost (as BitArray.get_counts)."""
+        rows, freq = self.outcomes()
+        width = f"0{self.num_bits}b"
+        values = freq.tolist()
+        return {format(int.from_bytes(row.tobytes(), "big"), width): v
+                for row, v in zip(rows, values)}
+
+
+def measured_bits(result, index=0, num_bits=None, register=None):
+    """
+    Extract the measurement outcomes of one PUB from any sampler result.
+
+    Args:
+        result: SamplerV2 PrimitiveResult or V1 SamplerResult
+        index (int): PUB / circuit index
+        num_bits (int, optional): Classical bits, needed for V1 results
+        register (str, optional): Classical register name (default: "c",
+            else the first register of the PUB)
+
+    Returns:
+        MeasuredBits
+
+    Raises:
+        RuntimeError: If the result holds no measurement data
+    """
+    if hasattr(result, "quasi_dists"):
+        if num_bits is None:
+            num_bits = max((int(k).bit_length() for k in result.quasi_dists[index]), default=1)
+        measured = MeasuredBits.from_quasi_dist(result.quasi_dists[index], num_bits)
+    else:
+        try:
+            data = result[index].data
+            bitarray = getattr(data, register or "c", None)
+            if bitarray is None and register is None:
+                bitarray = next(iter(data.values()))
+            measured = MeasuredBits.from_bitarray(bitarray)
+        except (TypeError, AttributeError, IndexError, KeyError, StopIteration):
+            raise RuntimeError(EXTRACTION_ERROR)
+    if len(measured.packed) == 0:
+        raise RuntimeError(EXTRACTION_ERROR)
+    return measured
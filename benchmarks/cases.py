@@ -0,0 +1,489 @@
+"""
+Benchmark Cases for the BB84 Pipeline
+
+Each case is a function taking its parameters as keyword arguments and
+returning a zero-argument callable (the timed workload) plus the number of
+items it processes, so throughput is reported in items/s (bits, photons,
+shots x qubits). @case registers it in CASES with its parameter grid.
+
+Setup work (random keys, CLI state) happens before the callable is built and
+is never timed. Every case is deterministic for a given seed and runs offline
+(AerSimulator; no IBM account or network access needed). ibm_runtime runs
+the IBM code path against runtime_modes.FakeRuntimeService, whose simulated
+queue wait is part of the timing.
+"""
+
+import os
+import random
+import sys
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+SEED = 1234
+
+# name -> (factory, parameter grid); the first entry of each grid is used by --quick
+CASES = {}
+
+
+def case(name, grid):
+    """Register a benchmark factory under `name` with its parameter grid."""
+    def register(factory):
+        CASES[name] = (factory, list(grid))
+        return factory
+    return register
+
+
+def _noisy_pair(n, qber, seed=SEED):
+    rng = np.random.default_rng(seed)
+    alice = rng.integers(0, 2, n)
+    bob = alice ^ (rng.random(n) < qber)
+    return alice.tolist(), bob.tolist()
+
+
+def _flask_client(api_token=None):
+    # Test client of the Flask app; importing app warns about optional deps
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        from app import app
+    client = app.test_client()
+    if api_token:
+        with client.session_transaction() as session:
+            session["ibm_api_token"] = api_token
+    return client
+
+
+def _use_fake_runtime(backend):
+    # Route backend_config's IBM service to the offline fake runtime
+    import backend_config
+    from runtime_modes import FakeRuntimeService
+    FakeRuntimeService.backend = backend
+    backend_config.QiskitRuntimeService = FakeRuntimeService
+
+
+def _run_threads(target, args_list):
+    # One thread per argument tuple; returns when all have finished
+    import threading
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+@case("cascade", [{"key_length": n} for n in (1000, 4000, 16000)])
+def bench_cascade(key_length, qber=0.03):
+    from cascade_error_correction import cascade_error_correction
+    alice, bob = _noisy_pair(key_length, qber)
+
+    def run():
+        random.seed(SEED)
+        cascade_error_correction(alice, bob, num_rounds=4, initial_block_size=8)
+    return run, key_length
+
+
+@case("toeplitz", [{"key_length": n} for n in (256, 1024, 2048)])
+def bench_toeplitz(key_length, qber=0.03):
+    from privacy_amplification import toeplitz_privacy_amplification
+    key, _ = _noisy_pair(key_length, 0.0)
+    key = "".join(map(str, key))
+
+    def run():
+        random.seed(SEED)
+        toeplitz_privacy_amplification(key, qber=qber)
+    return run, key_length
+
+
+@case("sifting", [{"qubits": n} for n in (20, 1000, 100000, 1000000)])
+def bench_sifting(qubits):
+    from sifting import sift
+    rng = np.random.default_rng(SEED)
+    abits, abase, bbase, bbits = (rng.integers(0, 2, qubits) for _ in range(4))
+
+    def run():
+        return sift(abits, abase, bbits, bbase)
+    return run, qubits
+
+
+@case("simulate_bb84_run", [
+    {"photons": 5000},
+    {"photons": 20000},
+    {"photons": 5000, "sweep_size": 10},
+    {"photons": 5000, "sweep_size": 10, "eve_on": True},
+])
+def bench_bb84_run(photons, sweep_size=1, eve_on=False):
+    from qkd_cli_core import QKDCLI
+    cli = QKDCLI()
+    cli.system["source"]["photons"] = photons
+    if sweep_size > 1:
+        cli.sweep["mode"] = "single"
+        cli.sweep["parameters"]["loss"] = (0.2, 0.2 + 0.01 * (sweep_size - 1), 0.01)
+
+    def run():
+        random.seed(SEED)
+        np.random.seed(SEED)
+        cli._output_buffer.clear()
+        if sweep_size > 1:
+            cli.run_bb84_experiment(eve_on)
+        else:
+            cli.simulate_bb84_run(1, {}, eve_on)
+    return run, photons * sweep_size
+
+
+@case("circuit_simulator", [{"qubits": n} for n in (8, 16, 24)])
+def bench_circuit_simulator(qubits, shots=1024):
+    from circuit_simulator import run_circuit_simulator
+    message = "Q" * max(1, qubits // 8)
+
+    def run():
+        random.seed(SEED)
+        run_circuit_simulator(message, shots=shots)
+    return run, len(message) * 8 * shots
+
+
+@case("sampler_result", [
+    {"shots": shots, "path": path} for shots in (10000, 100000) for path in ("dict", "bits")
+])
+def bench_sampler_result(shots, path, qubits=20):
+    # BB84-like outcomes: half the qubits measured in the matching basis (fixed),
+    # the other half random. "dict" is the old counts-string path of exp1-4.
+    from qiskit.primitives.containers import BitArray
+    from sampler_results import measured_bits
+    rng = np.random.default_rng(SEED)
+    samples = np.tile(rng.integers(0, 2, qubits).astype(bool), (shots, 1))
+    samples[:, ::2] = rng.integers(0, 2, (shots, (qubits + 1) // 2)).astype(bool)
+    bitarray = BitArray.from_bool_array(samples, order="little")
+
+    class _Pub:
+        class data:
+            c = bitarray
+
+    result = [_Pub]
+
+    def run():
+        if path == "dict":
+            counts = result[0].data.c.get_counts()
+            max_key = max(counts, key=counts.get)
+            return [int(b) for b in max_key][::-1], counts
+        measured = measured_bits(result, num_bits=qubits)
+        return measured.most_likely(), measured.get_counts()
+    return run, shots
+
+
+@case("local_simulator", [
+    {"qubits": qubits, "noise": noise} for qubits in (20, 64) for noise in ("ideal", "brisbane")
+])
+def bench_local_simulator(qubits, noise, shots=1024):
+    # Cached simulator per noise profile; building it (fake backend, noise model) is setup
+    from qiskit import QuantumCircuit
+    from qiskit.primitives import BackendSamplerV2
+    from backend_config import get_local_simulator
+    from execution_policy import local_sampler
+    rng = np.random.default_rng(SEED)
+    bits, prep, meas = (rng.integers(0, 2, qubits) for _ in range(3))
+    qc = QuantumCircuit(qubits, qubits)
+    for i in range(qubits):
+        if bits[i]:
+            qc.x(i)
+        if prep[i]:
+            qc.h(i)
+    qc.barrier()
+    for i in range(qubits):
+        if meas[i]:
+            qc.h(i)
+        qc.measure(i, i)
+    sampler, _ = local_sampler(BackendSamplerV2, get_local_simulator(noise), [qc])
+
+    def run():
+        sampler.run([qc], shots=shots).result()
+    return run, qubits * shots
+
+
+@case("ibm_runtime", [
+    {"experiment": exp, "mode": mode} for exp in ("exp1", "exp3") for mode in ("job", "auto")
+])
+def bench_ibm_runtime(experiment, mode, queue_delay=0.5, qubits=20):
+    # IBM code path end to end against the offline fake runtime: every job
+    # outside a Session/Batch waits queue_delay. mode="job" submits each job
+    # on its own (the pre-Session behaviour), "auto" groups them
+    import warnings
+    import runtime_modes
+    from runtime_modes import FakeRuntimeBackend
+    experiments = os.path.join(BACKEND_DIR, "experiments")
+    if experiments not in sys.path:
+        sys.path.insert(0, experiments)
+    module = __import__(experiment)
+    run_experiment = getattr(module, "run_" + experiment)
+    kwargs = {"num_bits": qubits} if experiment == "exp4" else {"bit_num": qubits}
+
+    backend = FakeRuntimeBackend(queue_delay)
+
+    def run():
+        _use_fake_runtime(backend)
+        runtime_modes.RUNTIME_MODE = mode
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            run_experiment(backend_type="ibm", api_token="fake", **kwargs)
+    return run, 1
+
+
+@case("ibm_admission", [{"users": 8, "jobs": 4, "failure_rate": rate} for rate in (0.0, 0.2)])
+def bench_ibm_admission(users, jobs, failure_rate, limit=3, queue_delay=0.2):
+    # `users` threads (one token each) submit `jobs` jobs each to a fake
+    # provider that rejects anything beyond `limit` running jobs and a random
+    # failure_rate of submissions; the controller must get every job through
+    from qiskit import QuantumCircuit
+    from admission import AdmissionController, AdmittedSampler
+    from runtime_modes import FakeRuntimeBackend
+    qc = QuantumCircuit(4, 4)
+    qc.h(range(4))
+    qc.measure(range(4), range(4))
+
+    def run():
+        backend = FakeRuntimeBackend(queue_delay, failure_rate=failure_rate, max_in_flight=limit, seed=SEED)
+        controller = AdmissionController(max_jobs=limit, max_jobs_per_token=1, max_retries=5,
+                                         backoff_base=0.05, backoff_max=0.5, rng=random.Random(SEED))
+
+        errors = []
+
+        def user(token):
+            for _ in range(jobs):
+                try:
+                    AdmittedSampler(backend.sampler(), token, controller).run([qc], shots=16)
+                except Exception as e:
+                    errors.append(e)
+        _run_threads(user, [(f"user{u}",) for u in range(users)])
+        if errors:
+            raise errors[0]
+    return run, users * jobs
+
+
+@case("job_multiplexer", [{"jobs": 200, "path": path} for path in ("threads", "multiplexer")])
+def bench_job_multiplexer(jobs, path, queue_delay=0.5):
+    # Polling cost only: `jobs` pending fake-runtime jobs, waited for with
+    # one thread per job calling result() ("threads") or by the
+    # multiplexer's event loop ("multiplexer"). This is a synthetic harness;
+    # ibm_requests measures the app's request path
+    from qiskit import QuantumCircuit
+    from job_multiplexer import JobMultiplexer
+    from runtime_modes import FakeRuntimeBackend
+    qc = QuantumCircuit(2, 2)
+    qc.h(0)
+    qc.measure([0, 1], [0, 1])
+    backend = FakeRuntimeBackend(queue_delay)
+    multiplexer = JobMultiplexer()
+
+    def run():
+        pending = [backend.sampler().run([qc], shots=8) for _ in range(jobs)]
+        if path == "multiplexer":
+            return multiplexer.gather(pending)
+        _run_threads(lambda job: job.result(), [(job,) for job in pending])
+    return run, jobs
+
+
+@case("ibm_requests", [{"requests": 8}])
+def bench_ibm_requests(requests, queue_delay=0.5):
+    # `requests` POST /run/exp1 hardware runs sent one after another from a
+    # single client thread (as one gunicorn thread would serve them), then
+    # polled until all are done. Each POST returns 202 at once; the runs
+    # proceed on the background pool, limited by per-token admission
+    import time
+    import warnings
+    from runtime_modes import FakeRuntimeBackend
+    backend = FakeRuntimeBackend(queue_delay)
+    client = _flask_client(api_token="fake")
+
+    def run():
+        _use_fake_runtime(backend)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            urls = [client.post("/run/exp1", json={"backend": "ibm"}).get_json()["status_url"]
+                    for _ in range(requests)]
+            while urls:
+                tasks = [client.get(url).get_json() for url in urls]
+                failed = [t for t in tasks if t["status"] == "failed"]
+                if failed:
+                    raise RuntimeError(failed[0]["error"])
+                urls = [url for url, t in zip(urls, tasks) if t["status"] != "done"]
+                time.sleep(0.05)
+    return run, requests
+
+
+@case("key_pool", [{"keys": 2000, "path": path} for path in ("pool", "http")])
+def bench_key_pool(keys, path, size=256):
+    # Deposit `keys` keys' worth of distilled material, then hand each key
+    # out with enc_keys and back with dec_keys, on the pool directly
+    # ("pool") or through the ETSI routes of the Flask app ("http")
+    import key_pool
+    rng = np.random.default_rng(SEED)
+    deposits = [(bytes(rng.integers(0, 256, size // 8, dtype=np.uint8)).hex(), size) for _ in range(keys)]
+    client = _flask_client() if path == "http" else None
+
+    def run():
+        with key_pool._pools_lock:
+            key_pool._pools.pop(("alice", "bob"), None)
+        pool = key_pool.get_pool("alice", "bob", create=True)
+        for hex_key, bits in deposits:
+            pool.deposit(hex_key, bits)
+        for _ in range(keys):
+            if path == "pool":
+                key_id = pool.enc_keys(1, size)[0]["key_ID"]
+                pool.dec_keys([key_id])
+            else:
+                reply = client.get(f"/api/v1/keys/bob/enc_keys?number=1&size={size}",
+                                   headers={"X-SAE-ID": "alice"})
+                key_id = reply.get_json()["keys"][0]["key_ID"]
+                client.get(f"/api/v1/keys/alice/dec_keys?key_ID={key_id}", headers={"X-SAE-ID": "bob"})
+    return run, keys
+
+
+@case("otp_stream", [
+    {"megabytes": 4, "path": "bytes"},
+    {"megabytes": 4, "path": "numpy"},
+    {"megabytes": 64, "path": "numpy"},
+])
+def bench_otp_stream(megabytes, path):
+    # Encrypt a `megabytes` MB payload: exp1/exp2's xor_encrypt_decrypt on a
+    # list of key bits ("bytes", the old path) or otp_stream's NumPy XOR on
+    # bit-packed key bytes, 64 KiB at a time ("numpy"); items/s is MB/s
+    import io
+    rng = np.random.default_rng(SEED)
+    size = megabytes << 20
+    payload = bytes(rng.integers(0, 256, size, dtype=np.uint8))
+    key = bytes(rng.integers(0, 256, size, dtype=np.uint8))
+    if path == "bytes":
+        from experiments.exp1 import xor_encrypt_decrypt
+        key_bits = np.unpackbits(np.frombuffer(key, dtype=np.uint8))[:size].tolist()
+
+        def run():
+            xor_encrypt_decrypt(payload, key_bits)
+        return run, megabytes
+    from otp_stream import read_chunks, xor_stream
+
+    def run():
+        for _ in xor_stream(read_chunks(io.BytesIO(payload)), bytearray(key)):
+            pass
+    return run, megabytes
+
+
+@case("distillation", [
+    {"source": "monte_carlo", "block_bits": 1024},
+    {"source": "monte_carlo", "block_bits": 4096},
+    {"source": "aer", "block_bits": 1024},
+])
+def bench_distillation(source, block_bits, blocks=2):
+    # `blocks` raw blocks through the full distillation pipeline; items are
+    # pulses (photons or circuit qubits). The secure key rate and the per-stage
+    # throughput are in the pipeline's stats()
+    from distillation import DistillationPipeline, aer_source, monte_carlo_source
+    if source == "monte_carlo":
+        params, pulses = {"photons": 100000}, 100000
+    else:
+        params, pulses = {"qubits": 64, "circuits": 64}, 64 * 64
+
+    def run():
+        factory = monte_carlo_source if source == "monte_carlo" else aer_source
+        pipeline = DistillationPipeline(factory(seed=SEED, **params), block_bits=block_bits,
+                                        max_blocks=blocks, seed=SEED)
+        pipeline.start().join()
+    return run, blocks * pulses
+
+
+@case("reconciliation", [
+    {"method": method, "qber": qber} for qber in (0.01, 0.03, 0.05) for method in ("cascade", "ldpc")
+])
+def bench_reconciliation(method, qber, key_length=16384):
+    # Cascade vs. one-way LDPC on the same noisy key. run() returns the
+    # leaked bits and round trips (Cascade: ~1.9 bits leaked per key bit and
+    # 600-2400 round trips at 1-5% QBER; LDPC: 0.15-0.5 bits and 1)
+    from cascade_error_correction import cascade_error_correction
+    from ldpc_reconciliation import ldpc_reconcile
+    alice, bob = _noisy_pair(key_length, qber)
+    if method == "ldpc":
+        alice, bob = np.array(alice, dtype=np.uint8), np.array(bob, dtype=np.uint8)
+
+    def run():
+        if method == "ldpc":
+            return ldpc_reconcile(alice, bob, qber)
+        random.seed(SEED)
+        stats = {}
+        cascade_error_correction(alice, bob, stats=stats)
+        return stats
+    return run, key_length
+
+
+@case("verification", [
+    {"key_bits": bits, "method": method} for bits in (1024, 10 ** 6, 10 ** 7) for method in ("blake2b", "polynomial")
+])
+def bench_verification(key_bits, method):
+    # Tag comparison of two equal keys: the polynomial hash of
+    # key_verification vs. the blake2b digests the pipeline compared before
+    import hashlib
+    from key_verification import verify
+    rng = np.random.default_rng(SEED)
+    alice = rng.integers(0, 2, key_bits, dtype=np.uint8)
+    bob = alice.copy()
+
+    def digest(bits):
+        return hashlib.blake2b(np.packbits(bits).tobytes(), digest_size=16).digest()
+
+    def run():
+        if method == "blake2b":
+            return digest(alice) == digest(bob)
+        return verify(alice, bob, rng=rng)
+    return run, key_bits
+
+
+@case("network_routing", [{"nodes": nodes, "updates": 2000} for nodes in (50, 200)])
+def bench_network_routing(nodes, updates):
+    # Random link inserts, rate changes (some to 0) and removals applied
+    # incrementally; run() fails if the maintained bottleneck matrix ever
+    # differs from a from-scratch recompute. Items are link updates
+    from network_routing import TrustedNodeNetwork
+    rng = np.random.default_rng(SEED)
+    names = [f"node{i}" for i in range(nodes)]
+    ops = [(*rng.choice(names, 2, replace=False), float(rng.choice([0.0, rng.uniform(1, 100)], p=[0.1, 0.9])),
+            rng.random() < 0.15) for _ in range(updates)]
+
+    def run():
+        net = TrustedNodeNetwork()
+        for name in names:
+            net.add_node(name)
+        net.bottleneck_matrix()
+        for i, (a, b, rate, remove) in enumerate(ops):
+            if remove:
+                try:
+                    net.remove_link(a, b)
+                except KeyError:
+                    pass
+            else:
+                net.set_link(a, b, rate)
+            if i % 50 == 0 and not net.verify():
+                raise AssertionError(f"bottleneck matrix diverged after update {i}")
+        if not net.verify():
+            raise AssertionError("bottleneck matrix diverged from a full recompute")
+    return run, updates
+
+
+@case("qrng_health", [
+    {"raw_bits": bits, "stage": stage} for bits in (10 ** 5, 10 ** 7) for stage in ("health", "extract")
+])
+def bench_qrng_health(raw_bits, stage):
+    # Post-processing of raw QRNG bits: the streaming health tests (in
+    # 64 kbit chunks) or Toeplitz extraction; items are raw bits
+    from qrng_health import HealthTests, ToeplitzExtractor
+    raw = np.random.default_rng(SEED).integers(0, 2, raw_bits, dtype=np.uint8)
+    extractor = ToeplitzExtractor(seed=SEED)
+
+    def run():
+        if stage == "extract":
+            return extractor.extract(raw)
+        health = HealthTests()
+        for start in range(0, raw_bits, 1 << 16):
+            health.update(raw[start:start + (1 << 16)])
+        return health.stats()
+    return run, raw_bits
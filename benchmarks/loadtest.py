@@ -0,0 +1,410 @@
+"""
+Localhost HTTP Load Test for the Flask Endpoints
+
+Starts the app under gunicorn (benchmarks/loadtest_app.py, which stubs
+QiskitRuntimeService), drives a weighted mix of requests and reports
+p50/p95/p99 latency, error rate and throughput per endpoint. With several
+--workers / --threads values it sweeps every combination and recommends the
+configuration with the highest throughput that meets the latency/error SLO.
+
+Usage (from the repository root):
+    python benchmarks/loadtest.py --workers 1 --threads 1,2,4,8 --concurrency 8 --duration 30
+    python benchmarks/loadtest.py --workers 1,2,4 --threads 1,2,4 --mix experiments
+    python benchmarks/loadtest.py --rate 5 --mix exp2=1,exp2_encrypt=4,cli=4
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000 --mix interactive
+
+Load models:
+- Closed loop (--concurrency N): N virtual users each send their next
+  request as soon as the previous one returns
+- Open loop (--rate R): requests arrive every 1/R s regardless of how fast
+  the server answers; latency is measured from the scheduled arrival time,
+  so queueing delay is not hidden (no coordinated omission)
+
+Sizing: key pools, background IBM tasks and the last results live in each
+worker's memory, so the deploy runs a single worker and scales with
+--threads. Sweeps with --workers > 1 only describe the stateless endpoints
+(the "experiments" mix): there, exp2_encrypt fails whenever it reaches a
+worker whose pool is empty, and a recommendation of more than one worker is
+flagged.
+
+Operations:
+- exp1..exp4      POST /run/expN (local Aer backend)
+- exp2_encrypt    POST /run/exp2 with a message (one-time pad with a key
+                  from the pool; fails when exp2 runs have not filled it)
+- cli             one /cli/command sequence (each command is a request)
+- ibm_status      GET /api/ibm/status with a saved stub token (the virtual
+                  user calls /api/ibm/save once first)
+
+Experiment runs redraw backend/static/circuit_exp*.png, as in production.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT_DIR, "benchmarks")
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+
+REQUEST_TIMEOUT = 130
+CLI_SEQUENCE = [
+    "enable",
+    "configure terminal",
+    "set loss 0.2",
+    "set channel-noise 0.01",
+    "exit",
+    "show system",
+    "exit",
+]
+
+MIXES = {
+    "default": {"exp1": 2, "exp2": 2, "exp2_encrypt": 2, "exp3": 1, "exp4": 1, "cli": 3, "ibm_status": 2},
+    "experiments": {"exp1": 1, "exp2": 1, "exp3": 1, "exp4": 1},
+    "interactive": {"exp2_encrypt": 3, "cli": 5, "ibm_status": 2},
+}
+
+
+# ---------------- CLIENT ----------------
+class VirtualUser:
+    """One browser-like client with its own session cookie."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.has_token = False
+
+    def request(self, method, path, body=None, reject=None, error_key=None):
+        """
+        Send one request.
+
+        Args:
+            reject (bytes, optional): Marker that makes a 2xx/3xx response
+                                      count as failed when it is in the body
+            error_key (str, optional): Field that makes a 2xx/3xx JSON
+                                       response count as failed when present
+
+        Returns:
+            tuple: (latency in s, ok flag)
+        """
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=REQUEST_TIMEOUT) as resp:
+                payload = resp.read()
+                ok = resp.status < 400 and not (reject and reject in payload)
+                if ok and error_key:
+                    reply = json.loads(payload)
+                    ok = not (isinstance(reply, dict) and error_key in reply)
+        except (urllib.error.URLError, OSError, ValueError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    def run(self, op):
+        """
+        Execute one operation of the mix.
+
+        Returns:
+            list: (endpoint label, latency s, ok) per HTTP request sent
+        """
+        if op in ("exp1", "exp2", "exp3", "exp4"):
+            return [(f"/run/{op}",) + self.request("POST", f"/run/{op}", {})]
+        if op == "exp2_encrypt":
+            # A run without key material answers 200 with an "error" field
+            return [("/run/exp2 (encrypt)",) + self.request("POST", "/run/exp2", {"message": "load test"},
+                                                            error_key="error")]
+        if op == "cli":
+            # The CLI answers unknown or out-of-mode commands with HTTP 200
+            return [("/cli/command",) + self.request("POST", "/cli/command", {"command": c},
+                                                     reject=b"Unknown command")
+                    for c in CLI_SEQUENCE]
+        if op == "ibm_status":
+            samples = []
+            if not self.has_token:
+                latency, ok = self.request("POST", "/api/ibm/save", {"token": "stub-loadtest"})
+                samples.append(("/api/ibm/save", latency, ok))
+                self.has_token = ok
+            samples.append(("/api/ibm/status",) + self.request("GET", "/api/ibm/status"))
+            return samples
+        raise ValueError(f"Unknown operation: {op}")
+
+
+def parse_mix(text):
+    if text in MIXES:
+        return dict(MIXES[text])
+    mix = {}
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        mix[op.strip()] = float(weight or 1)
+    unknown = set(mix) - set(MIXES["default"])
+    if unknown:
+        raise ValueError(f"Unknown operation(s) in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def run_load(base_url, mix, duration, concurrency=None, rate=None, seed=0):
+    """
+    Drive load against a running server.
+
+    Args:
+        base_url (str): e.g. "http://127.0.0.1:8000"
+        mix (dict): operation -> weight
+        duration (float): Measurement time in seconds
+        concurrency (int, optional): Closed-loop virtual users
+        rate (float, optional): Open-loop arrival rate (operations/s)
+
+    Returns:
+        tuple: (samples as (label, latency, ok), elapsed seconds)
+    """
+    ops, weights = zip(*mix.items())
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    samples = []
+    samples_lock = threading.Lock()
+
+    def pick():
+        with rng_lock:
+            return rng.choices(ops, weights)[0]
+
+    def record(result):
+        with samples_lock:
+            samples.extend(result)
+
+    start = time.perf_counter()
+    deadline = start + duration
+
+    if rate:
+        users = [VirtualUser(base_url) for _ in range(max(1, concurrency or 64))]
+        free = list(users)
+        free_lock = threading.Lock()
+
+        def arrival(scheduled):
+            # Time spent waiting for a free client thread counts as latency
+            queued = max(0.0, time.perf_counter() - scheduled)
+            with free_lock:
+                user = free.pop() if free else VirtualUser(base_url)
+            result = user.run(pick())
+            label, latency, ok = result[0]
+            result[0] = (label, latency + queued, ok)
+            record(result)
+            with free_lock:
+                free.append(user)
+
+        with ThreadPoolExecutor(max_workers=256) as pool:
+            n = 0
+            while True:
+                scheduled = start + n / rate
+                if scheduled >= deadline:
+                    break
+                time.sleep(max(0.0, scheduled - time.perf_counter()))
+                pool.submit(arrival, scheduled)
+                n += 1
+    else:
+        def loop():
+            user = VirtualUser(base_url)
+            while time.perf_counter() < deadline:
+                record(user.run(pick()))
+
+        threads = [threading.Thread(target=loop) for _ in range(concurrency or 4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    """Per-endpoint and overall latency percentiles, error rate and throughput."""
+    groups = {}
+    for label, latency, ok in samples:
+        groups.setdefault(label, []).append((latency, ok))
+    groups["overall"] = [(latency, ok) for _, latency, ok in samples]
+
+    report = {}
+    for label, rows in groups.items():
+        if not rows:
+            continue
+        lat = np.array([r[0] for r in rows])
+        errors = sum(1 for r in rows if not r[1])
+        p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+        report[label] = {
+            "requests": len(rows),
+            "errors": errors,
+            "error_rate": errors / len(rows),
+            "p50_s": float(p50),
+            "p95_s": float(p95),
+            "p99_s": float(p99),
+            "throughput_rps": len(rows) / elapsed if elapsed > 0 else None,
+        }
+    return report
+
+
+def print_report(report, title):
+    print(f"\n{title}")
+    print(f"{'endpoint':<24} {'reqs':>6} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for label, r in sorted(report.items(), key=lambda kv: kv[0] == "overall"):
+        print(f"{label:<24} {r['requests']:>6} {r['error_rate'] * 100:>6.1f} {r['p50_s'] * 1e3:>9.1f} "
+              f"{r['p95_s'] * 1e3:>9.1f} {r['p99_s'] * 1e3:>9.1f} {r['throughput_rps']:>8.2f}")
+
+
+# ---------------- SERVER ----------------
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(base_url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + "/health", timeout=5) as resp:
+                if resp.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout}s")
+
+
+def start_server(workers, threads, port, env=None):
+    """
+    Start gunicorn with the same flags as the Procfile, on localhost.
+
+    The layout is also exported (WEB_CONCURRENCY, QKD_WORKER_THREADS) so each
+    worker sizes its Aer thread budget for this configuration.
+    """
+    env = {"WEB_CONCURRENCY": str(workers), "QKD_WORKER_THREADS": str(threads), **(env or {})}
+    cmd = [
+        sys.executable, "-m", "gunicorn", "loadtest_app:app",
+        "--chdir", BACKEND_DIR, "--pythonpath", BENCH_DIR,
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers), "--threads", str(threads), "--timeout", "120",
+        "--log-level", "warning",
+    ]
+    return subprocess.Popen(cmd, env={**os.environ, **env})
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def warm_up(base_url, parallel):
+    # Each gunicorn worker needs Aer loaded and a last exp2 key before
+    # exp2_encrypt can succeed; parallel runs spread over the workers
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        list(pool.map(lambda _: VirtualUser(base_url).run("exp2"), range(parallel)))
+
+
+def recommend(runs, max_error_rate, p95_slo):
+    ok = [r for r in runs
+          if r["report"]["overall"]["error_rate"] <= max_error_rate
+          and r["report"]["overall"]["p95_s"] <= p95_slo]
+    if not ok:
+        return None
+    best = max(ok, key=lambda r: r["report"]["overall"]["throughput_rps"])
+    return {"workers": best["workers"], "threads": best["threads"],
+            "throughput_rps": best["report"]["overall"]["throughput_rps"],
+            "p95_s": best["report"]["overall"]["p95_s"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Localhost load test for the QKD Flask app")
+    parser.add_argument("--url", help="Target an already running server instead of starting gunicorn")
+    parser.add_argument("--workers", default="1",
+                        help="Comma-separated gunicorn worker counts to sweep (the key pool needs 1)")
+    parser.add_argument("--threads", default="2", help="Comma-separated gunicorn thread counts to sweep")
+    parser.add_argument("--mix", default="default",
+                        help=f"Named mix ({', '.join(MIXES)}) or op=weight,... "
+                             f"(ops: {', '.join(MIXES['default'])})")
+    parser.add_argument("--concurrency", type=int, default=4, help="Closed-loop virtual users")
+    parser.add_argument("--rate", type=float, help="Open-loop arrival rate (operations/s)")
+    parser.add_argument("--duration", type=float, default=30, help="Measurement time per configuration (s)")
+    parser.add_argument("--ibm-latency", type=float, default=0.2, help="Stub IBM round trip (s)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--p95-slo", type=float, default=5.0, help="p95 latency limit for the recommendation (s)")
+    parser.add_argument("--out", default="loadtest_results.json")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    runs = []
+    if args.url:
+        configs = [(None, None)]
+    else:
+        configs = [(int(w), int(t)) for w in args.workers.split(",") for t in args.threads.split(",")]
+
+    for workers, threads in configs:
+        proc = None
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            proc = start_server(workers, threads, port, env={"QKD_LOADTEST_IBM_LATENCY": str(args.ibm_latency)})
+        try:
+            wait_ready(base_url)
+            warm_up(base_url, max(2, (workers or 1) * (threads or 1) * 2))
+            samples, elapsed = run_load(base_url, mix, args.duration,
+                                        concurrency=args.concurrency, rate=args.rate)
+        finally:
+            if proc is not None:
+                stop_server(proc)
+        report = summarize(samples, elapsed)
+        title = f"workers={workers} threads={threads}" if workers else base_url
+        print_report(report, title)
+        runs.append({"workers": workers, "threads": threads, "elapsed_s": elapsed, "report": report})
+
+    result = {
+        "meta": {
+            "mix": mix,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "duration_s": args.duration,
+            "ibm_latency_s": args.ibm_latency,
+            "timestamp": time.time(),
+        },
+        "runs": runs,
+    }
+    if not args.url:
+        result["recommendation"] = recommend(runs, args.max_error_rate, args.p95_slo)
+        rec = result["recommendation"]
+        if rec:
+            print(f"\nRecommended: --workers {rec['workers']} --threads {rec['threads']} "
+                  f"({rec['throughput_rps']:.2f} req/s, p95 {rec['p95_s'] * 1e3:.0f} ms)")
+            if rec["workers"] > 1:
+                print("Key pools and IBM tasks are per worker: the key API needs --workers 1")
+        else:
+            print("\nNo configuration met the error-rate / p95 limits")
+
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""
+WSGI entry point for load tests.
+
+Identical to backend/app.py except that QiskitRuntimeService is replaced with
+a stub, so /api/ibm/save and /api/ibm/status exercise the full validation
+path without network access or an IBM account. The stub sleeps for
+QKD_LOADTEST_IBM_LATENCY seconds (default 0.2) to mimic the IBM round trip.
+
+    gunicorn loadtest_app:app --chdir backend --pythonpath benchmarks ...
+"""
+
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import backend_config  # noqa: E402
+
+IBM_LATENCY = float(os.getenv("QKD_LOADTEST_IBM_LATENCY", "0.2"))
+
+
+class _StubBackend:
+    name = "stub_brisbane"
+
+
+class StubRuntimeService:
+    """Accepts any token starting with "stub"; everything else is rejected."""
+
+    def __init__(self, channel=None, token=None, **kwargs):
+        time.sleep(IBM_LATENCY / 2)
+        if not token or not token.startswith("stub"):
+            raise ValueError(f"{channel}: invalid token")
+
+    def least_busy(self, **kwargs):
+        time.sleep(IBM_LATENCY / 2)
+        return _StubBackend()
+
+
+backend_config.QiskitRuntimeService = StubRuntimeService
+
+from app import app  # noqa: E402,F401
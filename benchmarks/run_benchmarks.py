@@ -0,0 +1,165 @@
+"""
+BB84 Pipeline Benchmark Runner
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py run [--quick] [--only cascade,toeplitz] [--out results.json]
+    python benchmarks/run_benchmarks.py compare benchmarks/baseline.json results.json [--threshold 0.25]
+
+Measurement:
+1. One untimed warm-up call (imports, Aer initialization, caches)
+2. `--repeat` timed calls; the median wall time is reported
+3. One extra call under tracemalloc for the peak Python heap allocation
+   (kept separate so tracing overhead does not distort the timings)
+4. Throughput = items / median time (items are defined per case)
+
+`compare` exits with status 1 when any case is slower (or uses more peak
+memory) than the baseline by more than the threshold. Baselines are machine
+specific: regenerate benchmarks/baseline.json on the reference machine after
+intentional performance changes.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from cases import CASES  # noqa: E402
+
+
+def case_id(name, params):
+    return name + "".join(f"[{k}={v}]" for k, v in sorted(params.items()))
+
+
+def measure(factory, params, repeat):
+    """
+    Benchmark one parameterized case.
+
+    Returns:
+        dict: median/min wall time (s), peak memory (bytes), items, throughput
+    """
+    run, items = factory(**params)
+    run()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(times)
+    return {
+        "wall_time_s": median,
+        "wall_time_min_s": min(times),
+        "peak_memory_bytes": peak,
+        "items": items,
+        "throughput_items_per_s": items / median if median > 0 else None,
+    }
+
+
+def run_suite(only=None, quick=False, repeat=5):
+    results = {}
+    for name, (factory, grid) in CASES.items():
+        if only and name not in only:
+            continue
+        for params in grid[:1] if quick else grid:
+            cid = case_id(name, params)
+            results[cid] = {"case": name, "params": params, **measure(factory, params, repeat)}
+            r = results[cid]
+            print(f"{cid:<60} {r['wall_time_s'] * 1e3:10.2f} ms  "
+                  f"{r['peak_memory_bytes'] / 1024:10.1f} KiB  "
+                  f"{r['throughput_items_per_s']:14.0f} items/s", flush=True)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "repeat": repeat,
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare two result files.
+
+    Returns:
+        list: (case id, metric, baseline value, current value, ratio) for
+              every metric that regressed by more than threshold
+    """
+    regressions = []
+    for cid, cur in current["results"].items():
+        base = baseline["results"].get(cid)
+        if base is None:
+            print(f"{cid:<60} new case (no baseline)")
+            continue
+        time_ratio = cur["wall_time_s"] / base["wall_time_s"] if base["wall_time_s"] else 1.0
+        mem_ratio = (cur["peak_memory_bytes"] / base["peak_memory_bytes"]
+                     if base["peak_memory_bytes"] else 1.0)
+        flag = ""
+        if time_ratio > 1 + threshold:
+            regressions.append((cid, "wall_time_s", base["wall_time_s"], cur["wall_time_s"], time_ratio))
+            flag += " TIME REGRESSION"
+        if mem_ratio > 1 + threshold:
+            regressions.append((cid, "peak_memory_bytes", base["peak_memory_bytes"],
+                                cur["peak_memory_bytes"], mem_ratio))
+            flag += " MEMORY REGRESSION"
+        print(f"{cid:<60} time x{time_ratio:6.2f}  memory x{mem_ratio:6.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BB84 pipeline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="Run the benchmark suite")
+    run_p.add_argument("--out", default="benchmark_results.json", help="Output JSON file")
+    run_p.add_argument("--only", help="Comma-separated case names (%s)" % ", ".join(CASES))
+    run_p.add_argument("--quick", action="store_true", help="Only the smallest parameter set per case")
+    run_p.add_argument("--repeat", type=int, default=5, help="Timed repetitions per case")
+
+    cmp_p = sub.add_parser("compare", help="Compare results against a baseline")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=0.25,
+                       help="Allowed relative slowdown / memory growth (default 0.25 = 25%%)")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        only = set(args.only.split(",")) if args.only else None
+        unknown = (only or set()) - set(CASES)
+        if unknown:
+            parser.error(f"Unknown case(s): {', '.join(sorted(unknown))}")
+        report = run_suite(only=only, quick=args.quick, repeat=args.repeat)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
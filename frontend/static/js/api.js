@@ -3,13 +3,27 @@
 
 const BACKEND_URL = "https://ql215-production.up.railway.app"; // Set to "" for same-origin, or override as needed
 
+// IBM hardware runs answer 202 with a task; poll it until the result is ready
+async function experimentResult(res) {
+    const data = await res.json();
+    if (res.status !== 202) return data;
+    let delay = 1000;
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, delay));
+        const task = await (await fetch(`${BACKEND_URL}${data.status_url}`)).json();
+        if (task.status === "done") return task.result;
+        if (task.status === "failed" || task.error) return { error: task.error || "Task not found" };
+        delay = Math.min(delay * 1.5, 15000);
+    }
+}
+
 async function runExp1(data) {
     const res = await fetch(`${BACKEND_URL}/run/exp1`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(data)
     });
-    return res.json();
+    return experimentResult(res);
 }
 
 async function runExp2(data) {
@@ -18,7 +32,7 @@ async function runExp2(data) {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(data)
     });
-    return res.json();
+    return experimentResult(res);
 }
 
 async function runExp3(data) {
@@ -27,7 +41,7 @@ async function runExp3(data) {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(data)
     });
-    return res.json();
+    return experimentResult(res);
 }
 
 async function runExp4(data) {
@@ -36,7 +50,7 @@ async function runExp4(data) {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(data)
     });
-    return res.json();
+    return experimentResult(res);
 }
 
 // Export functions if using modules
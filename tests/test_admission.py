@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from admission import AdmissionController, is_retryable
+
+
+class ApiError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_retryable_errors_are_typed():
+    assert is_retryable(ApiError(429))
+    assert is_retryable(ConnectionError("reset"))
+    assert not is_retryable(ApiError(401))
+    # The message alone does not make an error retryable
+    assert not is_retryable(RuntimeError("429 Too Many Requests"))
+
+
+def test_wrapped_errors_are_unwrapped():
+    try:
+        try:
+            raise ApiError(503)
+        except ApiError as e:
+            raise RuntimeError("job failed") from e
+    except RuntimeError as wrapped:
+        assert is_retryable(wrapped)
+
+
+def test_submit_retries_transient_errors_only():
+    sleeps = []
+    controller = AdmissionController(max_retries=2, sleep=sleeps.append)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ApiError(429)
+        return "ok"
+
+    assert controller.submit("t", flaky) == "ok"
+    assert len(sleeps) == 2 and controller.stats()["retries"] == 2
+    with pytest.raises(ApiError):
+        controller.submit("t", lambda: (_ for _ in ()).throw(ApiError(400)))
+    assert controller.stats()["running"] == 0
+
+
+def test_per_token_cap():
+    controller = AdmissionController(max_jobs=4, max_jobs_per_token=1, queue_timeout=0.05)
+    controller.acquire("a")
+    other = threading.Thread(target=controller.acquire, args=("b",))
+    other.start()
+    other.join()
+    assert controller.stats()["running"] == 2
+    with pytest.raises(Exception, match="queue is full"):
+        controller.acquire("a")
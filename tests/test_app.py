@@ -0,0 +1,65 @@
+import base64
+
+import pytest
+
+app_module = pytest.importorskip("app")
+import key_pool
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(key_pool, "_pools", {})
+    return app_module.app.test_client()
+
+
+def fill_pool(bits=4096):
+    pool = key_pool.get_pool(key_pool.MASTER_SAE_ID, key_pool.SLAVE_SAE_ID, create=True)
+    pool.deposit("a5" * (bits // 8), bits)
+    return pool
+
+
+def test_keys_are_delivered_to_the_slave_once(client):
+    fill_pool()
+    master, slave = key_pool.MASTER_SAE_ID, key_pool.SLAVE_SAE_ID
+    enc = client.get(f"/api/v1/keys/{slave}/enc_keys?number=2&size=256", headers={"X-SAE-ID": master})
+    assert enc.status_code == 200
+    keys = enc.get_json()["keys"]
+    assert len(keys) == 2 and len(base64.b64decode(keys[0]["key"])) == 32
+    dec = client.get(f"/api/v1/keys/{master}/dec_keys?key_ID={keys[0]['key_ID']}",
+                     headers={"X-SAE-ID": slave})
+    assert dec.get_json()["keys"] == keys[:1]
+    again = client.get(f"/api/v1/keys/{master}/dec_keys?key_ID={keys[0]['key_ID']}",
+                       headers={"X-SAE-ID": slave})
+    assert again.status_code == 404
+
+
+def test_otp_round_trip(client):
+    fill_pool()
+    master, slave = key_pool.MASTER_SAE_ID, key_pool.SLAVE_SAE_ID
+    body = b"attack at dawn" * 10
+    enc = client.post(f"/api/v1/otp/{slave}/encrypt", data=body, headers={"X-SAE-ID": master})
+    assert enc.status_code == 200 and enc.data != body
+    dec = client.post(f"/api/v1/otp/{master}/decrypt?key_ID={enc.headers['X-Key-ID']}", data=enc.data,
+                      headers={"X-SAE-ID": slave})
+    assert dec.data == body
+
+
+def test_keyrate_revalidates_with_etag(client):
+    first = client.get("/api/keyrate?model=bb84&max_distance=50")
+    assert first.status_code == 200
+    again = client.get("/api/keyrate?model=bb84&max_distance=50", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert client.get("/api/keyrate?max_distance=1e9&step=1e-6").status_code == 400
+
+
+def test_distillation_start_needs_a_block_limit(client):
+    assert client.post("/api/distillation/start", json={}).status_code == 400
+
+
+def test_exp2_message_without_a_distilled_key_uses_the_pool(client, monkeypatch):
+    fill_pool()
+    monkeypatch.setattr(app_module, "last_exp2_result", {"final_secret_key": "", "qber": 0.0})
+    reply = client.post("/run/exp2", json={"message": "hello"})
+    assert reply.status_code == 200
+    body = reply.get_json()
+    assert "error" not in body and body["decrypted_message"] == "hello" and body["key_ID"]
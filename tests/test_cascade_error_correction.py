@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+import pytest
+
+from cascade_error_correction import cascade_error_correction, cascade_reconcile, initial_block_size
+from key_verification import POINT_BITS
+
+
+def noisy_pair(n, qber, seed=0):
+    rng = np.random.default_rng(seed)
+    alice = rng.integers(0, 2, n)
+    return alice.tolist(), (alice ^ (rng.random(n) < qber)).tolist()
+
+
+def test_block_size_follows_the_qber():
+    assert initial_block_size(0.0) == 64
+    assert initial_block_size(0.02) == 32
+    assert initial_block_size(0.2) == 8
+
+
+def test_reconcile_charges_parities_and_tags():
+    random.seed(0)
+    alice, bob = noisy_pair(320, 0.02)
+    stats = {}
+    cascade_error_correction(alice, bob, initial_block_size=32, stats=stats)
+    random.seed(0)
+    run = cascade_reconcile(alice, bob, 0.02)
+    assert run["verified"] and run["bob"] == alice
+    assert run["leaked_bits"] >= stats["leaked_bits"] + POINT_BITS
+    assert (run["leaked_bits"] - stats["leaked_bits"]) % POINT_BITS == 0
+
+
+@pytest.mark.parametrize("module", ["exp1", "exp2"])
+def test_local_experiments_distill_a_key(module, monkeypatch):
+    pytest.importorskip("qiskit_aer")
+    from matplotlib.figure import Figure
+    import importlib
+    experiment = importlib.import_module(f"experiments.{module}")
+
+    class _Figure(Figure):
+        def savefig(self, *args, **kwargs):
+            pass
+    # Keep backend/static untouched
+    monkeypatch.setattr(experiment, "circuit_drawer", lambda *args, **kwargs: _Figure())
+    run = getattr(experiment, f"run_{module}")(rng_seed=5)
+    assert run["key_verified"]
+    assert run["verification_leaked_bits"] > 2 * POINT_BITS
+    assert run["final_secret_key_bits"] > 0 and run["final_secret_key"]
+    assert len(run["Sender_bits"]) == 32 * 20
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from decoy_state import estimate_single_photon, run_decoy_bb84, vacuum_yield_bound
+
+ETA, Y0, ED = 1e-3, 1e-5, 0.02
+
+
+def gains(intensity):
+    # Exact gain and error gain of the standard channel model (Ma et al. 2005)
+    q = Y0 + 1 - np.exp(-ETA * intensity)
+    eq = 0.5 * Y0 + ED * (1 - np.exp(-ETA * intensity))
+    return q, eq / q
+
+
+TRUE_Y1 = Y0 + ETA
+TRUE_E1 = (0.5 * Y0 + ED * ETA) / TRUE_Y1
+
+
+def test_vacuum_decoy_bound_matches_closed_form():
+    mu, nu = 0.5, 0.1
+    (q_mu, _), (q_nu, e_nu) = gains(mu), gains(nu)
+    y1, q1, e1 = estimate_single_photon(mu, nu, q_mu, q_nu, e_nu, Y0)
+    expected = mu / (mu * nu - nu ** 2) * (
+        q_nu * np.exp(nu) - q_mu * np.exp(mu) * nu ** 2 / mu ** 2 - (mu ** 2 - nu ** 2) / mu ** 2 * Y0)
+    assert y1 == pytest.approx(expected)
+    assert q1 == pytest.approx(y1 * mu * np.exp(-mu))
+    assert e1 == pytest.approx((e_nu * q_nu * np.exp(nu) - 0.5 * Y0) / (nu * y1))
+
+
+@pytest.mark.parametrize("vac", [0.0, 0.01, 0.05])
+def test_bounds_are_safe_and_tight(vac):
+    mu, nu = 0.5, 0.1
+    (q_mu, _), (q_nu, e_nu), (q_vac, e_vac) = gains(mu), gains(nu), gains(vac)
+    y1, _, e1 = estimate_single_photon(mu, nu, q_mu, q_nu, e_nu, q_vac, e_vac, vac)
+    assert 0.8 * TRUE_Y1 < y1 <= TRUE_Y1
+    assert TRUE_E1 <= e1 < 1.5 * TRUE_E1
+
+
+def test_vacuum_yield_bound_is_the_vacuum_gain_at_zero_intensity():
+    assert vacuum_yield_bound(0.1, gains(0.1)[0], Y0) == pytest.approx(Y0)
+    assert vacuum_yield_bound(0.1, gains(0.1)[0], gains(0.05)[0], 0.05) <= Y0 * (1 + 1e-9)
+
+
+def test_run_rejects_unordered_intensities():
+    with pytest.raises(ValueError):
+        run_decoy_bb84(0.5, 0.1, 0.2, 1000, 0.1, 1e-5, 0.01)
+
+
+def test_run_reports_secure_rate_on_short_link():
+    out = run_decoy_bb84(0.5, 0.1, 0.0, 200_000, 0.1, 1e-5, 0.01, rng=np.random.default_rng(1))
+    assert out["secure"] and out["final"] > 0
+    assert out["e1"] < 0.1
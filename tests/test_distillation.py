@@ -0,0 +1,43 @@
+import pytest
+
+import distillation
+from distillation import DistillationPipeline, monte_carlo_source, request_options
+
+
+def test_pipeline_distills_into_the_sink():
+    keys = []
+    pipeline = DistillationPipeline(monte_carlo_source(seed=1), block_bits=1024, max_blocks=2, seed=1,
+                                    sink=lambda hex_key, bits: keys.append(bits)).start()
+    assert pipeline.join(60)
+    stats = pipeline.stats()
+    assert not stats["running"]
+    assert stats["keys"] == len(keys) > 0
+    assert stats["secure_bits"] == sum(keys)
+    # Every key is shorter than its block by at least the QBER margin
+    assert max(keys) < 0.9 * 1024
+
+
+def test_failing_stage_stops_every_thread():
+    pipeline = DistillationPipeline(monte_carlo_source(seed=1), block_bits=1024, queue_size=1, seed=1)
+
+    def boom(block):
+        raise RuntimeError("boom")
+
+    pipeline.stages[2].func = boom
+    pipeline.start()
+    assert pipeline.join(30)
+    assert not pipeline.running
+    assert pipeline.stats()["stages"]["reconcile"]["error"] == "boom"
+
+
+def test_request_options_clamp_and_require_max_blocks():
+    source, params, options = request_options(
+        {"source_params": {"photons": 1e12}, "block_bits": 10 ** 9, "max_blocks": 10 ** 9})
+    assert source == "monte_carlo"
+    assert params["photons"] == 1_000_000
+    assert options == {"block_bits": 16384, "max_blocks": distillation.MAX_REQUEST_BLOCKS}
+    with pytest.raises(ValueError):
+        request_options({})
+    with pytest.raises(ValueError):
+        request_options({"max_blocks": float("inf")})
+    assert request_options({}, operator=True)[2] == {}
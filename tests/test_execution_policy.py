@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("qiskit_aer")
+from qiskit import QuantumCircuit, transpile
+
+from backend_config import get_local_simulator
+from execution_policy import choose_method, is_clifford
+
+
+def bb84(qubits, seed=0):
+    rng = np.random.default_rng(seed)
+    qc = QuantumCircuit(qubits, qubits)
+    for q, (bit, prep, meas) in enumerate(rng.integers(0, 2, (qubits, 3))):
+        if bit:
+            qc.x(q)
+        if prep:
+            qc.h(q)
+        if meas:
+            qc.h(q)
+        qc.measure(q, q)
+    return qc
+
+
+def test_bb84_circuits_run_on_the_stabilizer_method():
+    assert choose_method(bb84(20)) == "stabilizer"
+    assert choose_method(bb84(64)) == "stabilizer"
+
+
+def test_rz_by_quarter_turns_is_clifford():
+    qc = QuantumCircuit(1)
+    qc.rz(np.pi / 2, 0)
+    assert is_clifford(qc)
+    qc.rz(np.pi / 4, 0)
+    assert not is_clifford(qc)
+
+
+def test_u2_from_transpiling_is_not_classed_as_stabilizer():
+    # AerSimulator's basis merges x+h into u2, which the stabilizer method rejects
+    qc = QuantumCircuit(1, 1)
+    qc.x(0)
+    qc.h(0)
+    qc.measure(0, 0)
+    tqc = transpile(qc, get_local_simulator("ideal"))
+    assert "u2" in tqc.count_ops()
+    assert is_clifford(qc) and not is_clifford(tqc)
+
+
+def test_wide_non_clifford_circuits_use_mps():
+    qc = bb84(24)
+    qc.t(0)
+    assert choose_method(qc) == "matrix_product_state"
+    assert choose_method(bb84(8)) == "statevector"
@@ -0,0 +1,19 @@
+import pytest
+
+from key_distribution_sim import chain_paths, simulate_distribution
+
+
+@pytest.mark.parametrize("mode", ["Sequential", "Parallel"])
+def test_users_without_links_do_not_stall_the_schedule(mode):
+    result = simulate_distribution([[], [0], [1]], [1000.0, 1000.0], 256, 0.01, mode=mode)
+    assert result["completed"] == 3
+    assert result["events"] > 0
+
+
+def test_sequential_runs_users_one_after_another():
+    paths, n_links = chain_paths([1, 1])
+    rates = [1000.0] * n_links
+    seq = simulate_distribution(paths, rates, 256, 0.01, mode="Sequential")
+    par = simulate_distribution(paths, rates, 256, 0.01, mode="Parallel")
+    assert seq["completed"] == par["completed"] == 2
+    assert seq["makespan_s"] > par["makespan_s"]
@@ -0,0 +1,47 @@
+import pytest
+
+import key_pool
+from key_pool import KeyPool, KeyPoolEmpty
+
+
+def test_deposits_are_packed_across_byte_boundaries():
+    pool = KeyPool("a", "b")
+    assert pool.deposit("f0", 4) == 0          # 1111 waits for 4 more bits
+    assert pool.deposit("a0", 4) == 8          # + 1010
+    assert pool.take(1)["key"] == bytearray(b"\xfa")
+
+
+def test_keys_are_delivered_once():
+    pool = KeyPool("a", "b")
+    pool.deposit("00112233445566778899aabbccddeeff", 128)
+    keys = pool.enc_keys(number=2, size=64)
+    assert [bytes(k["key"]) for k in keys] == [bytes.fromhex("0011223344556677"),
+                                               bytes.fromhex("8899aabbccddeeff")]
+    delivered = pool.dec_keys([keys[1]["key_ID"]])
+    assert delivered[0]["key"] == keys[1]["key"]
+    with pytest.raises(KeyError):
+        pool.dec_keys([keys[1]["key_ID"]])
+    with pytest.raises(KeyPoolEmpty):
+        pool.enc_keys(number=1, size=8)
+
+
+def test_capacity_drops_excess_bits():
+    pool = KeyPool("a", "b", max_bits=16)
+    assert pool.deposit("aabbcc", 24) == 16
+    assert pool.status(size=8)["dropped_bits"] == 8
+
+
+@pytest.mark.parametrize("number,size", [(0, 256), (1, 7), (1, 12), (1, key_pool.MAX_KEY_SIZE + 8)])
+def test_invalid_requests(number, size):
+    with pytest.raises(ValueError):
+        key_pool.validate_request(number, size)
+
+
+def test_deposit_result_moves_the_key_out_of_the_result(monkeypatch):
+    monkeypatch.setattr(key_pool, "_pools", {})
+    result = {"final_secret_key": "abcd", "final_secret_key_bits": 16, "qber": 2.0}
+    assert key_pool.deposit_result(result, "m", "s") == 16
+    assert result["final_secret_key"] is None and result["key_pool_bits"] == 16
+    noisy = {"final_secret_key": "abcd", "final_secret_key_bits": 16, "qber": 20.0}
+    assert key_pool.deposit_result(noisy, "m", "s") == 0
+    assert noisy["final_secret_key"] == "abcd"
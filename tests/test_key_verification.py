@@ -0,0 +1,27 @@
+import numpy as np
+
+from key_verification import POINT_BITS, points_needed, verify, verify_reconciliation
+
+
+def test_equal_keys_match_and_different_keys_do_not():
+    rng = np.random.default_rng(0)
+    key = rng.integers(0, 2, 10_000, dtype=np.uint8)
+    other = key.copy()
+    other[1234] ^= 1
+    assert verify(key, key.copy(), rng=rng)["match"]
+    assert not verify(key, other, rng=rng)["match"]
+
+
+def test_tag_bits_reach_epsilon():
+    check = verify([1, 0, 1], [1, 0, 1], epsilon=1e-12)
+    assert check["epsilon"] <= 1e-12
+    assert check["tag_bits"] == POINT_BITS * points_needed(3, 1e-12)
+
+
+def test_failed_key_is_reconciled_again_and_all_tags_count():
+    alice = [1, 0, 1, 1]
+    out = verify_reconciliation(alice, [0, 0, 1, 1], reconcile=lambda bob: list(alice))
+    assert out["verified"] and out["attempts"] == 2
+    assert out["leaked_bits"] == 2 * POINT_BITS * points_needed(4)
+    out = verify_reconciliation(alice, [0, 0, 1, 1])
+    assert out["bob"] is None and not out["verified"]
@@ -0,0 +1,32 @@
+import pytest
+
+from keyrate_model import (MAX_POINTS, check_size, distance_grid, keyrate_payload, normalize_query,
+                           point_count)
+
+
+def test_point_count_matches_the_grid():
+    params = [("alpha", (0.2, 0.25)), ("eta_det", (0.6,))]
+    for max_distance, step in [(400.0, 2.0), (10.0, 3.0), (0.0, 1.0), (99.9, 0.1)]:
+        assert point_count(max_distance, step, params) == 2 * len(distance_grid(max_distance, step))
+
+
+def test_oversized_queries_fail_before_allocating():
+    with pytest.raises(ValueError):
+        normalize_query({"max_distance": "1e300", "step": "1e-300"})
+    with pytest.raises(ValueError):
+        normalize_query({"alpha": ",".join(str(i) for i in range(MAX_POINTS // 100))})
+    with pytest.raises(ValueError):
+        check_size(400.0, 2.0, [("alpha", tuple(range(MAX_POINTS)))])
+
+
+@pytest.mark.parametrize("step", ["0", "-1", "nan", "inf"])
+def test_invalid_step_is_rejected(step):
+    with pytest.raises(ValueError):
+        normalize_query({"step": step})
+
+
+def test_equivalent_queries_share_cache_entry_and_etag():
+    a = normalize_query({"model": "bb84", "mu": "0.5,0.4", "max_distance": "100"})
+    b = normalize_query({"model": "BB84", "mu": "0.4,0.5000000000001", "max_distance": "100.0"})
+    assert a == b
+    assert keyrate_payload(a)[1] == keyrate_payload(b)[1]
@@ -0,0 +1,38 @@
+import numpy as np
+
+from ldpc_reconciliation import RATES, ldpc_reconcile, parity_check_matrix, select_rate, syndrome
+
+
+def noisy_keys(n, qber, seed=0):
+    rng = np.random.default_rng(seed)
+    alice = rng.integers(0, 2, n, dtype=np.uint8)
+    return alice, alice ^ (rng.random(n) < qber).astype(np.uint8)
+
+
+def test_rate_falls_with_qber():
+    rates = [select_rate(q) for q in (0.005, 0.02, 0.05, 0.08)]
+    assert rates == sorted(rates, reverse=True)
+    assert all(r in RATES for r in rates)
+
+
+def test_reconciles_and_counts_syndrome_leakage():
+    alice, bob = noisy_keys(2 * 4096 + 1000, 0.02)
+    run = ldpc_reconcile(alice, bob, 0.02)
+    assert run["frame_errors"] == 0
+    assert np.array_equal(run["alice"], run["bob"])
+    H = parity_check_matrix(run["rate"])
+    assert run["leaked_bits"] == 3 * H.shape[0]
+    assert run["round_trips"] == 1
+
+
+def test_undecoded_frames_are_dropped():
+    alice, bob = noisy_keys(4096, 0.2)
+    run = ldpc_reconcile(alice, bob, 0.01, rate=0.9)
+    assert run["frame_errors"] == 1
+    assert len(run["alice"]) == len(run["bob"]) == 0
+
+
+def test_syndrome_of_a_codeword_difference():
+    H = parity_check_matrix(0.5, frame_bits=256)
+    a, b = noisy_keys(256, 0.1, seed=4)
+    assert np.array_equal(syndrome(H, a) ^ syndrome(H, b), syndrome(H, a ^ b))
@@ -0,0 +1,32 @@
+import json
+import os
+
+import metrics
+
+
+def test_merge_sums_live_workers_and_drops_dead_ones(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_counters", {})
+    monkeypatch.setattr(metrics, "_histograms", {})
+    snapshot = {"histograms": [], "counters": [["qkd_events_total", [["event", "run"]], 2]]}
+    # A live process (this one's parent) and a pid that cannot exist
+    (tmp_path / f"metrics_{os.getppid()}.json").write_text(json.dumps(snapshot))
+    dead = tmp_path / "metrics_999999999.json"
+    dead.write_text(json.dumps(snapshot))
+
+    text = metrics.render_prometheus()
+    assert 'qkd_events_total{event="run"} 2' in text
+    assert not dead.exists()
+
+
+def test_histogram_is_cumulative(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(metrics, "METRICS_DIR", None)
+    monkeypatch.setattr(metrics, "_histograms", {})
+    monkeypatch.setattr(metrics, "_counters", {})
+    metrics.observe("qkd_stage_duration_seconds", 0.002, stage="x")
+    metrics.observe("qkd_stage_duration_seconds", 3.0, stage="x")
+    text = metrics.render_prometheus()
+    assert 'qkd_stage_duration_seconds_bucket{stage="x",le="0.005"} 1' in text
+    assert 'qkd_stage_duration_seconds_bucket{stage="x",le="+Inf"} 2' in text
+    assert 'qkd_stage_duration_seconds_count{stage="x"} 2' in text
@@ -0,0 +1,40 @@
+import json
+
+import numpy as np
+import pytest
+
+import multiuser_engine as engine
+
+
+def test_summary_of_failed_sessions_is_valid_json():
+    results = engine.simulate_network(engine.default_user_distances(3, 500_000))
+    summary = engine.summarize(results)
+    assert summary["failure_count"] == 3
+    assert summary["total_time"] is None
+    json.dumps(summary, allow_nan=False)
+    json.dumps(engine.to_json(results), allow_nan=False)
+
+
+def test_total_link_count_is_bounded():
+    with pytest.raises(ValueError, match="trusted-node links"):
+        engine.simulate_network([100, 200, 300], link_length=1e-4)
+    with pytest.raises(ValueError):
+        engine.simulate_network([100, float("inf")])
+    with pytest.raises(ValueError):
+        engine.simulate_network([100], link_length=float("nan"))
+
+
+def test_user_count_is_bounded():
+    with pytest.raises(ValueError):
+        engine.default_user_distances(engine.MAX_USERS + 1, 500)
+    with pytest.raises(ValueError):
+        engine.default_user_distances(0, 500)
+
+
+def test_vectorized_columns_match_the_scalar_model():
+    results = engine.simulate_network([50, 150, 250], link_length=100)
+    assert results["trusted_nodes"].tolist() == [1, 2, 3]
+    q_link = results["per_link_qber"][0]
+    expected = 100 * (1 - (1 - q_link / 100) ** 3)
+    assert results["end_to_end_qber"][2] == pytest.approx(round(expected, 2))
+    assert np.all(results["session_formed"])
@@ -0,0 +1,60 @@
+import random
+
+import numpy as np
+import pytest
+
+from network_routing import TrustedNodeNetwork, reference_bottleneck_matrix
+
+
+def test_widest_path_prefers_the_higher_bottleneck():
+    net = TrustedNodeNetwork()
+    net.set_link("A", "B", 10)
+    net.set_link("B", "C", 10)
+    net.set_link("A", "C", 5)
+    route = net.route("A", "C")
+    assert route["path"] == ["A", "B", "C"]
+    assert route["key_rate"] == 10
+    net.set_link("B", "C", 1)
+    assert net.route("A", "C")["path"] == ["A", "C"]
+
+
+def test_zero_rate_links_are_not_routes():
+    net = TrustedNodeNetwork()
+    net.set_link("A", "B", 0)
+    assert net.route("A", "B") is None
+    assert net.bottleneck("A", "B") == 0
+    net.set_link("A", "B", 3)
+    net.set_link("A", "B", 0)
+    assert net.route("A", "B") is None
+
+
+def test_qber_composes_over_hops():
+    net = TrustedNodeNetwork()
+    net.set_link("A", "B", 1, qber=0.1)
+    net.set_link("B", "C", 1, qber=0.2)
+    assert net.route("A", "C")["qber"] == pytest.approx(1 - 0.9 * 0.8)
+
+
+def test_incremental_updates_match_full_recompute():
+    rng = random.Random(7)
+    net = TrustedNodeNetwork()
+    names = [f"n{i}" for i in range(12)]
+    for name in names:
+        net.add_node(name)
+    net.bottleneck_matrix()  # keep the matrix incrementally from here on
+    for _ in range(300):
+        a, b = rng.sample(names, 2)
+        if rng.random() < 0.2:
+            try:
+                net.remove_link(a, b)
+            except KeyError:
+                pass
+        else:
+            net.set_link(a, b, rng.choice([0, rng.uniform(0, 100)]))
+        assert net.verify()
+
+
+def test_reference_matrix_of_a_chain():
+    links = {(0, 1): (4.0, 0.0), (1, 2): (2.0, 0.0)}
+    M = reference_bottleneck_matrix(3, links)
+    assert M[0, 2] == 2.0 and M[0, 1] == 4.0 and np.isinf(M[1, 1])
@@ -0,0 +1,18 @@
+import pytest
+
+from otp_stream import KeyReuseError, xor_stream
+
+
+def test_round_trip_and_key_is_wiped():
+    key = bytearray(range(10))
+    plain = [b"hello", b"world"]
+    cipher = list(xor_stream(plain, bytearray(key), chunk_size=3))
+    assert b"".join(xor_stream(cipher, bytearray(key))) == b"helloworld"
+    used = bytearray(key)
+    list(xor_stream(plain, used))
+    assert used == bytearray(10)
+
+
+def test_stream_longer_than_the_key_fails():
+    with pytest.raises(KeyReuseError):
+        list(xor_stream([b"abc", b"def"], bytearray(4)))
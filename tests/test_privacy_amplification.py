@@ -0,0 +1,17 @@
+from privacy_amplification import privacy_amplify, secret_key_length, toeplitz_privacy_amplification
+
+
+def test_length_subtracts_qber_margin_and_leakage():
+    assert secret_key_length(1000, 0.02, 100) == int(1000 * 0.88) - 100
+    assert secret_key_length(1000) == 750
+
+
+def test_no_key_when_leakage_uses_up_the_input():
+    assert secret_key_length(10, 0.0, 62) == 0
+    assert privacy_amplify("1011001110", qber=0.0, leaked_bits=62) == ""
+    assert toeplitz_privacy_amplification("", qber=0.0) == ""
+
+
+def test_hex_output_covers_the_key_length():
+    key = privacy_amplify("10" * 50, qber=0.05, leaked_bits=10)
+    assert len(key) * 4 >= secret_key_length(100, 0.05, 10) > len(key) * 4 - 8
@@ -0,0 +1,44 @@
+import numpy as np
+
+from qrng_health import HealthTests, ToeplitzExtractor
+
+
+def test_uniform_bits_pass():
+    health = HealthTests(min_entropy=0.8)
+    bits = np.random.default_rng(0).integers(0, 2, 100_000)
+    for chunk in np.array_split(bits, 7):
+        health.update(chunk)
+    assert health.healthy
+    assert health.stats()["samples"] == 100_000
+
+
+def test_stuck_bits_fail_the_repetition_count_once():
+    health = HealthTests(min_entropy=0.8)
+    bits = np.concatenate([np.random.default_rng(1).integers(0, 2, 500), np.ones(200, dtype=np.uint8)])
+    # The run spans both chunks and is reported once
+    health.update(bits[:600])
+    health.update(bits[600:])
+    stats = health.stats()
+    assert not health.healthy
+    assert stats["repetition_count"]["failures"] == 1
+
+
+def test_biased_bits_fail_the_adaptive_proportion_test():
+    health = HealthTests(min_entropy=0.8)
+    rng = np.random.default_rng(2)
+    health.update((rng.random(8192) < 0.9).astype(np.uint8) | (np.arange(8192) % 7 == 0))
+    assert health.stats()["adaptive_proportion"]["failures"] > 0
+
+
+def test_extractor_matches_the_toeplitz_product():
+    ext = ToeplitzExtractor(block_bits=256, min_entropy=0.8, security_bits=16, seed=5)
+    raw = np.random.default_rng(6).integers(0, 2, 3 * 256 + 17, dtype=np.uint8)
+    out = ext.extract(raw)
+    assert len(out) == 3 * ext.output_bits
+    seed = np.random.default_rng(5).integers(0, 2, 256 + ext.output_bits - 1)
+    n = ext.block_bits
+    T = np.array([[seed[n - 1 + i - j] for j in range(n)] for i in range(ext.output_bits)])
+    for block in range(3):
+        x = raw[block * n:(block + 1) * n]
+        assert np.array_equal(out[block * ext.output_bits:(block + 1) * ext.output_bits], T @ x % 2)
+    assert ext.raw_bits_for(ext.output_bits + 1) == 2 * n
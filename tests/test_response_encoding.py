@@ -0,0 +1,27 @@
+from response_encoding import options_from_args, pack_bits, shape_result, top_counts, unpack_bits
+
+import pytest
+
+
+@pytest.mark.parametrize("bits", [[], [1], [0, 1, 1, 0, 1, 0, 0, 1, 1], [1, None, 0, None, 1]])
+def test_pack_round_trip(bits):
+    packed = pack_bits(bits)
+    assert ("mask" in packed) == (None in bits)
+    assert unpack_bits(packed) == bits
+
+
+def test_shape_result_does_not_modify_its_input():
+    result = {"Sender_bits": [1, 0, 1], "counts": {"00": 3, "01": 1, "11": 2}, "qber": 1.0}
+    shaped = shape_result(result, fields=["Sender_bits", "counts"], bits="packed", counts_top=1)
+    assert set(shaped) == {"Sender_bits", "counts"}
+    assert unpack_bits(shaped["Sender_bits"]) == [1, 0, 1]
+    assert shaped["counts"] == top_counts(result["counts"], 1)
+    assert result["Sender_bits"] == [1, 0, 1]
+
+
+def test_options_reject_unknown_values():
+    with pytest.raises(ValueError):
+        options_from_args({"bits": "hex"})
+    with pytest.raises(ValueError):
+        options_from_args({"counts_top": "0"})
+    assert options_from_args({"fields": "a, b,"})["fields"] == ["a", "b"]
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from sifting import sift, wilson_interval
+
+
+def test_sift_keeps_matching_bases_and_counts_errors():
+    out = sift([0, 1, 1, 0], [0, 0, 1, 1], [0, 0, 1, 1], [0, 0, 1, 0])
+    assert out["alice"].tolist() == [0, 1, 1]
+    assert out["bob"].tolist() == [0, 0, 1]
+    assert (out["sifted"], out["errors"]) == (3, 1)
+    assert out["qber"] == pytest.approx(1 / 3)
+    assert out["qber_low"] <= out["qber"] <= out["qber_high"]
+
+
+def test_received_and_flips_masks():
+    out = sift([1, 1, 1], [0, 0, 0], [1, 1, 1], [0, 0, 0], received=[True, False, True],
+               flips=[False, False, True])
+    assert out["sifted"] == 2 and out["errors"] == 1
+
+
+def test_batched_rows_match_single_runs():
+    rng = np.random.default_rng(3)
+    a, ab, b, bb = (rng.integers(0, 2, (5, 40)) for _ in range(4))
+    batch = sift(a, ab, b, bb)
+    for row in range(5):
+        single = sift(a[row], ab[row], b[row], bb[row])
+        assert batch["alice"][row].tolist() == single["alice"].tolist()
+        assert batch["errors"][row] == single["errors"]
+        assert batch["qber_high"][row] == pytest.approx(single["qber_high"])
+
+
+def test_wilson_interval_edges():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    low, high = wilson_interval(0, 100)
+    assert low == 0 and 0 < high < 0.05
+    low, high = wilson_interval(10, 100)
+    assert low < 0.1 < high